@@ -0,0 +1,146 @@
+"""
+Checks the /watch price alerts against a local fake FMP server:
+one poll requests the union of the watched tickers in quote batches whatever the number of chats,
+an alert is sent only when a price moves to another zone (and to every chat watching it),
+tickers without a positive intrinsic value or over the chat's cap aren't watched, the watches and
+their zones survive a restart, tickers without a price are left alone, and one check of a large
+table runs in a single array pass.
+
+Usage: python benchmarks/alerts_check.py [--chats 200] [--tickers 120] [--rows 100000]
+"""
+import os
+import sys
+import math
+import time
+import asyncio
+import argparse
+import tempfile
+
+from fake_fmp_server import FakeFMPServer, canned_quote, check, use_fake_server
+
+
+def watched_record(ticker, intrinsic_ratio=1.0):
+    """A valued record whose intrinsic value is the fake server's price times intrinsic_ratio."""
+    from schema import FinancialRecord
+
+    price = canned_quote(ticker)["price"]
+    return FinancialRecord(company=ticker, price=price, intrinsic_final=price * intrinsic_ratio)
+
+
+async def polls_are_shared(server, chats, tickers):
+    from alerts import AlertWatcher
+    from fetch_fmp import QUOTE_BATCH_SIZE
+
+    sent = []
+
+    async def notify(chat_id, text):
+        sent.append((chat_id, text))
+
+    symbols = [f"T{i:03d}" for i in range(tickers)]
+    watcher = AlertWatcher(notify, path=None)
+    # Every chat watches a different half of the tickers
+    for chat_id in range(chats):
+        start = chat_id % tickers
+        watcher.watch(chat_id, [watched_record(symbol) for symbol in (symbols * 2)[start:start + tickers // 2]])
+
+    server.requests_by_target.clear()
+    await watcher.poll()
+    batches = sum(count for (endpoint, _), count in server.requests_by_target.items() if endpoint == "batch-quote-short")
+    expected = math.ceil(tickers / QUOTE_BATCH_SIZE)
+    passed = check(batches == expected, f"{chats} chats x {tickers // 2} tickers ({len(watcher.table)} alerts) "
+                                        f"-> {batches} quote requests per poll (ceil({tickers}/{QUOTE_BATCH_SIZE}))")
+    return check(not sent, "no alert while prices stay in their zone") and passed
+
+
+async def alerts_on_crossing(server):
+    from alerts import AlertWatcher
+
+    sent = []
+
+    async def notify(chat_id, text):
+        sent.append((chat_id, text))
+
+    path = os.path.join(tempfile.mkdtemp(prefix="bot_alerts_"), "alerts.sqlite")
+    watcher = AlertWatcher(notify, max_per_chat=2, path=path)
+    # Priced 5% under the intrinsic value: between the Underpriced band and the intrinsic value
+    for chat_id in (1, 2):
+        watcher.watch(chat_id, [watched_record("AAPL", 1.05), watched_record("MSFT", 1.05)])
+    watched, no_value, over_cap = watcher.watch(3, [watched_record("NOVAL", math.nan), watched_record("NEG", -0.5)])
+    passed = check(not watched and no_value == ["NOVAL", "NEG"] and not over_cap,
+                   "a ticker without a positive intrinsic value is not watched")
+    watched, no_value, over_cap = watcher.watch(1, [watched_record("MSFT", 1.05), watched_record("NVDA")])
+    passed = check([record.company for record in watched] == ["MSFT"] and over_cap == ["NVDA"] and not no_value,
+                   "past the chat's cap only the tickers it already watches are updated") and passed
+
+    server.price_factors.update({"AAPL": 1.07})
+    await watcher.poll()
+    passed = check(sorted(chat for chat, _ in sent) == [1, 2] and all("AAPL" in text for _, text in sent),
+                   f"crossing the intrinsic value alerts both chats: {[text.splitlines()[0] for _, text in sent]}") and passed
+
+    # A restart: a new watcher on the same file has every watch in the zone it was last seen in
+    watcher.close()
+    watcher = AlertWatcher(notify, path=path)
+    passed = check(len(watcher.table) == 4 and sorted(ticker for ticker, _ in watcher.table.for_chat(1)) == ["AAPL", "MSFT"],
+                   f"the {len(watcher.table)} watches are restored after a restart") and passed
+
+    sent.clear()
+    server.price_factors.update({"AAPL": 1.1})
+    await watcher.poll()
+    passed = check(not sent, "no second alert while the price stays in the new zone, restart included") and passed
+
+    watcher.unwatch(2)
+    server.price_factors.update({"AAPL": 0.8})
+    await watcher.poll()
+    passed = check([chat for chat, _ in sent] == [1] and "below the Underpriced band" in sent[0][1],
+                   "falling under the Underpriced band alerts the chat still watching") and passed
+    watcher.close()
+    return check(len(AlertWatcher(notify, path=path).table) == 2, "an /unwatch is kept after a restart too") and passed
+
+
+def missing_prices_are_ignored():
+    from alerts import AlertTable
+
+    table = AlertTable()
+    table.add(1, ["AAPL", "MSFT"], [100.0, 100.0], [95.0, 95.0])
+    alerts = table.check({"MSFT": 80.0})
+    return check([ticker for _, ticker, *_ in alerts] == ["MSFT"], "a ticker missing from the quotes keeps its zone")
+
+
+def large_table_check(rows):
+    import numpy as np
+    from alerts import AlertTable
+
+    rng = np.random.default_rng(0)
+    symbols = [f"T{i:04d}" for i in range(2000)]
+    table = AlertTable()
+    for chat_id in range(rows // 50):
+        picked = rng.choice(len(symbols), 50, replace=False)
+        finals = rng.uniform(50, 150, 50)
+        table.add(chat_id, [symbols[i] for i in picked], finals, finals)
+    prices = {symbol: float(price) for symbol, price in zip(symbols, rng.uniform(40, 160, len(symbols)))}
+
+    start = time.perf_counter()
+    alerts = table.check(prices)
+    elapsed = time.perf_counter() - start
+    return check(elapsed < 0.5, f"{len(table)} alerts on {len(table.unique_tickers)} tickers checked in "
+                                f"{elapsed * 1000:.1f} ms ({len(alerts)} zone changes)")
+
+
+async def main(chats, tickers, rows):
+    # Every poll must reach the fake server, not the response cache (use_fake_server turns it off)
+    async with use_fake_server(FakeFMPServer()) as server:
+        passed = await polls_are_shared(server, chats, tickers)
+        passed = await alerts_on_crossing(server) and passed
+        passed = missing_prices_are_ignored() and passed
+        passed = large_table_check(rows) and passed
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--tickers", type=int, default=120, help="Distinct tickers watched across the chats")
+    parser.add_argument("--rows", type=int, default=100000, help="Alerts in the table of the speed check")
+    args = parser.parse_args()
+
+    sys.exit(0 if asyncio.run(main(args.chats, args.tickers, args.rows)) else 1)
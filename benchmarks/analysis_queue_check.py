@@ -0,0 +1,203 @@
+"""
+Checks the bot's analysis queue with a stubbed fetch (no network):
+a small request isn't stuck behind a big one from another chat, no chat goes over its concurrency cap
+(requests riding along with another chat's fetch included), tickers over the per-chat cap are refused,
+results arrive as each ticker finishes, a slow reply doesn't hold a worker, a ticker queued by several
+chats is fetched once, and a request waiting behind other chats is told so.
+Then, against a local fake FMP server with the cache off, a request's quotes cost one batch request.
+
+Usage: python benchmarks/analysis_queue_check.py
+"""
+import sys
+import time
+import asyncio
+from collections import Counter
+
+from fake_fmp_server import FakeFMPServer, check, use_fake_server
+
+
+class StubFetch:
+    """Answers every ticker after `latency` seconds (per ticker if a dict), recording concurrency per chat prefix."""
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.calls = Counter()
+        self.in_flight = Counter()
+        self.peak = Counter()
+
+    async def __call__(self, ticker):
+        chat = ticker.split("-")[0]
+        self.calls[ticker] += 1
+        self.in_flight[chat] += 1
+        self.peak[chat] = max(self.peak[chat], self.in_flight[chat])
+        try:
+            await asyncio.sleep(self.latency.get(ticker, 0.01) if isinstance(self.latency, dict) else self.latency)
+        finally:
+            self.in_flight[chat] -= 1
+        return {"Company": ticker, "PRICE": 100.0}
+
+
+async def timed_job(job):
+    await job.wait()
+    return time.perf_counter()
+
+
+async def small_request_is_not_starved():
+    from analysis_queue import AnalysisQueue
+
+    fetch = StubFetch(latency=0.05)
+    queue = AnalysisQueue(workers=2, chat_concurrency=2, max_tickers_per_chat=100, fetch=fetch, prefetch_quotes=None)
+    queue.start()
+    try:
+        start = time.perf_counter()
+        big, _, _ = await queue.submit("A", [f"A-{i}" for i in range(20)])
+        small, _, ahead = await queue.submit("B", ["B-1", "B-2"])
+        big_done, small_done = await asyncio.gather(timed_job(big), timed_job(small))
+    finally:
+        await queue.close()
+
+    passed = check(ahead == 1, f"the second chat is told it's queued behind {ahead} chat")
+    passed = check(small_done - start < 0.25, f"2 tickers answered in {small_done - start:.2f}s "
+                                              f"behind 20 from another chat ({big_done - start:.2f}s)") and passed
+    return check(max(fetch.peak.values()) <= 2, f"no chat over its concurrency cap: {dict(fetch.peak)}") and passed
+
+
+async def caps_tickers_per_chat():
+    from analysis_queue import AnalysisQueue
+
+    queue = AnalysisQueue(workers=2, chat_concurrency=2, max_tickers_per_chat=5, fetch=StubFetch(), prefetch_quotes=None)
+    queue.start()
+    try:
+        first, refused, _ = await queue.submit("A", [f"A-{i}" for i in range(4)])
+        second, refused_again, _ = await queue.submit("A", ["A-8", "A-9"])
+        results = await second.wait()
+        await first.wait()
+    finally:
+        await queue.close()
+
+    passed = check(not refused and refused_again == ["A-9"], f"tickers over the cap of 5 are refused: {refused_again}")
+    return check(len(results) == 1 and results[0]["Company"] == "A-8", "the rest of the request is analyzed") and passed
+
+
+async def results_arrive_progressively():
+    from analysis_queue import AnalysisQueue
+
+    fetch = StubFetch(latency={"A-SLOW": 0.5})
+    queue = AnalysisQueue(workers=4, chat_concurrency=4, max_tickers_per_chat=10, fetch=fetch, prefetch_quotes=None)
+    queue.start()
+    arrivals = {}
+
+    async def on_result(ticker, data):
+        arrivals[ticker] = time.perf_counter()
+
+    try:
+        start = time.perf_counter()
+        job, _, _ = await queue.submit("A", ["A-SLOW", "A-1", "A-2"], on_result)
+        results = await job.wait()
+        done = time.perf_counter()
+    finally:
+        await queue.close()
+
+    fast = max(arrivals["A-1"], arrivals["A-2"]) - start
+    passed = check(fast < 0.1, f"fast tickers delivered after {fast:.2f}s, not after the slow one ({done - start:.2f}s)")
+    return check([data["Company"] for data in results] == ["A-SLOW", "A-1", "A-2"], "results keep the request order") and passed
+
+
+async def shared_tickers_fetched_once():
+    from analysis_queue import AnalysisQueue
+
+    fetch = StubFetch(latency=0.05)
+    queue = AnalysisQueue(workers=2, chat_concurrency=2, max_tickers_per_chat=10, fetch=fetch, prefetch_quotes=None)
+    queue.start()
+    try:
+        jobs = [(await queue.submit(chat, ["AAPL", "MSFT", "GOOGL"]))[0] for chat in range(10)]
+        results = await asyncio.gather(*(job.wait() for job in jobs))
+    finally:
+        await queue.close()
+
+    passed = check(all(all(result) for result in results), "every chat got every ticker")
+    return check(set(fetch.calls.values()) == {1}, f"each ticker fetched once for 10 chats: {dict(fetch.calls)}") and passed
+
+
+async def ride_along_counts_against_the_cap():
+    from analysis_queue import AnalysisQueue
+
+    peak = Counter()
+    queue = None
+
+    async def fetch(ticker):
+        for chat, count in queue._in_flight.items():
+            peak[chat] = max(peak[chat], count)
+        await asyncio.sleep(0.05)
+        return {"Company": ticker, "PRICE": 100.0}
+
+    queue = AnalysisQueue(workers=4, chat_concurrency=1, max_tickers_per_chat=10, fetch=fetch, prefetch_quotes=None)
+    try:
+        # Chat B asks for X in two requests while chat A fetches it: only one of them may ride along
+        jobs = [(await queue.submit(chat, ["X"]))[0] for chat in ("A", "B", "B")]
+        queue.start()
+        results = await asyncio.gather(*(job.wait() for job in jobs))
+    finally:
+        await queue.close()
+
+    passed = check(all(result == [{"Company": "X", "PRICE": 100.0}] for result in results), "every request got X")
+    return check(max(peak.values()) <= 1, f"riding along takes a slot of the chat's cap of 1: peak {dict(peak)}") and passed
+
+
+async def slow_replies_free_the_worker():
+    from analysis_queue import AnalysisQueue
+
+    fetch = StubFetch(latency=0.01)
+    queue = AnalysisQueue(workers=1, chat_concurrency=4, max_tickers_per_chat=10, fetch=fetch, prefetch_quotes=None)
+    queue.start()
+    fetched = {}
+
+    async def on_result(ticker, data):
+        fetched.setdefault(ticker, time.perf_counter())
+        await asyncio.sleep(0.3)  # like a slow Telegram reply
+
+    try:
+        start = time.perf_counter()
+        job, _, _ = await queue.submit("A", [f"A-{i}" for i in range(4)], on_result)
+        results = await job.wait()
+        done = time.perf_counter() - start
+    finally:
+        await queue.close()
+
+    last_fetch = max(fetched.values()) - start
+    passed = check(last_fetch < 0.2, f"1 worker fetched 4 tickers in {last_fetch:.2f}s while 0.3s replies were sent")
+    return check(all(results) and done < 0.5, f"the job ends once every reply is out ({done:.2f}s)") and passed
+
+
+async def quotes_are_batched(server):
+    from analysis_queue import AnalysisQueue
+
+    tickers = [f"Q{i:02d}" for i in range(20)]
+    queue = AnalysisQueue(workers=8, chat_concurrency=8, max_tickers_per_chat=len(tickers))
+    queue.start()
+    server.requests_by_target.clear()
+    try:
+        job, _, _ = await queue.submit("A", tickers)
+        results = await job.wait()
+    finally:
+        await queue.close()
+
+    quote_requests = sum(count for (endpoint, _), count in server.requests_by_target.items() if endpoint == "batch-quote-short")
+    passed = check(all(results), f"{len(tickers)} tickers analyzed through the real pipeline with the cache off")
+    return check(quote_requests == 1, f"their quotes took {quote_requests} batch request(s), not one per ticker") and passed
+
+
+async def main():
+    async with use_fake_server(FakeFMPServer(latency=0.01)) as server:
+        passed = await small_request_is_not_starved()
+        passed = await caps_tickers_per_chat() and passed
+        passed = await results_arrive_progressively() and passed
+        passed = await shared_tickers_fetched_once() and passed
+        passed = await ride_along_counts_against_the_cap() and passed
+        passed = await slow_replies_free_the_worker() and passed
+        passed = await quotes_are_batched(server) and passed
+    return passed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
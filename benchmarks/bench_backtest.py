@@ -0,0 +1,64 @@
+"""
+Times the vectorized backtest on a synthetic ratio history (default 500 tickers x 10 fiscal years),
+written to a temporary history store so nothing touches data/.
+
+Usage: python benchmarks/bench_backtest.py [--tickers 500] [--years 10]
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from history_store import RatioHistoryStore
+from backtest import run_backtest, print_stats
+
+
+def synthetic_history(store, tickers, years, seed=0):
+    """Random-walk fundamentals and multiples for every ticker, most recent year first like FMP."""
+    rng = np.random.default_rng(seed)
+    last_year = 2024
+    for ticker in tickers:
+        revenue = 20 * np.exp(np.cumsum(rng.normal(0.05, 0.1, years)))
+        book = 30 * np.exp(np.cumsum(rng.normal(0.04, 0.08, years)))
+        income = revenue * rng.uniform(0.05, 0.25, years)
+        ps = np.exp(rng.normal(1.0, 0.4, years))
+        records = [
+            {
+                "fiscalYear": str(last_year - years + 1 + i),
+                "priceSalesRatio": ps[i],
+                "priceToBookRatio": ps[i] * revenue[i] / book[i],
+                "priceEarningsRatio": ps[i] * revenue[i] / income[i],
+                "priceCashFlowRatio": ps[i] * rng.uniform(3, 6),
+                "revenuePerShare": revenue[i],
+                "bookValuePerShare": book[i],
+                "netIncomePerShare": income[i],
+            }
+            for i in range(years)
+        ]
+        store.append(ticker, records[::-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tickers", type=int, default=500)
+    parser.add_argument("--years", type=int, default=10)
+    args = parser.parse_args()
+
+    tickers = [f"T{i:05d}" for i in range(args.tickers)]
+    with tempfile.TemporaryDirectory(prefix="fmp_history_") as root:
+        store = RatioHistoryStore(root)
+        start = time.perf_counter()
+        synthetic_history(store, tickers, args.years)
+        print(f"Wrote synthetic history in {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        stats, details = run_backtest(tickers, store=store)
+        elapsed = time.perf_counter() - start
+
+    print_stats(stats, 1)
+    print(f"Backtest of {args.tickers} tickers x {args.years} years: {elapsed:.3f}s")
@@ -0,0 +1,253 @@
+"""
+Offline throughput benchmark of the fetch pipeline against a local fake FMP server.
+
+Drives three paths at every ticker count x concurrency level:
+  single    get_complete_financials, one call per ticker from `concurrency` threads
+  pipeline  the CLI itself, main.main with --workers `concurrency` (batch fetch, store + CSV)
+  bot       the bot's /analize handler, `concurrency` chats at the same time, each with its own tickers
+            (chats asking for the same tickers would share their fetches in the analysis queue)
+
+and reports tickers/sec, p50/p99 latency, failed tickers and peak memory as JSON, so runs of
+different versions can be compared. Nothing touches real FMP quota or the data/ folder.
+
+Usage: python benchmarks/bench_pipeline.py --tickers 10,50 --concurrency 1,8 --latency 0.05 --output bench.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import platform
+import argparse
+import tempfile
+import resource
+import subprocess
+import tracemalloc
+import contextlib
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from fake_fmp_server import FakeFMPServer
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SCENARIOS = ("single", "pipeline", "bot")
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def peak_rss_mb():
+    """Process high-water mark of resident memory (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def ticker_universe(count):
+    return [f"T{i:04d}" for i in range(count)]
+
+
+class FakeMessage:
+    async def reply_text(self, text, **kwargs):
+        pass
+
+    async def reply_markdown(self, text, **kwargs):
+        pass
+
+    async def reply_document(self, document, **kwargs):
+        pass
+
+
+def run_single(tickers, concurrency, runs):
+    """Latency of each get_complete_financials call, `concurrency` calls in flight."""
+    from process_data import get_complete_financials
+
+    def timed_call(ticker):
+        start = time.perf_counter()
+        data = get_complete_financials(ticker)
+        return time.perf_counter() - start, data is None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed_call, tickers * runs))
+    return [latency for latency, _ in outcomes], sum(failed for _, failed in outcomes)
+
+
+def skipped_tickers():
+    """Tickers the fetch layer skipped so far in this process (the tickers_skipped_total metric)."""
+    from metrics import TICKERS_SKIPPED
+
+    return sum(TICKERS_SKIPPED._values.values())
+
+
+def run_pipeline(tickers, concurrency, runs):
+    """Latency of each full main.py run: batch fetch, valuation, results store and CSV."""
+    import main
+
+    latencies = []
+    skipped = skipped_tickers()
+    for _ in range(runs):
+        start = time.perf_counter()
+        with contextlib.redirect_stderr(io.StringIO()):
+            main.main(["--workers", str(concurrency), "--output", "bench.csv", ",".join(tickers)])
+        latencies.append(time.perf_counter() - start)
+    return latencies, skipped_tickers() - skipped
+
+
+def run_bot(tickers, concurrency, runs):
+    """Latency of each /analize request, `concurrency` chats asking for as many (different) tickers at once."""
+    from bot import analize
+    from fetch_fmp import close_shared_client
+
+    async def chat(chat_id):
+        update = SimpleNamespace(message=FakeMessage(), effective_chat=SimpleNamespace(id=chat_id))
+        context = SimpleNamespace(args=[",".join(f"C{chat_id}{ticker}" for ticker in tickers)])
+        start = time.perf_counter()
+        await analize(update, context)
+        return time.perf_counter() - start
+
+    async def main():
+        try:
+            latencies = []
+            for _ in range(runs):
+                latencies.extend(await asyncio.gather(*(chat(chat_id) for chat_id in range(concurrency))))
+            return latencies
+        finally:
+            await close_analysis_queue()
+            await close_shared_client()
+
+    from analysis_queue import close_analysis_queue
+
+    skipped = skipped_tickers()
+    latencies = asyncio.run(main())
+    return latencies, skipped_tickers() - skipped
+
+
+def run_scenario(name, tickers, concurrency, runs, trace_memory):
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    # The pipeline prints progress for every ticker; keep the benchmark output clean
+    with contextlib.redirect_stdout(io.StringIO()):
+        if name == "single":
+            latencies, failed = run_single(tickers, concurrency, runs)
+            processed = len(tickers) * runs
+        elif name == "pipeline":
+            latencies, failed = run_pipeline(tickers, concurrency, runs)
+            processed = len(tickers) * runs
+        else:
+            # Every chat has its own tickers, so each one is really fetched
+            latencies, failed = run_bot(tickers, concurrency, runs)
+            processed = len(tickers) * runs * concurrency
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "scenario": name,
+        "tickers": len(tickers),
+        "concurrency": concurrency,
+        "runs": runs,
+        "wall_s": round(elapsed, 4),
+        "tickers_per_sec": round(processed / elapsed, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 2),
+        "failed_tickers": failed,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if trace_memory:
+        result["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+        tracemalloc.stop()
+    return result
+
+
+def main(args):
+    server = FakeFMPServer(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+    )
+    workdir = tempfile.mkdtemp(prefix="fmp_bench_")
+    os.makedirs(os.path.join(workdir, "data"))
+    os.makedirs(os.path.join(workdir, "run"))
+
+    # Point everything at the fake server and throwaway files before the modules are imported
+    os.environ["FMP_BASE_URL"] = server.start()
+    os.environ["FMP_API_KEY"] = "benchmark"
+    os.environ["FMP_CACHE"] = "off"
+    # The fake server has no rate limit to respect (set FMP_PLAN to measure a real plan's pacing)
+    os.environ.setdefault("FMP_PLAN", "unlimited")
+    # Only the fake FMP server is measured, never the real Yahoo Finance
+    os.environ.setdefault("YAHOO_FALLBACK", "off")
+    # Measure every requested ticker, not just the bot's per-chat cap
+    os.environ.setdefault("BOT_MAX_TICKERS_PER_CHAT", "100000")
+    os.environ["FMP_CACHE_PATH"] = os.path.join(workdir, "data", "fmp_cache.sqlite")
+    os.environ["FMP_HISTORY_DIR"] = os.path.join(workdir, "data", "history")
+    os.environ["FMP_RESULTS_PATH"] = os.path.join(workdir, "data", "results.sqlite")
+    sys.path.insert(0, os.path.join(REPO_DIR, "src"))
+    # main.py writes its CSV (and export_data its default one to ../data) relative to the working directory
+    os.chdir(os.path.join(workdir, "run"))
+
+    logging.disable(logging.WARNING)
+
+    results = []
+    try:
+        for name in args.scenarios.split(","):
+            for count in [int(value) for value in args.tickers.split(",")]:
+                for concurrency in [int(value) for value in args.concurrency.split(",")]:
+                    result = run_scenario(name, ticker_universe(count), concurrency, args.runs, args.trace_memory)
+                    results.append(result)
+                    print(
+                        f"{name:<9} tickers={count:<5} concurrency={concurrency:<3} "
+                        f"{result['tickers_per_sec']:>9.1f} tickers/s  p50={result['p50_ms']:.0f}ms "
+                        f"p99={result['p99_ms']:.0f}ms  failed={result['failed_tickers']}",
+                        file=sys.stderr,
+                    )
+    finally:
+        server.stop()
+
+    return {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "server": {
+            "latency_s": args.latency,
+            "jitter_s": args.jitter,
+            "error_rate": args.error_rate,
+            "throttle_rate": args.throttle_rate,
+            "retry_after_s": args.retry_after,
+            "requests": server.counts,
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--tickers", default="10,50", help="Comma-separated ticker counts")
+    parser.add_argument("--concurrency", default="1,8", help="Comma-separated concurrency levels")
+    parser.add_argument("--runs", type=int, default=3, help="Repetitions of each case")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake FMP latency per request, in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--trace-memory", action="store_true", help="Also report peak Python allocations (slower)")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = main(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
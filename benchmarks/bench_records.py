@@ -0,0 +1,89 @@
+"""
+Compares the memory of per-ticker data held as FinancialRecords (schema.py) with the dicts keyed by
+display labels the pipeline used before, for the same synthetic tickers: the records themselves, and
+the peak while building the CSV summary frame from them (dicts -> DataFrame -> transpose before).
+
+Usage: python benchmarks/bench_records.py [--tickers 10000]
+"""
+import os
+import sys
+import random
+import argparse
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from schema import FinancialRecord, LABELS, METRIC_FIELDS, is_missing
+from valuation import value_records
+from export_data import build_summary_frame
+
+
+def synthetic_records(count, seed=0):
+    """Valued FinancialRecords with every metric filled in, ~5% of them missing."""
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        values = {name: round(rng.uniform(0.5, 500), 3) for name in METRIC_FIELDS if rng.random() >= 0.05}
+        records.append(FinancialRecord(company=f"T{i:05d}", **values))
+    return value_records(records)
+
+
+def as_label_dicts(records):
+    """The same data as the label-keyed dicts parse_fmp_ratios used to return (None for missing values)."""
+    return [
+        {LABELS["company"]: record.company, **{LABELS[name]: None for name in METRIC_FIELDS}, **record.to_labels()}
+        for record in records
+    ]
+
+
+def legacy_summary_frame(data):
+    """The CSV frame as it was built from the dicts, for comparison."""
+    df = pd.DataFrame(data).set_index("Company").T
+    numeric = df.apply(pd.to_numeric, errors="coerce")
+    df["AVERAGE"] = numeric.mean(axis=1)
+    return df.round(3)
+
+
+def traced(build):
+    """(result, bytes still allocated by build, peak bytes while it ran)."""
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak
+
+
+def mb(size):
+    return size / 1024 / 1024
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tickers", type=int, default=10000)
+    args = parser.parse_args()
+
+    source = synthetic_records(args.tickers)
+    # Copies made under tracemalloc, so only the representation being measured is counted
+    # (missing values stay the shared NaN, as to_float returns them)
+    records, records_size, _ = traced(lambda: [
+        FinancialRecord(company=record.company, recommendation=record.recommendation,
+                        **{name: getattr(record, name) + 0.0 for name in METRIC_FIELDS
+                           if not is_missing(getattr(record, name))})
+        for record in source
+    ])
+    dicts, dicts_size, _ = traced(lambda: [
+        {key: value + 0.0 if isinstance(value, float) else value for key, value in row.items()}
+        for row in as_label_dicts(source)
+    ])
+    _, _, records_frame_peak = traced(lambda: build_summary_frame(records))
+    _, _, dicts_frame_peak = traced(lambda: legacy_summary_frame(dicts))
+
+    print(f"{args.tickers} tickers, {len(METRIC_FIELDS)} metrics each")
+    print(f"{'':<18} {'records (MB)':>13} {'bytes/ticker':>13} {'CSV frame peak (MB)':>20}")
+    print(f"{'label dicts':<18} {mb(dicts_size):>13.2f} {dicts_size / args.tickers:>13.0f} {mb(dicts_frame_peak):>20.2f}")
+    print(f"{'FinancialRecord':<18} {mb(records_size):>13.2f} {records_size / args.tickers:>13.0f} "
+          f"{mb(records_frame_peak):>20.2f}")
+    print(f"records use {dicts_size / records_size:.1f}x less memory, "
+          f"the CSV frame peak is {dicts_frame_peak / records_frame_peak:.1f}x lower")
@@ -0,0 +1,132 @@
+"""
+Times the Monte Carlo scenarios (scenarios.py) on synthetic valued tickers and compares them with a
+loop over the draws that values each one with the usual per-ticker formulas. Also checks that the
+scenarios without any randomness give back value_records' final intrinsic value and recommendation,
+that the percentile bands match np.nanpercentile, and that simulating the tickers in slices gives the
+same bands with a peak memory bounded by the slice instead of draws x tickers.
+
+Usage: python benchmarks/bench_scenarios.py [--tickers 100] [--draws 10000] [--loop-draws 500] [--chunk-cells 100000]
+"""
+import os
+import sys
+import copy
+import time
+import argparse
+import warnings
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from bench_records import synthetic_records
+from fake_fmp_server import check
+from scenarios import (
+    MULTIPLE_SPREAD,
+    nan_percentiles,
+    simulate_records,
+    simulate_summary,
+    simulate_valuation,
+    summarize_scenarios,
+)
+from valuation import PEER_MULTIPLES, PRICE_KEY, HISTORICAL_KEY, final_intrinsic, masked_mean, to_array, valid_mask
+
+
+def columns(records):
+    prices = to_array([getattr(row, PRICE_KEY) for row in records])
+    multiples = {key: to_array([getattr(row, key) for row in records]) for key in PEER_MULTIPLES}
+    historical = to_array([getattr(row, HISTORICAL_KEY) for row in records])
+    return prices, multiples, historical
+
+
+def loop_simulation(prices, multiples, historical, draws, seed=0):
+    """One valuation per draw (bootstrapped peers, shocked peer averages), the way a loop would do it."""
+    rng = np.random.default_rng(seed)
+    finals = np.empty((draws, len(prices)))
+    for draw in range(draws):
+        picks = rng.integers(0, len(prices), len(prices))
+        intrinsic_values = []
+        for key in PEER_MULTIPLES:
+            ratios = multiples[key]
+            peer_average = masked_mean(ratios[picks]) * np.exp(MULTIPLE_SPREAD * rng.standard_normal())
+            ok = valid_mask(ratios) & valid_mask(prices)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                intrinsic_values.append(np.where(ok, prices * peer_average / np.where(ok, ratios, 1.0), np.nan))
+        finals[draw] = final_intrinsic(masked_mean(np.vstack(intrinsic_values), axis=0), historical)
+    return finals
+
+
+def point_estimate_matches(records):
+    records = [copy.copy(row) for row in records]
+    simulate_records(records, draws=2, multiple_spread=0, historical_spread=0, resample_peers=False)
+    same_value = all(
+        abs(row.intrinsic_p50 - row.intrinsic_final) <= 0.002
+        or (np.isnan(row.intrinsic_final) and np.isnan(row.intrinsic_p50))
+        for row in records
+    )
+    expected = {"Underpriced": 1.0, "Overpriced": 0.0, "Fairly Priced": 0.0}
+    same_call = all(
+        np.isnan(row.prob_underpriced) if row.recommendation == "N/A"
+        else row.prob_underpriced == expected[row.recommendation]
+        for row in records
+    )
+    passed = check(same_value, "without randomness the median is value_records' final intrinsic value")
+    return check(same_call, "and the probability of Underpriced is 1 exactly where it recommends Underpriced") and passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tickers", type=int, default=100)
+    parser.add_argument("--draws", type=int, default=10000)
+    parser.add_argument("--loop-draws", type=int, default=500, help="Draws of the loop, extrapolated to --draws")
+    parser.add_argument("--chunk-cells", type=int, default=100000, help="Draw-ticker values per slice of the memory check")
+    args = parser.parse_args()
+
+    records = synthetic_records(args.tickers)
+    passed = point_estimate_matches(records)
+
+    prices, multiples, historical = columns(records)
+    final_draws = simulate_valuation(prices, multiples, historical, draws=args.draws, seed=0)
+    with warnings.catch_warnings():
+        # Tickers that can't be valued are all-NaN columns, which np.nanpercentile warns about
+        warnings.simplefilter("ignore", RuntimeWarning)
+        expected = np.nanpercentile(final_draws, [5, 50, 95], axis=0)
+    passed = check(np.allclose(nan_percentiles(final_draws, [5, 50, 95]), expected, equal_nan=True),
+                   "percentile bands match np.nanpercentile") and passed
+
+    # Same seed and slices: the bands kept slice by slice are those of the full array
+    chunked = simulate_summary(prices, multiples, historical, draws=args.draws, seed=0, chunk_cells=args.chunk_cells)
+    full = summarize_scenarios(
+        simulate_valuation(prices, multiples, historical, draws=args.draws, seed=0, chunk_cells=args.chunk_cells), prices
+    )
+    passed = check(all(np.allclose(chunked[key], full[key], equal_nan=True) for key in full),
+                   f"bands computed in slices of {args.chunk_cells} values match the full array") and passed
+
+    peaks = {}
+    for chunk_cells in (None, args.chunk_cells):
+        tracemalloc.start()
+        simulate_records(records, draws=args.draws, seed=0, chunk_cells=chunk_cells)
+        peaks[chunk_cells] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    passed = check(peaks[args.chunk_cells] < peaks[None] / 2,
+                   f"peak memory {peaks[None] / 1024 / 1024:.0f} MB at once, "
+                   f"{peaks[args.chunk_cells] / 1024 / 1024:.0f} MB in slices of {args.chunk_cells} values") and passed
+
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        simulate_records(records, draws=args.draws, seed=0)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    simulate_records(records, draws=args.draws, seed=0)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    loop_simulation(prices, multiples, historical, args.loop_draws)
+    loop_time = (time.perf_counter() - start) * args.draws / args.loop_draws
+
+    best = min(timings)
+    print(f"{args.tickers} tickers x {args.draws} draws: {best * 1000:.0f} ms, peak {peak / 1024 / 1024:.0f} MB "
+          f"(loop over draws: ~{loop_time * 1000:.0f} ms, {loop_time / best:.0f}x slower)")
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,166 @@
+"""
+Compares the vectorized valuation engine with the per-row loop /analize used before it.
+Both run on the same synthetic tickers (with some missing ratios); the script checks they agree
+and prints the time per call for each universe size. "arrays" is the engine alone on columnar
+input, "engine" includes converting the records to arrays and writing the results back.
+
+Usage: python benchmarks/bench_valuation.py [--sizes 100,1000,5000] [--repeat 5]
+"""
+import os
+import sys
+import copy
+import time
+import random
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from valuation import (
+    compute_valuation,
+    to_array,
+    value_records,
+    PEER_MULTIPLES,
+    PRICE_KEY,
+    HISTORICAL_KEY,
+    INDUSTRY_KEY,
+    FINAL_KEY,
+    RECOMMENDATION_KEY,
+)
+from schema import FinancialRecord, LABELS
+
+
+def synthetic_records(count, seed=0):
+    """Per-ticker dicts shaped like get_complete_financials output; ~5% of each ratio missing."""
+    rng = random.Random(seed)
+
+    def maybe(value):
+        return None if rng.random() < 0.05 else round(value, 3)
+
+    return [
+        {
+            "Company": f"T{i:05d}",
+            "PRICE": round(rng.uniform(5, 500), 3),
+            "PER (Current FMP)": maybe(rng.uniform(5, 60)),
+            "PS (Current FMP)": maybe(rng.uniform(0.5, 15)),
+            "PBV (Current FMP)": maybe(rng.uniform(0.5, 12)),
+            "Price to Cash Flow (PCF)": maybe(rng.uniform(3, 40)),
+            "Estimated Fair Price based on historical PS+PBV (5Y)": maybe(rng.uniform(5, 500)),
+        }
+        for i in range(count)
+    ]
+
+
+def legacy_loop_valuation(financial_data):
+    """The per-row implementation /analize had before the valuation engine (kept for comparison)."""
+    per_list = [r.get("PER (Current FMP)") for r in financial_data if isinstance(r.get("PER (Current FMP)"), (int, float))]
+    peer_avg_per = sum(per_list) / len(per_list) if per_list else None
+    for row in financial_data:
+        price = row.get("PRICE")
+        ticker_per = row.get("PER (Current FMP)")
+        if price and ticker_per and peer_avg_per:
+            row["Intrinsic Value based on Peer PER"] = round((price * peer_avg_per) / ticker_per, 3)
+
+    def safe_avg(lst):
+        return sum(lst) / len(lst) if lst else None
+
+    ps_list = [r.get("PS (Current FMP)") for r in financial_data if isinstance(r.get("PS (Current FMP)"), (int, float))]
+    pbv_list = [r.get("PBV (Current FMP)") for r in financial_data if isinstance(r.get("PBV (Current FMP)"), (int, float))]
+    pcf_list = [r.get("Price to Cash Flow (PCF)") for r in financial_data if isinstance(r.get("Price to Cash Flow (PCF)"), (int, float))]
+
+    avg_ps = safe_avg(ps_list)
+    avg_pbv = safe_avg(pbv_list)
+    avg_pcf = safe_avg(pcf_list)
+
+    for row in financial_data:
+        price = row.get("PRICE")
+
+        ps = row.get("PS (Current FMP)")
+        pbv = row.get("PBV (Current FMP)")
+        pcf = row.get("Price to Cash Flow (PCF)")
+
+        val_ps = (price * avg_ps) / ps if price and ps and avg_ps else None
+        val_pbv = (price * avg_pbv) / pbv if price and pbv and avg_pbv else None
+        val_pcf = (price * avg_pcf) / pcf if price and pcf and avg_pcf else None
+
+        if val_ps:
+            row["Intrinsic Value based on Peer PS"] = round(val_ps, 3)
+        if val_pbv:
+            row["Intrinsic Value based on Peer PBV"] = round(val_pbv, 3)
+        if val_pcf:
+            row["Intrinsic Value based on Peer PCF"] = round(val_pcf, 3)
+
+        values = [v for v in [val_ps, val_pbv, val_pcf, row.get("Intrinsic Value based on Peer PER")] if v]
+        industry_avg = safe_avg(values)
+        if industry_avg:
+            row["Intrinsic Value based on Industry Average"] = round(industry_avg, 3)
+
+        historical = row.get("Estimated Fair Price based on historical PS+PBV (5Y)")
+        if industry_avg and historical:
+            row["Final Intrinsic Value (Avg Industry + Historical)"] = round((industry_avg + historical) / 2, 3)
+
+        final_intrinsic = row.get("Final Intrinsic Value (Avg Industry + Historical)")
+        if price and final_intrinsic:
+            diff = (final_intrinsic - price) / price
+            if diff > 0.10:
+                row["RECOMMENDATION"] = "Underpriced"
+            elif diff < -0.10:
+                row["RECOMMENDATION"] = "Overpriced"
+            else:
+                row["RECOMMENDATION"] = "Fairly Priced"
+    return financial_data
+
+
+def as_records(records):
+    """The synthetic dicts as the FinancialRecords the engine takes."""
+    return [FinancialRecord.from_labels(row) for row in records]
+
+
+def check_agreement(legacy, engine):
+    """Every value the loop produced must match the engine (within rounding)."""
+    keys = [*PEER_MULTIPLES.values(), INDUSTRY_KEY, FINAL_KEY]
+    for old, new in zip(legacy, engine):
+        for key in keys:
+            if LABELS[key] in old:
+                value = getattr(new, key)
+                assert np.isclose(old[LABELS[key]], value, atol=2e-3), (old["Company"], key, old[LABELS[key]], value)
+        assert old.get(LABELS[RECOMMENDATION_KEY], "N/A") == new.recommendation, old["Company"]
+
+
+def best_time(function, records, repeat, copy_input=True):
+    timings = []
+    for _ in range(repeat):
+        rows = copy.deepcopy(records) if copy_input else records
+        start = time.perf_counter()
+        function(rows)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def columnar(records):
+    """The same records as the arrays compute_valuation takes."""
+    return (
+        to_array([getattr(row, PRICE_KEY) for row in records]),
+        {key: to_array([getattr(row, key) for row in records]) for key in PEER_MULTIPLES},
+        to_array([getattr(row, HISTORICAL_KEY) for row in records]),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000,5000,20000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'tickers':>8} {'loop (ms)':>10} {'engine (ms)':>12} {'arrays (ms)':>12} {'speedup':>8}")
+    for size in [int(size) for size in args.sizes.split(",")]:
+        records = synthetic_records(size)
+        check_agreement(legacy_loop_valuation(copy.deepcopy(records)), value_records(as_records(records)))
+
+        loop = best_time(legacy_loop_valuation, records, args.repeat)
+        engine = best_time(value_records, as_records(records), args.repeat)
+        arrays = best_time(
+            lambda columns: compute_valuation(*columns), columnar(as_records(records)), args.repeat, copy_input=False
+        )
+        print(f"{size:>8} {loop * 1000:>10.2f} {engine * 1000:>12.2f} {arrays * 1000:>12.2f} {loop / engine:>7.1f}x")
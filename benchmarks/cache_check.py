@@ -0,0 +1,106 @@
+"""
+Checks the FMP response cache (fmp_cache.py) on a throwaway SQLite file (no network):
+entries expire after their kind's TTL in both layers, the least recently used entries are evicted
+past the disk bound (disk hits count as uses even before their access time is written) without
+counting the table on every set, and hits on disk don't write to SQLite one by one.
+
+Usage: python benchmarks/cache_check.py [--entries 2000]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+from fake_fmp_server import SRC_DIR, check
+
+
+def temp_cache(**options):
+    from fmp_cache import ResponseCache
+
+    return ResponseCache(os.path.join(tempfile.mkdtemp(prefix="fmp_cache_"), "cache.sqlite"), **options)
+
+
+def entries_expire():
+    from fmp_cache import ResponseCache
+
+    cache = temp_cache(ttls={"quote": 0.2, "ratios": 60})
+    cache.set("quote", "AAPL", [{"price": 1.0}])
+    cache.set("ratios", "AAPL", [{"priceEarningsRatio": 20.0}])
+    passed = check(cache.get("quote", "AAPL") == [{"price": 1.0}], "a fresh quote is served from memory")
+
+    time.sleep(0.3)
+    passed = check(cache.get("quote", "AAPL") is None, "the quote is a miss once its TTL is over") and passed
+    passed = check(cache.get("ratios", "AAPL") is not None, "ratios with a longer TTL are still served") and passed
+
+    # Same file, new process: only the disk layer is left
+    reopened = ResponseCache(cache.path, ttls={"quote": 0.2, "ratios": 60})
+    passed = check(reopened.get("ratios", "AAPL") == [{"priceEarningsRatio": 20.0}]
+                   and reopened.get("quote", "AAPL") is None,
+                   "a new cache on the same file serves the fresh entry from disk and not the expired one") and passed
+
+    cache.set("quote", "AAPL", [{"price": 2.0}])
+    passed = check(cache.get("quote", "AAPL") == [{"price": 2.0}], "the refetched payload replaces the expired one") and passed
+    stats = cache.stats()
+    return check(stats["expired"] == 1, f"stats count the expired lookup: {stats}") and passed
+
+
+def lru_eviction():
+    cache = temp_cache(max_disk_entries=3, max_memory_entries=0)
+    for key in ("A", "B", "C"):
+        cache.set("quote", key, [key])
+    # A disk hit on A: its access time is only pending, but eviction must still see it
+    cache.get("quote", "A")
+    cache.set("quote", "D", ["D"])
+    kept = [key for key in "ABCD" if cache.get("quote", key) is not None]
+    passed = check(kept == ["A", "C", "D"], f"past 3 entries the least recently used one goes: kept {kept}")
+    return check(cache.stats()["evictions"] == 1, "one eviction counted") and passed
+
+
+def sets_dont_count_rows():
+    cache = temp_cache(max_disk_entries=3, max_memory_entries=0)
+    statements = []
+    cache._db.set_trace_callback(statements.append)
+    for key in ("A", "B", "A", "C"):
+        cache.set("quote", key, [key])
+    below = sum("COUNT(*)" in statement for statement in statements)
+    cache.set("quote", "D", ["D"])
+    cache._db.set_trace_callback(None)
+    passed = check(below == 0, f"sets under the bound don't count the table ({below} counts)")
+    return check(cache.stats()["disk_entries"] == 3 and cache._rows == 3,
+                 "a replaced key isn't counted twice and the set past the bound evicts") and passed
+
+
+def disk_hits_are_batched(entries):
+    from fmp_cache import ACCESS_FLUSH_BATCH
+
+    cache = temp_cache(max_memory_entries=0)
+    for i in range(entries):
+        cache.set("quote", f"T{i}", [{"price": float(i)}])
+    statements = []
+    cache._db.set_trace_callback(statements.append)
+
+    start = time.perf_counter()
+    hits = sum(cache.get("quote", f"T{i}") is not None for i in range(entries))
+    elapsed = time.perf_counter() - start
+    cache._db.set_trace_callback(None)
+
+    updates = sum(statement.startswith("UPDATE") for statement in statements)
+    commits = sum(statement == "COMMIT" for statement in statements)
+    passed = check(hits == entries, f"{entries} disk hits in {elapsed * 1000:.0f} ms")
+    return check(commits <= entries // ACCESS_FLUSH_BATCH,
+                 f"their access times took {commits} commits ({updates} row updates in batches of "
+                 f"{ACCESS_FLUSH_BATCH}), not one per hit") and passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=2000)
+    args = parser.parse_args()
+
+    sys.path.insert(0, SRC_DIR)
+    passed = entries_expire()
+    passed = lru_eviction() and passed
+    passed = sets_dont_count_rows() and passed
+    passed = disk_hits_are_batched(args.entries) and passed
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,72 @@
+"""
+Checks that simultaneous /analize requests overlap their network waits.
+Runs one chat, then N chats at the same time against a local fake FMP server;
+N chats should finish in roughly the time of one.
+
+Usage: python benchmarks/concurrent_chats.py [--chats 10] [--latency 0.3]
+"""
+import sys
+import time
+import asyncio
+import argparse
+from types import SimpleNamespace
+
+from fake_fmp_server import FakeFMPServer, use_fake_server
+
+
+class FakeMessage:
+    """Collects the replies the bot would send to Telegram."""
+
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+    async def reply_markdown(self, text, **kwargs):
+        self.replies.append(text)
+
+    async def reply_document(self, document, filename=None, **kwargs):
+        self.replies.append(filename)
+
+
+async def run_chat(analize, tickers, chat_id=0):
+    message = FakeMessage()
+    update = SimpleNamespace(message=message, effective_chat=SimpleNamespace(id=chat_id))
+    context = SimpleNamespace(args=[",".join(tickers)])
+    await analize(update, context)
+    return message.replies
+
+
+async def timed(coro):
+    start = time.perf_counter()
+    result = await coro
+    return result, time.perf_counter() - start
+
+
+async def main(chats, latency, tickers):
+    # Every chat must really hit the (fake) network, not the response cache (use_fake_server turns it off)
+    async with use_fake_server(FakeFMPServer(latency=latency)):
+        from bot import analize
+
+        # Warm up the connection pool so both runs measure the same thing
+        await run_chat(analize, tickers)
+
+        replies, single = await timed(run_chat(analize, tickers))
+        results, many = await timed(asyncio.gather(*(run_chat(analize, tickers, chat_id) for chat_id in range(chats))))
+
+    assert replies and all(results), "every chat should get a reply"
+    print(f"1 chat: {single:.3f}s | {chats} simultaneous chats: {many:.3f}s | ratio {many / single:.2f}")
+    return many / single
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chats", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.3, help="Fake FMP latency per request, in seconds")
+    parser.add_argument("--tickers", default="AAPL,MSFT,GOOGL")
+    args = parser.parse_args()
+
+    ratio = asyncio.run(main(args.chats, args.latency, args.tickers.split(",")))
+    # Serial handlers would take ~chats times longer; allow generous slack for scheduling noise
+    sys.exit(0 if ratio < 2 else 1)
@@ -0,0 +1,231 @@
+"""
+Local stand-in for the FMP stable API, so the pipeline can be exercised without spending quota.
+Serves canned /stable/ratios, /stable/quote, /stable/batch-quote-short and /stable/profile payloads
+with configurable latency, random 5xx errors and 429 rate-limit responses.
+Also holds what the check scripts share: check() and use_fake_server().
+"""
+import os
+import sys
+import json
+import tempfile
+import contextlib
+import collections
+import time
+import random
+import threading
+import http.server
+import socketserver
+from urllib.parse import urlparse, parse_qs
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+
+def canned_ratios(symbol, limit=5):
+    """Annual ratio records, most recent first, with values that depend on the symbol."""
+    seed = sum(ord(char) for char in symbol) % 10
+    return [
+        {
+            "symbol": symbol,
+            "date": f"{2024 - year}-12-31",
+            "fiscalYear": str(2024 - year),
+            "period": "FY",
+            "priceEarningsRatio": 15 + seed + year,
+            "priceSalesRatio": 3 + seed * 0.5 + year * 0.2,
+            "priceToBookRatio": 2 + seed * 0.3 + year * 0.1,
+            "priceCashFlowRatio": 12 + seed,
+            "currentRatio": 1.5,
+            "quickRatio": 1.1,
+            "cashRatio": 0.6,
+            "inventoryTurnover": 8.0,
+            "daysOfInventoryOutstanding": 45.6,
+            "assetTurnover": 0.9,
+            "revenuePerShare": 20 + seed - year,
+            "bookValuePerShare": 30 + seed - year * 0.5,
+            "netIncomePerShare": 4 + seed * 0.2 - year * 0.1,
+        }
+        for year in range(limit)
+    ]
+
+
+def canned_quote(symbol):
+    """Quote record for one symbol."""
+    seed = sum(ord(char) for char in symbol) % 50
+    return {"symbol": symbol, "price": 100.0 + seed}
+
+
+SECTORS = ["Technology", "Financial Services", "Healthcare", "Energy", "Consumer Cyclical"]
+
+
+def canned_profile(symbol):
+    """Profile record with a sector/industry that depends on the symbol."""
+    sector = SECTORS[sum(ord(char) for char in symbol) % len(SECTORS)]
+    return {"symbol": symbol, "companyName": f"{symbol} Inc.", "sector": sector, "industry": f"{sector} - General"}
+
+
+class FakeFMPHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        symbol = query.get("symbol", [""])[0].upper()
+        server = self.server
+        time.sleep(server.response_latency())
+
+        target = symbol or query.get("symbols", [""])[0].upper()
+        endpoint = url.path.rsplit("/", 1)[-1]
+        outcome = server.draw_outcome(endpoint, target)
+        if endpoint in server.refused_endpoints:
+            self.send_json(402, {"Error Message": "Special Endpoint: this endpoint is not available under your plan"})
+            return
+        if outcome == "throttled":
+            self.send_json(429, {"Error Message": "Limit Reach"}, {"Retry-After": str(server.retry_after)})
+            return
+        if outcome == "error":
+            self.send_json(500, {"Error Message": "Internal error"})
+            return
+
+        if url.path.endswith("/ratios"):
+            body = canned_ratios(symbol, int(query.get("limit", ["5"])[0]))
+        elif url.path.endswith("/quote"):
+            body = [canned_quote(symbol)]
+        elif url.path.endswith("/profile"):
+            body = [canned_profile(symbol)]
+        elif url.path.endswith("/batch-quote-short"):
+            symbols = query.get("symbols", [""])[0].upper().split(",")
+            body = [canned_quote(symbol) for symbol in symbols if symbol]
+            for quote in body:
+                quote["price"] *= server.price_factors.get(quote["symbol"], 1.0)
+        else:
+            self.send_json(404, {"Error Message": f"Unknown endpoint {url.path}"})
+            return
+
+        self.send_json(200, body)
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeFMPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0, retry_after=1, seed=0, port=0):
+        """
+        latency/jitter: seconds before each response (latency +/- a uniform jitter).
+        error_rate/throttle_rate: share of requests answered with a 500 / a 429 with Retry-After.
+        """
+        super().__init__(("127.0.0.1", port), FakeFMPHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {"requests": 0, "ok": 0, "error": 0, "throttled": 0}
+        # Requests received per endpoint and symbol(s), e.g. ("ratios", "AAPL")
+        self.requests_by_target = collections.Counter()
+        # Multiplier applied to the batch quote price of a symbol, to simulate price moves
+        self.price_factors = {}
+        # Endpoints answered with a 402, like the ones a plan doesn't include (e.g. "batch-quote-short")
+        self.refused_endpoints = set()
+
+    def response_latency(self):
+        with self._lock:
+            return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    def draw_outcome(self, endpoint=None, target=""):
+        """Picks (and counts) what the next response will be: ok, error or throttled."""
+        with self._lock:
+            self.requests_by_target[(endpoint, target)] += 1
+            draw = self._random.random()
+            if draw < self.throttle_rate:
+                outcome = "throttled"
+            elif draw < self.throttle_rate + self.error_rate:
+                outcome = "error"
+            else:
+                outcome = "ok"
+            self.counts["requests"] += 1
+            self.counts[outcome] += 1
+            return outcome
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/stable"
+
+    def start(self):
+        """Serves in a background thread and returns the base URL to use as FMP_BASE_URL."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def check(condition, message):
+    """Prints one ok/FAIL line of a check script and returns the condition."""
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    return condition
+
+
+@contextlib.asynccontextmanager
+async def use_fake_server(server):
+    """
+    Starts the fake server and points the app at it for the duration of the block: every request
+    reaches the server (response cache off), no plan pacing, no Yahoo Finance and a throwaway
+    history directory. Variables already set in the environment (e.g. FMP_PLAN) are kept, except
+    the base URL, the cache and the history directory. Puts src/ on sys.path, so enter it before
+    importing any app module. On exit the shared HTTP client is closed and the server stopped.
+    """
+    os.environ["FMP_BASE_URL"] = server.start()
+    os.environ.setdefault("FMP_API_KEY", "benchmark")
+    os.environ["FMP_CACHE"] = "off"
+    os.environ.setdefault("FMP_PLAN", "unlimited")
+    os.environ.setdefault("YAHOO_FALLBACK", "off")
+    os.environ["FMP_HISTORY_DIR"] = tempfile.mkdtemp(prefix="fmp_history_")
+    if SRC_DIR not in sys.path:
+        sys.path.insert(0, SRC_DIR)
+
+    from fetch_fmp import close_shared_client
+
+    try:
+        yield server
+    finally:
+        await close_shared_client()
+        server.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a local FMP stand-in server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds to wait before each response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random +/- seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of requests answered with a 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with each 429")
+    args = parser.parse_args()
+
+    server = FakeFMPServer(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        port=args.port,
+    )
+    print(f"Fake FMP server on {server.base_url} (export FMP_BASE_URL to use it)")
+    server.serve_forever()
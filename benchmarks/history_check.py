@@ -0,0 +1,90 @@
+"""
+Checks the ratio history store (history_store.py) on a throwaway directory (no network):
+fetched years are merged in (a re-fetched year replaces the stored one, an unchanged payload
+doesn't touch the file), a year that isn't stored is None so the 5Y ratios fall back to the payload,
+and rolling_median/median match np.nanmedian, with gaps between fiscal years counted as missing.
+
+Usage: python benchmarks/history_check.py
+"""
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from fake_fmp_server import SRC_DIR, canned_ratios, check
+
+
+def years_merge(store):
+    payload = canned_ratios("MERGE", limit=3)  # fiscal years 2024, 2023, 2022
+    passed = check(store.append("MERGE", payload) == 3, "a new ticker stores its 3 fiscal years")
+
+    older = canned_ratios("MERGE", limit=5)[3:]  # 2021 and 2020
+    passed = check(store.append("MERGE", older) == 2, "older years fetched later are merged in") and passed
+
+    revised = [dict(payload[0], priceEarningsRatio=99.0)]
+    passed = check(store.append("MERGE", revised) == 1, "a re-fetched year with new values is replaced") and passed
+    history = store.load("MERGE")
+    passed = check(history["fiscal_year"].tolist() == [2020, 2021, 2022, 2023, 2024]
+                   and history["priceEarningsRatio"][-1] == 99.0,
+                   f"history sorted by year with the revision: {history['fiscal_year'].tolist()}") and passed
+
+    path = store._path("MERGE", "annual")
+    before = os.stat(path).st_mtime_ns
+    unchanged = store.append("MERGE", revised)
+    return check(unchanged == 0 and os.stat(path).st_mtime_ns == before,
+                 "the same payload again doesn't rewrite the file") and passed
+
+
+def missing_year_is_none(store):
+    from fetch_fmp import _historical_ratios, parse_fmp_ratios
+
+    store.append("SHORT", canned_ratios("SHORT", limit=2))
+    passed = check(store.years_ago("SHORT", 4) is None and store.record_for_year("SHORT", 1990) is None,
+                   "a year that isn't stored is None")
+    passed = check(store.years_ago("NEVER", 4) is None, "so is any year of a ticker never stored") and passed
+
+    # Records without a fiscal year can't be stored: the 5th record of the payload is used instead
+    payload = [{key: value for key, value in record.items() if key not in ("date", "fiscalYear")}
+               for record in canned_ratios("NOYEAR")]
+    record = parse_fmp_ratios("NOYEAR", payload, [{"price": 100.0}], _historical_ratios("NOYEAR", payload))
+    return check(record.ps_5y == payload[4]["priceSalesRatio"] and not np.isnan(record.fair_price_5y),
+                 f"without stored years the 5Y ratios come from the payload (fair price {record.fair_price_5y})") and passed
+
+
+def medians_match(store):
+    rng = np.random.default_rng(0)
+    # 2010-2024 with 2013 and 2018 never fetched and a few missing values
+    years = [year for year in range(2010, 2025) if year not in (2013, 2018)]
+    values = {year: (None if rng.random() < 0.2 else float(rng.uniform(5, 40))) for year in years}
+    store.append("ROLL", [{"fiscalYear": str(year), "priceEarningsRatio": value} for year, value in values.items()])
+
+    window = 5
+    series = np.array([np.nan if values.get(year) is None else values[year] for year in range(2010, 2025)])
+    expected_years, expected = [], []
+    for end in range(2010 + window - 1, 2025):
+        chunk = series[end - window + 1 - 2010:end + 1 - 2010]
+        expected_years.append(end)
+        expected.append(np.nan if np.isnan(chunk).all() else np.nanmedian(chunk))
+
+    result_years, medians = store.rolling_median("ROLL", "priceEarningsRatio", window)
+    passed = check(result_years.tolist() == expected_years and np.allclose(medians, expected, equal_nan=True),
+                   f"rolling {window}-year median matches np.nanmedian with gaps as missing ({len(medians)} windows)")
+
+    recent = [values[year] for year in years if year > 2024 - window and values[year] is not None]
+    median = store.median("ROLL", "priceEarningsRatio", window)
+    return check(np.isclose(median, np.median(recent)), f"median of the latest {window} years: {median:.3f}") and passed
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("FMP_API_KEY", "benchmark")
+    os.environ["FMP_HISTORY_DIR"] = tempfile.mkdtemp(prefix="fmp_history_")
+    sys.path.insert(0, SRC_DIR)
+
+    from history_store import get_history_store
+
+    store = get_history_store()
+    passed = years_merge(store)
+    passed = missing_year_is_none(store) and passed
+    passed = medians_match(store) and passed
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,92 @@
+"""
+Checks the bot's /healthz and /metrics endpoints (metrics.py) on a local port (no network):
+/healthz answers 503 while the bot is starting, 200 once the event loop beats and the queue workers
+run, and 503 again while the loop is blocked or after a worker died; /metrics with FMP_CACHE=off
+doesn't create the response cache file.
+
+Usage: python benchmarks/metrics_check.py
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+
+from fake_fmp_server import SRC_DIR, check
+
+
+def get(url):
+    """(HTTP status, body) of a GET, error statuses included."""
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, response.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode()
+
+
+def metrics_leave_the_cache_closed(base_url, cache_path):
+    status, body = get(f"{base_url}/metrics")
+    return check(status == 200 and "fmp_cache_hits_total" not in body and not os.path.exists(cache_path),
+                 "with FMP_CACHE=off /metrics doesn't report the cache or create its file")
+
+
+async def health_follows_the_bot(base_url):
+    from analysis_queue import AnalysisQueue
+    from metrics import add_health_check, start_heartbeat
+
+    status, body = await asyncio.to_thread(get, f"{base_url}/healthz")
+    passed = check(status == 503 and json.loads(body)["status"] == "starting", f"503 while starting: {body}")
+
+    async def fetch(ticker):
+        return None
+
+    queue = AnalysisQueue(workers=2, fetch=fetch, prefetch_quotes=None)
+    queue.start()
+    heartbeat = start_heartbeat(interval=0.05, timeout=0.3)
+    add_health_check("analysis_queue", queue.alive)
+    await asyncio.sleep(0.1)
+    status, body = await asyncio.to_thread(get, f"{base_url}/healthz")
+    passed = check(status == 200 and json.loads(body)["checks"] == {"event_loop": True, "analysis_queue": True},
+                   f"200 once the loop beats and the workers run: {body}") and passed
+
+    # Ask from another thread while the loop is blocked past the timeout
+    blocked = []
+    asker = threading.Thread(target=lambda: (time.sleep(0.5), blocked.append(get(f"{base_url}/healthz"))))
+    asker.start()
+    time.sleep(0.8)
+    asker.join()
+    status, body = blocked[0]
+    passed = check(status == 503 and json.loads(body)["checks"]["event_loop"] is False,
+                   f"503 while the event loop is blocked: {body}") and passed
+
+    await asyncio.sleep(0.1)
+    queue._tasks[0].cancel()
+    await asyncio.sleep(0.01)
+    status, body = await asyncio.to_thread(get, f"{base_url}/healthz")
+    passed = check(status == 503 and json.loads(body)["checks"] == {"event_loop": True, "analysis_queue": False},
+                   f"503 after a queue worker died: {body}") and passed
+
+    heartbeat.cancel()
+    await queue.close()
+    return passed
+
+
+if __name__ == "__main__":
+    cache_path = os.path.join(tempfile.mkdtemp(prefix="fmp_metrics_"), "cache.sqlite")
+    os.environ.setdefault("FMP_API_KEY", "benchmark")
+    os.environ["FMP_CACHE"] = "off"
+    os.environ["FMP_CACHE_PATH"] = cache_path
+    sys.path.insert(0, SRC_DIR)
+
+    from metrics import start_metrics_server
+
+    server = start_metrics_server(0, host="127.0.0.1")
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    passed = metrics_leave_the_cache_closed(base_url, cache_path)
+    passed = asyncio.run(health_follows_the_bot(base_url)) and passed
+    server.shutdown()
+    sys.exit(0 if passed else 1)
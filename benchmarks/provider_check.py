@@ -0,0 +1,230 @@
+"""
+Checks the provider layer of process_data with stubbed providers and a local fake FMP server:
+FMP answers win when they're on time, a slow ticker is hedged to the fallback after the latency
+budget (counted from when its request is sent, not while it's queued for a slot or paced by the rate
+limiter), a failed ticker falls back right away, fields are merged with their provider recorded,
+the fallback's concurrency cap holds across layers, Yahoo multiples are valued but kept out of the FMP
+peer averages, and Yahoo calls run off the event loop.
+
+Usage: python benchmarks/provider_check.py
+"""
+import sys
+import time
+import asyncio
+
+from fake_fmp_server import FakeFMPServer, check, use_fake_server
+
+HEDGE_AFTER = 0.2
+
+
+def stub_provider(name, latency, data, fail=()):
+    """A provider answering every ticker with `data` after `latency` seconds (None for tickers in fail)."""
+    from process_data import Provider
+    from schema import FinancialRecord
+
+    class StubProvider(Provider):
+        def __init__(self):
+            self.name = name
+            self.calls = []
+
+        async def fetch(self, ticker):
+            self.calls.append(ticker)
+            await asyncio.sleep(latency.get(ticker, 0) if isinstance(latency, dict) else latency)
+            return None if ticker in fail else FinancialRecord(company=ticker, **data)
+
+    return StubProvider()
+
+
+FMP_DATA = {"price": 100.0, "per": 20.0, "ps_5y": 3.0}
+YAHOO_DATA = {"price": 101.0, "per": 21.0, "cash_ratio": 0.5}
+
+
+def sources(record):
+    """Provider of each present field."""
+    from schema import METRIC_FIELDS
+
+    return {name: record.source(name) for name in METRIC_FIELDS if record.source(name)}
+
+
+async def timed(layer, tickers):
+    from process_data import get_complete_financials_batch_async
+
+    start = time.perf_counter()
+    results = await get_complete_financials_batch_async(tickers, layer=layer)
+    return results, time.perf_counter() - start
+
+
+async def primary_on_time():
+    from process_data import ProviderLayer
+
+    fmp, yahoo = stub_provider("FMP", 0.01, FMP_DATA), stub_provider("Yahoo", 0.01, YAHOO_DATA)
+    results, _ = await timed(ProviderLayer(fmp, yahoo, hedge_after=HEDGE_AFTER), ["AAA", "BBB"])
+    passed = check(all(record.price == 100.0 for record in results), "FMP data is used when it's on time")
+    passed = check(set(sources(results[0]).values()) == {"FMP"}, f"fields recorded as FMP: {sources(results[0])}") and passed
+    return check(not yahoo.calls, "Yahoo isn't called") and passed
+
+
+async def slow_primary_is_hedged():
+    from process_data import ProviderLayer
+
+    fmp, yahoo = stub_provider("FMP", {"SLOW": 2.0}, FMP_DATA), stub_provider("Yahoo", 0.05, YAHOO_DATA)
+    results, elapsed = await timed(ProviderLayer(fmp, yahoo, hedge_after=HEDGE_AFTER), ["FAST", "SLOW"])
+    fast, slow = results
+    passed = check(fast.source("price") == "FMP" and slow.source("price") == "Yahoo",
+                   "only the slow ticker is served by the hedge")
+    passed = check(yahoo.calls == ["SLOW"], f"Yahoo asked for {yahoo.calls}") and passed
+    return check(elapsed < 0.5, f"answered after the hedge budget, not the slow FMP call ({elapsed:.2f}s)") and passed
+
+
+async def queued_primary_is_not_hedged():
+    from process_data import ProviderLayer
+
+    # Each request is under the budget, but most tickers wait well past it for one of the 2 slots
+    fmp, yahoo = stub_provider("FMP", HEDGE_AFTER * 0.6, FMP_DATA), stub_provider("Yahoo", 0.01, YAHOO_DATA)
+    fmp.max_concurrency = 2
+    tickers = [f"Q{i:02d}" for i in range(16)]
+    results, elapsed = await timed(ProviderLayer(fmp, yahoo, hedge_after=HEDGE_AFTER), tickers)
+    passed = check(all(record.source("price") == "FMP" for record in results),
+                   f"{len(tickers)} tickers queued for 2 FMP slots are all served by FMP ({elapsed:.2f}s)")
+    return check(not yahoo.calls, f"no ticker hedged while waiting for a slot: Yahoo asked for {yahoo.calls}") and passed
+
+
+async def paced_primary_is_not_hedged():
+    import rate_limit
+    from process_data import FMPProvider, ProviderLayer
+
+    # The zero-latency fake FMP behind a limiter pacing 10 requests/s: the last ticker's request
+    # leaves long after the hedge budget, but FMP answers each one as soon as it's sent
+    limiter = rate_limit._limiter
+    rate_limit._limiter = rate_limit.RateLimiter(per_minute=600, burst=1, daily_quota=0)
+    try:
+        yahoo = stub_provider("Yahoo", 0.01, YAHOO_DATA)
+        tickers = [f"P{i:02d}" for i in range(8)]
+        results, elapsed = await timed(ProviderLayer(FMPProvider(), yahoo, hedge_after=HEDGE_AFTER), tickers)
+    finally:
+        rate_limit._limiter = limiter
+    passed = check(all(record is not None and record.source("price") == "FMP" for record in results),
+                   f"{len(tickers)} tickers paced by the rate limiter are all served by FMP ({elapsed:.2f}s)")
+    return check(not yahoo.calls, f"no ticker hedged while waiting for a token: Yahoo asked for {yahoo.calls}") and passed
+
+
+async def failed_primary_falls_back():
+    from process_data import ProviderLayer
+
+    fmp, yahoo = stub_provider("FMP", 0.01, FMP_DATA, fail={"BAD"}), stub_provider("Yahoo", 0.01, YAHOO_DATA)
+    results, elapsed = await timed(ProviderLayer(fmp, yahoo, hedge_after=HEDGE_AFTER), ["BAD"])
+    passed = check(results[0] is not None and results[0].source("price") == "Yahoo", "a failed ticker is served by Yahoo")
+    return check(elapsed < HEDGE_AFTER, f"without waiting for the hedge budget ({elapsed:.2f}s)") and passed
+
+
+async def fallback_cap_is_shared():
+    from process_data import ProviderLayer
+
+    # One layer per ticker, as the bot's queue does, all falling back at once
+    tickers = [f"C{i:02d}" for i in range(12)]
+    fmp, yahoo = stub_provider("FMP", 0.01, FMP_DATA, fail=set(tickers)), stub_provider("Yahoo", 0.05, YAHOO_DATA)
+    yahoo.max_concurrency = 3
+    running = peak = 0
+    fetch = yahoo.fetch
+
+    async def counted(ticker):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            return await fetch(ticker)
+        finally:
+            running -= 1
+
+    yahoo.fetch = counted
+    results = await asyncio.gather(*(timed(ProviderLayer(fmp, yahoo, hedge_after=HEDGE_AFTER), [ticker]) for ticker in tickers))
+    passed = check(all(records[0] is not None for records, _ in results), f"{len(tickers)} single-ticker layers all fall back")
+    return check(peak == 3, f"at most {yahoo.max_concurrency} fallback calls at a time across the layers (peak {peak})") and passed
+
+
+async def fields_are_merged():
+    from process_data import ProviderLayer
+
+    # FMP is past the hedge budget and Yahoo answers first: Yahoo's data is used without waiting for FMP
+    fmp, yahoo = stub_provider("FMP", 0.6, FMP_DATA), stub_provider("Yahoo", 0.1, YAHOO_DATA)
+    results, _ = await timed(ProviderLayer(fmp, yahoo, hedge_after=HEDGE_AFTER), ["MIX"])
+    record = results[0]
+    passed = check(record.price == 101.0 and record.source("price") == "Yahoo", "the first usable answer wins")
+    passed = check(record.source("ps_5y") is None, "fields the winner lacks stay missing") and passed
+
+    fmp, yahoo = stub_provider("FMP", 0.01, FMP_DATA, fail={"MIX"}), stub_provider("Yahoo", 0.01, YAHOO_DATA)
+    results, _ = await timed(ProviderLayer(fmp, yahoo, hedge_after=HEDGE_AFTER), ["MIX"])
+    merged = sources(results[0])
+    return check(merged == {"price": "Yahoo", "per": "Yahoo", "cash_ratio": "Yahoo"},
+                 f"every field records its provider: {merged}") and passed
+
+
+def hedged_multiples_stay_out_of_peer_averages():
+    from schema import FinancialRecord
+    from valuation import value_records
+
+    records = [
+        FinancialRecord(company="A", price=100.0, per=10.0, fair_price_5y=100.0, provider="FMP"),
+        FinancialRecord(company="B", price=100.0, per=20.0, fair_price_5y=100.0, provider="FMP"),
+        # Trailing P/E from a Yahoo hedge, far from the FMP ones
+        FinancialRecord(company="Y", price=100.0, per=90.0, provider="Yahoo"),
+    ]
+    value_records(records)
+    # Peer average P/E of A and B is 15: A is worth 150, B 75, Y 100 * 15 / 90
+    passed = check([row.intrinsic_per for row in records] == [150.0, 75.0, 16.667],
+                   f"Yahoo's P/E is valued against the FMP average without moving it: "
+                   f"{[row.intrinsic_per for row in records]}")
+
+    records[1].sources = {"per": "Yahoo"}
+    value_records(records)
+    return check(records[0].intrinsic_per == 100.0,
+                 f"a P/E filled in from Yahoo on an FMP record is left out too ({records[0].intrinsic_per})") and passed
+
+
+async def yahoo_runs_off_the_loop():
+    import fetch_yahoo
+    from process_data import YahooProvider, ProviderLayer
+
+    info = {"currentPrice": 50.0, "trailingPE": 12.3456, "priceToBook": 2.0, "marketCap": 1e9, "operatingCashflow": 1e8}
+
+    def blocking_yahoo(ticker):
+        time.sleep(0.3)  # like yf.Ticker(ticker).info
+        return fetch_yahoo.parse_yahoo_info(ticker, info)
+
+    fetch_yahoo.get_normalized_ratios_yahoo = blocking_yahoo
+    ticks = 0
+
+    async def heartbeat():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    beat = asyncio.ensure_future(heartbeat())
+    fmp = stub_provider("FMP", 0.01, FMP_DATA, fail={"YHO"})
+    results, _ = await timed(ProviderLayer(fmp, YahooProvider(), hedge_after=HEDGE_AFTER), ["YHO"])
+    beat.cancel()
+
+    record = results[0]
+    passed = check(record.per == 12.346 and record.pcf == 10.0,
+                   f"Yahoo info normalized to the shared record: {record}")
+    return check(ticks >= 15, f"the event loop kept running during the blocking Yahoo call ({ticks} ticks)") and passed
+
+
+async def main():
+    # The stubbed providers don't need it, but the paced FMP case goes through the real client
+    async with use_fake_server(FakeFMPServer(latency=0)):
+        passed = await primary_on_time()
+        passed = await slow_primary_is_hedged() and passed
+        passed = await queued_primary_is_not_hedged() and passed
+        passed = await paced_primary_is_not_hedged() and passed
+        passed = await failed_primary_falls_back() and passed
+        passed = await fallback_cap_is_shared() and passed
+        passed = await fields_are_merged() and passed
+        passed = hedged_multiples_stay_out_of_peer_averages() and passed
+        passed = await yahoo_runs_off_the_loop() and passed
+    return passed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
@@ -0,0 +1,129 @@
+"""
+Checks the FMP rate limiter against a local fake FMP server:
+a scan through random 429s and 5xx errors loses no tickers, Retry-After is honored,
+requests are paced to the configured rate and the daily quota refuses work once used up,
+with its count kept on disk and shared by every limiter (process) using the same file.
+A plan without the batch quote endpoint still gets every price, from the per-symbol endpoint.
+
+Usage: python benchmarks/rate_limit_check.py [--tickers 200]
+"""
+import os
+import io
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+import concurrent.futures
+
+from fake_fmp_server import FakeFMPServer, check, use_fake_server
+
+
+async def no_lost_tickers(server, count):
+    from process_data import get_complete_financials_batch_async
+
+    server.throttle_rate, server.error_rate = 0.2, 0.05
+    tickers = [f"T{i:04d}" for i in range(count)]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = await get_complete_financials_batch_async(tickers)
+    finally:
+        server.throttle_rate, server.error_rate = 0.0, 0.0
+    failed = sum(result is None for result in results)
+    return check(failed == 0, f"{count} tickers through 20% 429s and 5% 5xx: {failed} lost, server counts {server.counts}")
+
+
+async def honors_retry_after(server):
+    from process_data import get_complete_financials_async
+
+    server.throttle_rate, server.retry_after = 1.0, 1
+    # Throttle only the first requests: the retry must wait the full Retry-After second
+    asyncio.get_running_loop().call_later(0.2, setattr, server, "throttle_rate", 0.0)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        data = await get_complete_financials_async("RETRY")
+    elapsed = time.perf_counter() - start
+    return check(data is not None and elapsed >= 1.0, f"waited Retry-After before retrying ({elapsed:.2f}s)")
+
+
+async def paces_requests():
+    import rate_limit
+    from fetch_fmp import get_quotes_async
+
+    rate_limit._limiter = rate_limit.RateLimiter(per_minute=1200, burst=2, daily_quota=0)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(get_quotes_async([f"P{i}"], use_cache=False) for i in range(42)))
+    elapsed = time.perf_counter() - start
+    # 2 requests go out at once, the other 40 at 20 per second
+    return check(1.9 <= elapsed < 3.0, f"42 requests at 1200/min with a burst of 2 took {elapsed:.2f}s (expected ~2s)")
+
+
+async def refuses_past_quota():
+    import rate_limit
+    from fetch_fmp import get_fmp_ratios_async
+
+    quota_path = os.path.join(tempfile.mkdtemp(prefix="fmp_quota_"), "quota.sqlite")
+    limiter = rate_limit._limiter = rate_limit.RateLimiter(per_minute=0, daily_quota=5, reserve=2, quota_path=quota_path)
+
+    with rate_limit.background_priority():
+        background = [limiter.quota.try_consume(background=True) for _ in range(4)]
+    passed = check(background == [True, True, True, False], f"background work stops before the reserve: {background}")
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        # 2 requests left: ratios + quote for the first ticker, nothing for the second
+        first = await get_fmp_ratios_async("QUOTA1", use_cache=False)
+        second = await get_fmp_ratios_async("QUOTA2", use_cache=False)
+    passed = check(first is not None and second is None, "interactive requests use the reserve, then are refused") and passed
+    passed = check("quota used up" in output.getvalue(), "the refusal is reported") and passed
+
+    # Another process (or this one after a restart) opens the same file and sees the same count
+    other = rate_limit.RateLimiter(per_minute=0, daily_quota=5, reserve=2, quota_path=quota_path)
+    passed = check(other.quota.used == 5 and not other.quota.try_consume(),
+                   f"a new limiter on the same file finds the quota used up ({other.quota.used} of 5)") and passed
+
+    shared_path = os.path.join(os.path.dirname(quota_path), "shared.sqlite")
+    quotas = [rate_limit.DailyQuota(100, path=shared_path) for _ in range(4)]
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+        granted = sum(pool.map(lambda index: quotas[index % 4].try_consume(), range(160)))
+    return check(granted == 100 and quotas[0].used == 100,
+                 f"4 connections racing for 100 requests get {granted} in total") and passed
+
+
+async def batch_quotes_refused(server):
+    from fetch_fmp import get_quotes_async
+
+    symbols = [f"B{i:02d}" for i in range(5)]
+    server.refused_endpoints.add("batch-quote-short")
+    server.requests_by_target.clear()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            quotes = await get_quotes_async(symbols, batch_size=5)
+    finally:
+        server.refused_endpoints.clear()
+    batches = sum(count for (endpoint, _), count in server.requests_by_target.items() if endpoint == "batch-quote-short")
+    singles = sum(count for (endpoint, _), count in server.requests_by_target.items() if endpoint == "quote")
+    return check(sorted(quotes) == symbols and batches == 1 and singles == len(symbols),
+                 f"batch quotes refused with a 402: {len(quotes)}/{len(symbols)} prices from {batches} batch "
+                 f"and {singles} per-symbol requests")
+
+
+async def main(count):
+    async with use_fake_server(FakeFMPServer(latency=0.02, seed=7)) as server:
+        passed = await no_lost_tickers(server, count)
+        passed = await honors_retry_after(server) and passed
+        passed = await paces_requests() and passed
+        passed = await batch_quotes_refused(server) and passed
+        # Last: it leaves the shared limiter's quota used up
+        passed = await refuses_past_quota() and passed
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tickers", type=int, default=200)
+    args = parser.parse_args()
+
+    sys.exit(0 if asyncio.run(main(args.tickers)) else 1)
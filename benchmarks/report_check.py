@@ -0,0 +1,88 @@
+"""
+Checks the bot's /analize output for many tickers (no network):
+the valuation text is packed into messages under Telegram's limit without splitting a company block
+(so no *bold* Markdown entity is cut), nothing is lost or reordered, and the summary file is rendered
+in memory with the same bytes as the CSV export, without writing to ../data.
+
+Usage: python benchmarks/report_check.py [--tickers 300]
+"""
+import os
+import io
+import sys
+import time
+import argparse
+
+from fake_fmp_server import SRC_DIR, check
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+
+def valued_records(count):
+    from bench_records import synthetic_records
+
+    return synthetic_records(count)
+
+
+def messages_keep_blocks(records):
+    from bot import MESSAGE_LIMIT, chunk_blocks, format_valuation_text, valuation_block
+
+    start = time.perf_counter()
+    blocks = [valuation_block(row) for row in records]
+    chunks = chunk_blocks(blocks)
+    elapsed = time.perf_counter() - start
+
+    passed = check(all(len(chunk) <= MESSAGE_LIMIT for chunk in chunks),
+                   f"{len(records)} companies -> {len(chunks)} messages of at most {MESSAGE_LIMIT} characters "
+                   f"({elapsed * 1000:.1f} ms)")
+    passed = check("\n".join(chunks) == format_valuation_text(records),
+                   "the messages put back together are the full valuation text") and passed
+    passed = check(all(chunk.count("*") % 2 == 0 for chunk in chunks),
+                   "every message has balanced Markdown bold markers") and passed
+    # Each message starts at a company heading: no block is spread over two messages
+    return check(all(chunk.lstrip("\n").startswith("📊 *") for chunk in chunks),
+                 "every message starts with a company block") and passed
+
+
+def long_block_is_split_between_lines():
+    from bot import chunk_blocks
+
+    block = "\n".join(f"- *Line {i}*: {'x' * 40}" for i in range(200))
+    chunks = chunk_blocks(["header", block, "footer"], limit=1000)
+    passed = check(all(len(chunk) <= 1000 for chunk in chunks) and "\n".join(chunks) == f"header\n{block}\nfooter",
+                   f"a block over the limit is split between its lines into {len(chunks)} messages")
+    return check(all(chunk.count("*") % 2 == 0 for chunk in chunks), "no line was cut in half") and passed
+
+
+def report_in_memory(records):
+    from bot import report_document
+    from export_data import build_summary_frame
+
+    before = set(os.listdir(DATA_DIR)) if os.path.isdir(DATA_DIR) else set()
+    document, filename = report_document(records, "csv")
+    expected = io.StringIO()
+    build_summary_frame(records).to_csv(expected)
+    after = set(os.listdir(DATA_DIR)) if os.path.isdir(DATA_DIR) else set()
+
+    passed = check(document.getvalue() == expected.getvalue().encode(),
+                   f"{filename}: {len(document.getvalue()) / 1024:.0f} KB, same bytes as the CSV export")
+    passed = check(document.tell() == 0, "the file is rewound, ready for reply_document") and passed
+    passed = check(after == before, "nothing written to ../data") and passed
+
+    # Without openpyxl the bot still sends the table, as a CSV
+    document, filename = report_document(records, "xlsx")
+    return check(filename.endswith((".xlsx", ".csv")) and document.getvalue(), f"xlsx report sent as {filename}") and passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tickers", type=int, default=300)
+    args = parser.parse_args()
+
+    os.environ.setdefault("FMP_API_KEY", "benchmark")
+    sys.path.insert(0, SRC_DIR)
+    records = valued_records(args.tickers)
+
+    passed = messages_keep_blocks(records)
+    passed = long_block_is_split_between_lines() and passed
+    passed = report_in_memory(records) and passed
+    sys.exit(0 if passed else 1)
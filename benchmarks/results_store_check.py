@@ -0,0 +1,99 @@
+"""
+Checks reading runs back from the results store (results_store.py) on a throwaway SQLite file:
+a stored run rebuilds the same FinancialRecords in the same order, the CSV rendered from the store
+has the same bytes as the one built from the records, every read filter returns what filtering all
+rows in Python would, and filtered reads are answered from an index rather than a full scan.
+
+Usage: python benchmarks/results_store_check.py [--tickers 500]
+"""
+import io
+import os
+import sys
+import argparse
+import datetime
+import tempfile
+import contextlib
+
+from fake_fmp_server import SRC_DIR, check
+
+
+def runs_round_trip(store, records):
+    from export_data import build_summary_frame, render_run_csv
+
+    run_id = store.append_run(records, source="check")
+    rebuilt = store.run_records(run_id)
+    passed = check([row.to_labels() for row in rebuilt] == [row.to_labels() for row in records],
+                   f"run {run_id}: {len(rebuilt)} records read back with the same values, in the same order")
+
+    expected = io.StringIO()
+    build_summary_frame(records).to_csv(expected)
+    filename = os.path.join(os.path.dirname(store.path), "run.csv")
+    with contextlib.redirect_stdout(io.StringIO()):
+        render_run_csv(run_id, store=store, filename=filename)
+    with open(filename, encoding="utf-8", newline="") as file:
+        rendered = file.read()
+    return check(rendered == expected.getvalue(), "the CSV rendered from the store matches the one from the records") and passed
+
+
+def filters_match(store, records):
+    from schema import LABELS
+
+    days = [datetime.datetime(2024, 1, day, 12) for day in (1, 2, 3)]
+    run_ids = [store.append_run(records[day.day * 10:], source="check", run_ts=day) for day in days]
+    every_row = store.read()
+    runs = {run_id: run_ts for run_id, run_ts, _ in store.runs()}
+
+    tickers = [row.company for row in records[35:40]]
+    metrics = [LABELS["price"], LABELS["recommendation"]]
+    cases = {
+        "tickers": ({"tickers": [ticker.lower() for ticker in tickers]}, lambda row: row[2] in tickers),
+        "metrics": ({"metrics": metrics}, lambda row: row[3] in metrics),
+        "date range": ({"since": "2024-01-02", "until": days[2].date()}, lambda row: "2024-01-02" <= runs[row[0]][:10] <= "2024-01-03"),
+        "runs": ({"run_ids": run_ids[:2]}, lambda row: row[0] in run_ids[:2]),
+        "all at once": (
+            {"tickers": tickers, "metrics": metrics, "since": "2024-01-02"},
+            lambda row: row[2] in tickers and row[3] in metrics and runs[row[0]][:10] >= "2024-01-02",
+        ),
+    }
+    passed = True
+    for name, (filters, keep) in cases.items():
+        rows = store.read(**filters)
+        passed = check(rows == [row for row in every_row if keep(row)], f"filter by {name}: {len(rows)} rows") and passed
+
+    frame = store.read_frame(tickers=tickers, run_ids=run_ids[2:])
+    return check(len(frame) == len(store.read(tickers=tickers, run_ids=run_ids[2:]))
+                 and str(frame["run_ts"].dtype).startswith("datetime64"),
+                 f"read_frame gives the same rows with parsed timestamps ({len(frame)} rows)") and passed
+
+
+def reads_use_an_index(store):
+    plans = {
+        "date range": "SELECT * FROM results WHERE run_date >= '2024-01-02' AND run_date <= '2024-01-03'",
+        "ticker": "SELECT * FROM results WHERE ticker = 'T00001'",
+        "run": "SELECT * FROM results WHERE run_id = 1",
+    }
+    passed = True
+    for name, query in plans.items():
+        plan = " ".join(row[-1] for row in store._db.execute(f"EXPLAIN QUERY PLAN {query}"))
+        passed = check("SEARCH" in plan, f"reads by {name} use an index: {plan}") and passed
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tickers", type=int, default=500)
+    args = parser.parse_args()
+
+    os.environ.setdefault("FMP_API_KEY", "benchmark")
+    sys.path.insert(0, SRC_DIR)
+
+    from bench_records import synthetic_records
+    from results_store import ResultsStore
+
+    store = ResultsStore(os.path.join(tempfile.mkdtemp(prefix="fmp_results_"), "results.sqlite"))
+    records = synthetic_records(args.tickers)
+    passed = runs_round_trip(store, records)
+    passed = filters_match(store, records) and passed
+    passed = reads_use_an_index(store) and passed
+    store.close()
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,101 @@
+"""
+Checks that concurrent lookups of the same tickers share one upstream request (single-flight).
+Runs N callers at the same time against a local fake FMP server and counts what the server received:
+every endpoint/symbol must be requested exactly once, errors must reach every caller, and a waiter
+that times out must not cancel the request the others are waiting for.
+
+Usage: python benchmarks/singleflight_check.py [--callers 20] [--latency 0.2]
+"""
+import os
+import io
+import sys
+import asyncio
+import argparse
+import contextlib
+
+from fake_fmp_server import FakeFMPServer, check, use_fake_server
+
+TICKERS = ["AAPL", "MSFT"]
+
+
+async def concurrent_callers(server, callers):
+    from process_data import get_complete_financials_batch_async
+
+    server.requests_by_target.clear()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = await asyncio.gather(*(get_complete_financials_batch_async(TICKERS) for _ in range(callers)))
+
+    requests = dict(server.requests_by_target)
+    expected = {("ratios", ticker): 1 for ticker in TICKERS}
+    expected[("batch-quote-short", ",".join(TICKERS))] = 1
+    passed = check(requests == expected, f"{callers} concurrent callers -> upstream requests {requests}")
+    return check(all(all(result) for result in results), "every caller got data for every ticker") and passed
+
+
+async def shared_errors(server, callers):
+    from process_data import get_complete_financials_batch_async
+
+    server.requests_by_target.clear()
+    server.error_rate = 1.0
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = await asyncio.gather(*(get_complete_financials_batch_async(TICKERS) for _ in range(callers)))
+    finally:
+        server.error_rate = 0.0
+
+    # One caller alone would send the request plus its retries; N callers must not send more
+    # (the quote batch may be dropped before its last retry once every ratios request has failed)
+    from rate_limit import MAX_RETRIES
+    requests = server.requests_by_target
+    passed = check(
+        all(requests[("ratios", ticker)] == MAX_RETRIES + 1 for ticker in TICKERS)
+        and all(count <= MAX_RETRIES + 1 for count in requests.values()),
+        f"failing upstream requested once (+{MAX_RETRIES} retries) per target: {dict(server.requests_by_target)}",
+    )
+    return check(all(result == [None, None] for result in results), "every caller saw the failure") and passed
+
+
+async def waiter_timeout(server):
+    from fetch_fmp import _get_json, _in_flight, get_shared_client, RATIOS_URL, API_KEY
+    import httpx
+
+    server.requests_by_target.clear()
+    client = get_shared_client()
+    params = {"symbol": "TSLA", "apikey": API_KEY, "period": "annual", "limit": 5}
+
+    leader = asyncio.ensure_future(_get_json(client, RATIOS_URL, params))
+    await asyncio.sleep(0)
+    timeout, _in_flight.timeout = _in_flight.timeout, server.latency / 4
+    try:
+        await _get_json(client, RATIOS_URL, params)
+        timed_out = False
+    except httpx.TimeoutException:
+        timed_out = True
+    finally:
+        _in_flight.timeout = timeout
+
+    status, payload = await leader
+    passed = check(timed_out, "a waiter gives up after its timeout")
+    passed = check(status == 200 and bool(payload), "the request in flight still completes for the others") and passed
+    return check(server.requests_by_target[("ratios", "TSLA")] == 1, "the timed out waiter sent no extra request") and passed
+
+
+async def main(callers, latency):
+    os.environ.setdefault("FMP_BACKOFF_BASE", "0.01")
+    # Sharing must come from the in-flight requests, not from the response cache (use_fake_server turns it off)
+    async with use_fake_server(FakeFMPServer(latency=latency)) as server:
+        passed = await concurrent_callers(server, callers)
+        # Once the first wave is done, a new caller sends a new request
+        passed = await concurrent_callers(server, 1) and passed
+        passed = await shared_errors(server, callers) and passed
+        passed = await waiter_timeout(server) and passed
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--callers", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake FMP latency per request, in seconds")
+    args = parser.parse_args()
+
+    sys.exit(0 if asyncio.run(main(args.callers, args.latency)) else 1)
@@ -0,0 +1,84 @@
+"""
+Checks the grouped universe scan (universe_scan.py) against a local fake FMP server:
+ticker files are parsed with comments and duplicates, every ticker is yielded once in the group
+of its profile's sector, each group is valued against its own peers only, and run_scan streams
+one CSV row per ticker.
+
+Usage: python benchmarks/universe_scan_check.py [--tickers 200]
+"""
+import io
+import os
+import csv
+import sys
+import asyncio
+import argparse
+import tempfile
+import contextlib
+
+from fake_fmp_server import FakeFMPServer, canned_profile, check, use_fake_server
+
+
+def ticker_file_is_parsed():
+    from universe_scan import parse_tickers
+
+    tickers = parse_tickers("aapl, msft\n# a comment line\nGOOG  AAPL # trailing comment\n\nnvda,,tsla\n")
+    return check(tickers == ["AAPL", "MSFT", "GOOG", "NVDA", "TSLA"],
+                 f"ticker file parsed without comments or duplicates: {tickers}")
+
+
+async def groups_use_their_own_peers(tickers):
+    import numpy as np
+    from universe_scan import scan_universe
+    from valuation import masked_mean, to_array
+
+    groups = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        async for group, records in scan_universe(tickers):
+            groups.setdefault(group, []).extend(records)
+
+    scanned = [data.company for records in groups.values() for data in records]
+    passed = check(sorted(scanned) == sorted(tickers), f"{len(tickers)} tickers yielded once each in {len(groups)} groups")
+    passed = check(all(canned_profile(data.company)["sector"] == group == data.sector
+                       for group, records in groups.items() for data in records),
+                   "each ticker is in the group of its profile's sector") and passed
+
+    averages = []
+    own_peers = True
+    for records in groups.values():
+        averages.append(float(masked_mean(to_array([data.per for data in records]))))
+        own_peers &= all(np.isclose(data.intrinsic_per, data.price * averages[-1] / data.per, atol=0.001) for data in records)
+    passed = check(own_peers, "each intrinsic P/E value uses the peer average of its own sector") and passed
+    return check(len(set(np.round(averages, 6))) == len(groups),
+                 f"the sector averages differ from each other: {[round(average, 2) for average in averages]}") and passed
+
+
+async def scan_is_written(tickers):
+    from universe_scan import run_scan
+
+    filename = os.path.join(tempfile.mkdtemp(prefix="universe_scan_"), "scan.csv")
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        await run_scan(tickers, "industry", 8, None, filename)
+    with open(filename, newline="", encoding="utf-8") as file:
+        rows = list(csv.reader(file))
+    passed = check(len(rows) == len(tickers) + 1 and rows[0][0] == "Company",
+                   f"run_scan wrote a header and {len(rows) - 1} rows for {len(tickers)} tickers")
+    return check(output.getvalue().count("✅") == len({canned_profile(ticker)["industry"] for ticker in tickers}),
+                 "with one summary line per industry") and passed
+
+
+async def main(count):
+    async with use_fake_server(FakeFMPServer(latency=0.01)):
+        tickers = [f"U{i:04d}" for i in range(count)]
+        passed = ticker_file_is_parsed()
+        passed = await groups_use_their_own_peers(tickers) and passed
+        passed = await scan_is_written(tickers) and passed
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tickers", type=int, default=200)
+    args = parser.parse_args()
+
+    sys.exit(0 if asyncio.run(main(args.tickers)) else 1)
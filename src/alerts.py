@@ -0,0 +1,247 @@
+import os
+import sqlite3
+import asyncio
+import logging
+import numpy as np
+
+from fetch_fmp import get_quotes_async
+from metrics import ALERTS_SENT, ALERTS_WATCHED
+from rate_limit import background_priority
+from schema import is_missing
+from valuation import RECOMMENDATION_BAND
+
+# Seconds between two price polls of the watched tickers (all chats share the same poll)
+ALERT_INTERVAL = float(os.getenv("BOT_ALERT_INTERVAL", 60))
+# Tickers one chat can watch
+MAX_ALERTS_PER_CHAT = int(os.getenv("BOT_MAX_ALERTS_PER_CHAT", 50))
+# Watched tickers are kept here so the alerts survive a restart of the bot ("off" keeps them in memory only)
+ALERTS_PATH = os.getenv(
+    "BOT_ALERTS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "alerts.sqlite"),
+)
+
+# Zone of a price against the thresholds (Underpriced band, final intrinsic value, Overpriced band)
+ZONES = [
+    "below the Underpriced band",
+    "between the Underpriced band and the intrinsic value",
+    "between the intrinsic value and the Overpriced band",
+    "above the Overpriced band",
+]
+
+
+def alert_thresholds(final_intrinsic, band=RECOMMENDATION_BAND):
+    """
+    Prices where the recommendation changes, per ticker: (n, 3) array of the Underpriced band,
+    the final intrinsic value and the Overpriced band (same ±band rule as valuation.recommend).
+    """
+    final_intrinsic = np.asarray(final_intrinsic, dtype=float)
+    return np.column_stack([final_intrinsic / (1 + band), final_intrinsic, final_intrinsic / (1 - band)])
+
+
+def price_zones(prices, thresholds):
+    """Zone (index into ZONES) of each price: how many thresholds it is above."""
+    return (np.asarray(prices, dtype=float)[:, None] > thresholds).sum(axis=1).astype(np.int8)
+
+
+class AlertTable:
+    """
+    Every watched (chat, ticker) as one row of parallel arrays: thresholds computed once at /watch,
+    and the zone the price was last seen in. check() compares all rows against new prices at once.
+    """
+
+    def __init__(self):
+        self.chat_ids = np.empty(0, dtype=np.int64)
+        self.tickers = np.empty(0, dtype=object)
+        self.thresholds = np.empty((0, 3))
+        self.zones = np.empty(0, dtype=np.int8)
+        self._index()
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def _index(self):
+        # Row -> position in the unique tickers, rebuilt only when rows are added or removed
+        self.unique_tickers, self._ticker_rows = np.unique(self.tickers.astype(str), return_inverse=True)
+        ALERTS_WATCHED.set(len(self))
+
+    def add(self, chat_id, tickers, final_intrinsic, prices=None, zones=None):
+        """
+        Watches tickers for a chat (replacing the chat's previous thresholds for them), starting in
+        the zone of `prices`, or in the given `zones` when restored. Returns the new rows' zones.
+        """
+        self.remove(chat_id, tickers)
+        thresholds = alert_thresholds(final_intrinsic)
+        zones = price_zones(prices, thresholds) if zones is None else np.asarray(zones, dtype=np.int8)
+        self.chat_ids = np.concatenate([self.chat_ids, np.full(len(tickers), chat_id, dtype=np.int64)])
+        self.tickers = np.concatenate([self.tickers, np.array(tickers, dtype=object)])
+        self.thresholds = np.vstack([self.thresholds, thresholds])
+        self.zones = np.concatenate([self.zones, zones])
+        self._index()
+        return zones
+
+    def remove(self, chat_id, tickers=None):
+        """Stops watching tickers (all of them by default) for a chat. Returns the removed tickers."""
+        rows = self.chat_ids == chat_id
+        if tickers is not None:
+            rows &= np.isin(self.tickers.astype(str), list(tickers))
+        removed = self.tickers[rows].tolist()
+        if removed:
+            keep = ~rows
+            self.chat_ids, self.tickers = self.chat_ids[keep], self.tickers[keep]
+            self.thresholds, self.zones = self.thresholds[keep], self.zones[keep]
+            self._index()
+        return removed
+
+    def for_chat(self, chat_id):
+        """(ticker, thresholds) watched by a chat."""
+        rows = np.flatnonzero(self.chat_ids == chat_id)
+        return [(self.tickers[row], self.thresholds[row]) for row in rows]
+
+    def check(self, prices):
+        """
+        Compares every row with the new prices ({ticker: price}, missing = no change) in one pass.
+        Returns (chat_id, ticker, price, old zone, new zone, thresholds) for each row whose zone changed.
+        """
+        if not len(self):
+            return []
+        unique_prices = np.array([prices.get(ticker, np.nan) for ticker in self.unique_tickers], dtype=float)
+        row_prices = unique_prices[self._ticker_rows]
+        zones = price_zones(row_prices, self.thresholds)
+        changed = np.flatnonzero(np.isfinite(row_prices) & (zones != self.zones))
+
+        alerts = [
+            (int(self.chat_ids[row]), self.tickers[row], float(row_prices[row]), int(self.zones[row]),
+             int(zones[row]), self.thresholds[row])
+            for row in changed
+        ]
+        self.zones[changed] = zones[changed]
+        return alerts
+
+
+def alert_text(ticker, price, old_zone, new_zone, thresholds):
+    arrow = "📈" if new_zone > old_zone else "📉"
+    lower, final, upper = thresholds
+    return (
+        f"{arrow} {ticker} at {price:.2f} is now {ZONES[new_zone]}\n"
+        f"Underpriced below {lower:.2f} | Intrinsic value {final:.2f} | Overpriced above {upper:.2f}"
+    )
+
+
+class AlertWatcher:
+    """
+    Price alerts for every chat: one background loop polls the union of the watched tickers with
+    batched quote requests, so the number of requests depends on the tickers, not on the chats.
+    notify(chat_id, text) is awaited for every alert.
+
+    The watched rows are saved to a small SQLite file at `path` (None or "off": memory only) and
+    restored when the watcher is created, so a restart keeps every chat's alerts and their zones.
+    """
+
+    def __init__(self, notify, interval=ALERT_INTERVAL, max_per_chat=MAX_ALERTS_PER_CHAT, path=ALERTS_PATH):
+        self.notify = notify
+        self.interval = interval
+        self.max_per_chat = max_per_chat
+        self.table = AlertTable()
+        self._db = None
+        if path and path != "off":
+            self._open(path)
+
+    def _open(self, path):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS alerts ("
+            "chat_id INTEGER NOT NULL, ticker TEXT NOT NULL, intrinsic REAL NOT NULL, zone INTEGER NOT NULL, "
+            "PRIMARY KEY (chat_id, ticker))"
+        )
+        self._db.commit()
+
+        rows = {}
+        for chat_id, ticker, intrinsic, zone in self._db.execute("SELECT chat_id, ticker, intrinsic, zone FROM alerts"):
+            rows.setdefault(chat_id, []).append((ticker, intrinsic, zone))
+        for chat_id, watched in rows.items():
+            tickers, intrinsic, zones = zip(*watched)
+            self.table.add(chat_id, list(tickers), list(intrinsic), zones=list(zones))
+        if rows:
+            logging.info(f"🔔 Restored {len(self.table)} price alerts for {len(rows)} chats")
+
+    def watch(self, chat_id, records):
+        """
+        Watches valued records (see valuation.value_records) for a chat.
+        Returns (watched records, tickers without a positive intrinsic value, tickers over the chat's cap).
+        """
+        watched, no_value, over_cap = [], [], []
+        current = {ticker for ticker, _ in self.table.for_chat(chat_id)}
+        for record in records:
+            # A value <= 0 would put the Overpriced band below the Underpriced one
+            if is_missing(record.intrinsic_final) or is_missing(record.price) or record.intrinsic_final <= 0:
+                no_value.append(record.company)
+            elif record.company not in current and len(current) >= self.max_per_chat:
+                over_cap.append(record.company)
+            else:
+                watched.append(record)
+                current.add(record.company)
+        if watched:
+            tickers = [record.company for record in watched]
+            intrinsic = [record.intrinsic_final for record in watched]
+            zones = self.table.add(chat_id, tickers, intrinsic, [record.price for record in watched])
+            if self._db is not None:
+                with self._db:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO alerts (chat_id, ticker, intrinsic, zone) VALUES (?, ?, ?, ?)",
+                        [(chat_id, *row, int(zone)) for *row, zone in zip(tickers, intrinsic, zones)],
+                    )
+        return watched, no_value, over_cap
+
+    def unwatch(self, chat_id, tickers=None):
+        removed = self.table.remove(chat_id, tickers)
+        if removed and self._db is not None:
+            with self._db:
+                self._db.executemany(
+                    "DELETE FROM alerts WHERE chat_id = ? AND ticker = ?", [(chat_id, ticker) for ticker in removed]
+                )
+        return removed
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    async def poll(self):
+        """Fetches the prices of every watched ticker and sends the alerts. Returns the number sent."""
+        if not len(self.table):
+            return 0
+        quotes = await get_quotes_async(self.table.unique_tickers.tolist())
+        prices = {ticker: quote.get("price") for ticker, quote in quotes.items() if quote.get("price")}
+
+        alerts = self.table.check(prices)
+        if alerts and self._db is not None:
+            # Only the rows whose zone changed are written, so a quiet poll doesn't touch the file
+            with self._db:
+                self._db.executemany(
+                    "UPDATE alerts SET zone = ? WHERE chat_id = ? AND ticker = ?",
+                    [(new_zone, chat_id, ticker) for chat_id, ticker, _, _, new_zone, _ in alerts],
+                )
+        for chat_id, ticker, price, old_zone, new_zone, thresholds in alerts:
+            try:
+                await self.notify(chat_id, alert_text(ticker, price, old_zone, new_zone, thresholds))
+                ALERTS_SENT.inc()
+            except Exception as e:
+                logging.warning(f"Alert for {ticker} to chat {chat_id} failed: {e}")
+        return len(alerts)
+
+    async def run(self):
+        """Polls forever; cancel the task to stop it."""
+        # Polling is background work: it leaves the end of the daily quota to users' requests
+        with background_priority():
+            while True:
+                await asyncio.sleep(self.interval)
+                try:
+                    await self.poll()
+                except Exception as e:
+                    logging.warning(f"Alert poll failed: {e}")
+
+    def start(self):
+        logging.info(f"🔔 Price alerts polled every {self.interval:.0f}s")
+        return asyncio.get_running_loop().create_task(self.run())
@@ -0,0 +1,212 @@
+import os
+import copy
+import time
+import asyncio
+import logging
+import weakref
+from collections import OrderedDict, deque
+
+from fetch_fmp import get_quotes_async, prefetched_quotes
+from process_data import get_complete_financials_async
+from metrics import QUEUE_DEPTH, QUEUE_WAIT_SECONDS
+
+# Tickers analyzed at the same time across all chats
+WORKERS = int(os.getenv("BOT_WORKERS", 16))
+# Tickers of a single chat analyzed at the same time
+CHAT_CONCURRENCY = int(os.getenv("BOT_CHAT_CONCURRENCY", 8))
+# Tickers a chat can have queued or in progress; the rest of a request is refused
+MAX_TICKERS_PER_CHAT = int(os.getenv("BOT_MAX_TICKERS_PER_CHAT", 30))
+
+
+class AnalysisJob:
+    """One /analize request: its tickers, the results so far and the callback for each finished ticker."""
+
+    def __init__(self, chat_id, tickers, on_result=None):
+        self.chat_id = chat_id
+        self.tickers = tickers
+        self.on_result = on_result
+        self.results = {}
+        self.queued_at = time.perf_counter()
+        self.quotes = None
+        self._done = asyncio.get_running_loop().create_future()
+
+    async def wait(self):
+        """Waits for every ticker. Returns the data (or None) per ticker, in request order."""
+        await self._done
+        return [self.results.get(ticker) for ticker in self.tickers]
+
+    async def _deliver(self, ticker, data):
+        if self.on_result is not None:
+            try:
+                await self.on_result(ticker, data)
+            except Exception as e:
+                logging.warning(f"Progress reply failed for {ticker}: {e}")
+        # Done only once every progress reply is out, so they all come before the summary
+        self.results[ticker] = data
+        if len(self.results) == len(self.tickers) and not self._done.done():
+            self._done.set_result(None)
+
+
+class AnalysisQueue:
+    """
+    Bounded pool of workers in front of the fetch pipeline. Each chat has its own queue of tickers
+    and the workers take turns across chats (round-robin), at most chat_concurrency tickers per chat
+    in flight, so one chat asking for 200 tickers can't starve the others.
+    A ticker queued by several chats is fetched once and delivered to all of them.
+    The quotes of a request are fetched in one batch up front (prefetch_quotes, None to skip it) and
+    served to its per-ticker fetches. Results are sent by their own tasks, so a slow reply doesn't
+    hold a worker.
+    """
+
+    def __init__(self, workers=WORKERS, chat_concurrency=CHAT_CONCURRENCY, max_tickers_per_chat=MAX_TICKERS_PER_CHAT,
+                 fetch=get_complete_financials_async, prefetch_quotes=get_quotes_async):
+        self.workers = workers
+        self.chat_concurrency = chat_concurrency
+        self.max_tickers_per_chat = max_tickers_per_chat
+        self.fetch = fetch
+        self.prefetch_quotes = prefetch_quotes
+        self._queues = OrderedDict()  # chat_id -> deque of (job, ticker), in round-robin order
+        self._in_flight = {}  # chat_id -> tickers being fetched
+        self._wakeup = asyncio.Condition()
+        self._tasks = []
+        self._deliveries = set()
+
+    def start(self):
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+
+    def alive(self):
+        """True while every worker is running (a worker that died would leave tickers waiting forever)."""
+        return bool(self._tasks) and not any(task.done() for task in self._tasks)
+
+    async def close(self):
+        for task in [*self._tasks, *self._deliveries]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._deliveries, return_exceptions=True)
+
+    def pending(self, chat_id=None):
+        """Tickers waiting for a worker (for one chat, or all)."""
+        if chat_id is not None:
+            return len(self._queues.get(chat_id, ()))
+        return sum(len(queue) for queue in self._queues.values())
+
+    def chats_ahead(self, chat_id):
+        """Chats that get a turn before chat_id's next ticker."""
+        if chat_id not in self._queues:
+            return len(self._queues)
+        return list(self._queues).index(chat_id)
+
+    async def submit(self, chat_id, tickers, on_result=None):
+        """
+        Queues the tickers of one request. on_result(ticker, data) is awaited as each ticker finishes.
+        Returns (job, refused tickers over the chat's cap, chats ahead in the queue).
+        """
+        tickers = list(dict.fromkeys(tickers))
+        room = max(0, self.max_tickers_per_chat - self.pending(chat_id) - self._in_flight.get(chat_id, 0))
+        tickers, refused = tickers[:room], tickers[room:]
+
+        job = AnalysisJob(chat_id, tickers, on_result)
+        if not tickers:
+            job._done.set_result(None)
+            return job, refused, 0
+
+        ahead = self.chats_ahead(chat_id)
+        if self.prefetch_quotes is not None:
+            # One batch request for the quotes of the whole request, instead of one per ticker
+            job.quotes = asyncio.ensure_future(self.prefetch_quotes(tickers))
+        async with self._wakeup:
+            self._queues.setdefault(chat_id, deque()).extend((job, ticker) for ticker in tickers)
+            QUEUE_DEPTH.set(self.pending())
+            self._wakeup.notify_all()
+        return job, refused, ahead
+
+    def _take(self):
+        """Next (ticker, [jobs]) in round-robin order, or None if every chat is empty or at its cap."""
+        for chat_id in list(self._queues):
+            queue = self._queues[chat_id]
+            if self._in_flight.get(chat_id, 0) >= self.chat_concurrency:
+                continue
+            job, ticker = queue.popleft()
+            # This chat's turn is over: it goes to the back of the rotation
+            self._queues.move_to_end(chat_id)
+            if not queue:
+                del self._queues[chat_id]
+            self._in_flight[chat_id] = self._in_flight.get(chat_id, 0) + 1
+
+            # Other requests waiting for the same ticker ride along with this fetch, each one
+            # taking a slot of its chat (so only while the chat is under its cap)
+            jobs = [job]
+            for other_id, other_queue in list(self._queues.items()):
+                for entry in [entry for entry in other_queue if entry[1] == ticker]:
+                    if self._in_flight.get(other_id, 0) >= self.chat_concurrency:
+                        break
+                    other_queue.remove(entry)
+                    jobs.append(entry[0])
+                    self._in_flight[other_id] = self._in_flight.get(other_id, 0) + 1
+                if not other_queue:
+                    del self._queues[other_id]
+            QUEUE_DEPTH.set(self.pending())
+            return ticker, jobs
+        return None
+
+    async def _work(self):
+        while True:
+            async with self._wakeup:
+                unit = self._take()
+                while unit is None:
+                    await self._wakeup.wait()
+                    unit = self._take()
+            ticker, jobs = unit
+
+            data = None
+            try:
+                for job in jobs:
+                    QUEUE_WAIT_SECONDS.observe(time.perf_counter() - job.queued_at)
+                try:
+                    with prefetched_quotes(await self._quotes(jobs[0])):
+                        data = await self.fetch(ticker)
+                except Exception as e:
+                    logging.warning(f"Analysis of {ticker} failed: {e}")
+            finally:
+                async with self._wakeup:
+                    for job in jobs:
+                        self._in_flight[job.chat_id] -= 1
+                        if not self._in_flight[job.chat_id]:
+                            del self._in_flight[job.chat_id]
+                    self._wakeup.notify_all()
+
+            # Replies go out on their own tasks: the worker takes the next ticker meanwhile.
+            # Every chat values its own copy of a shared ticker against its own peers.
+            for index, job in enumerate(jobs):
+                delivery = asyncio.ensure_future(job._deliver(ticker, copy.copy(data) if index and data else data))
+                self._deliveries.add(delivery)
+                delivery.add_done_callback(self._deliveries.discard)
+
+    @staticmethod
+    async def _quotes(job):
+        """The job's prefetched quotes ({} when there are none or the batch failed)."""
+        if job.quotes is None:
+            return {}
+        await asyncio.wait({job.quotes})
+        if job.quotes.cancelled() or job.quotes.exception() is not None:
+            return {}
+        return job.quotes.result()
+
+
+# One queue per event loop, like the shared HTTP client
+_queues = weakref.WeakKeyDictionary()
+
+
+def get_analysis_queue():
+    """Returns the analysis queue of the running event loop, starting its workers on first use."""
+    loop = asyncio.get_running_loop()
+    queue = _queues.get(loop)
+    if queue is None:
+        queue = _queues[loop] = AnalysisQueue()
+        queue.start()
+    return queue
+
+
+async def close_analysis_queue():
+    queue = _queues.pop(asyncio.get_running_loop(), None)
+    if queue is not None:
+        await queue.close()
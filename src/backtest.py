@@ -0,0 +1,171 @@
+import argparse
+import numpy as np
+
+from history_store import get_history_store
+from valuation import compute_valuation, valid_mask, PEER_MULTIPLES, FINAL_KEY, RECOMMENDATION_KEY, RECOMMENDATION_LABELS
+
+# History store field behind each peer multiple of the valuation engine
+MULTIPLE_FIELDS = {
+    "per": "priceEarningsRatio",
+    "ps": "priceSalesRatio",
+    "pbv": "priceToBookRatio",
+    "pcf": "priceCashFlowRatio",
+}
+
+# Multiple x per-share value gives back the price at fiscal year end; the first available pair is used
+PRICE_SOURCES = [
+    ("priceSalesRatio", "revenuePerShare"),
+    ("priceToBookRatio", "bookValuePerShare"),
+    ("priceEarningsRatio", "netIncomePerShare"),
+]
+
+# Same lookback as the live model: "5Y" ratios are 4 fiscal years before the valuation year
+DEFAULT_LOOKBACK = 4
+
+
+def load_panel(tickers, fields, store=None, period="annual"):
+    """
+    Loads the stored history of many tickers as (years, {field: array of shape (years, tickers)}),
+    with NaN wherever a ticker has no record for a year.
+    """
+    store = store or get_history_store()
+    histories = [store.load(ticker, period) for ticker in tickers]
+    known_years = [history["fiscal_year"] for history in histories if history.size]
+    if not known_years:
+        return np.empty(0, dtype=int), {field: np.empty((0, len(tickers))) for field in fields}
+
+    first = int(min(years.min() for years in known_years))
+    last = int(max(years.max() for years in known_years))
+    years = np.arange(first, last + 1)
+
+    panel = {field: np.full((len(years), len(tickers)), np.nan) for field in fields}
+    for column, history in enumerate(histories):
+        if not history.size:
+            continue
+        rows = history["fiscal_year"] - first
+        for field in fields:
+            panel[field][rows, column] = history[field]
+    return years, panel
+
+
+def shift_years(values, years):
+    """Values from `years` rows (fiscal years) earlier, NaN where there is no such year."""
+    shifted = np.full_like(values, np.nan)
+    if 0 < years < len(values):
+        shifted[years:] = values[:-years]
+    return shifted
+
+
+def fiscal_year_prices(panel):
+    """Price at each fiscal year end, rebuilt from the multiples and per-share values."""
+    prices = np.full_like(next(iter(panel.values())), np.nan)
+    for multiple_field, per_share_field in PRICE_SOURCES:
+        implied = panel[multiple_field] * panel[per_share_field]
+        prices = np.where(np.isnan(prices) & (implied > 0), implied, prices)
+    return prices
+
+
+def replay_valuation(panel, lookback=DEFAULT_LOOKBACK):
+    """
+    Replays the intrinsic value model at every past fiscal year for every ticker, in one pass:
+    peer averages are taken across the tickers of the same year (one group per year) and the
+    historical PS+PBV fair price uses the ratios from `lookback` years earlier.
+    Returns (prices, final intrinsic values, recommendations), each of shape (years, tickers).
+    """
+    prices = fiscal_year_prices(panel)
+    shape = prices.shape
+
+    ps, pbv = panel["priceSalesRatio"], panel["priceToBookRatio"]
+    past_ps, past_pbv = shift_years(ps, lookback), shift_years(pbv, lookback)
+    ok = valid_mask(prices) & valid_mask(ps) & valid_mask(pbv) & valid_mask(past_ps) & valid_mask(past_pbv)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        historical = np.where(ok, (prices * past_ps / ps + prices * past_pbv / pbv) / 2, np.nan)
+
+    year_groups = np.repeat(np.arange(shape[0]), shape[1])
+    results = compute_valuation(
+        prices.ravel(),
+        {key: panel[MULTIPLE_FIELDS[key]].ravel() for key in PEER_MULTIPLES},
+        historical.ravel(),
+        groups=year_groups,
+    )
+    return prices, results[FINAL_KEY].reshape(shape), results[RECOMMENDATION_KEY].reshape(shape)
+
+
+def forward_returns(prices, horizon=1):
+    """Return from each fiscal year end to `horizon` years later, NaN where either price is missing."""
+    future = np.full_like(prices, np.nan)
+    if 0 < horizon < len(prices):
+        future[:-horizon] = prices[horizon:]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(valid_mask(prices) & valid_mask(future), future / prices - 1, np.nan)
+
+
+def bucket_stats(recommendations, returns):
+    """Forward return statistics for each recommendation bucket (only signals with a known outcome)."""
+    stats = {}
+    known = np.isfinite(returns)
+    for label in RECOMMENDATION_LABELS:
+        bucket = returns[(recommendations == label) & known]
+        stats[str(label)] = {
+            "count": int(bucket.size),
+            "mean_return": float(bucket.mean()) if bucket.size else None,
+            "median_return": float(np.median(bucket)) if bucket.size else None,
+            "hit_rate": float((bucket > 0).mean()) if bucket.size else None,
+        }
+    return stats
+
+
+def run_backtest(tickers, horizon=1, lookback=DEFAULT_LOOKBACK, store=None):
+    """
+    Backtests the RECOMMENDATION signal over the locally stored ratio history of the tickers.
+    Returns (bucket stats, details) where details holds the (years, tickers) arrays used.
+    """
+    fields = sorted({*MULTIPLE_FIELDS.values(), *[field for pair in PRICE_SOURCES for field in pair]})
+    years, panel = load_panel(tickers, fields, store=store)
+    if not years.size:
+        return bucket_stats(np.empty(0), np.empty(0)), {"years": years}
+
+    prices, final, recommendations = replay_valuation(panel, lookback=lookback)
+    returns = forward_returns(prices, horizon=horizon)
+    details = {
+        "years": years,
+        "tickers": list(tickers),
+        "prices": prices,
+        "final_intrinsic": final,
+        "recommendations": recommendations,
+        "forward_returns": returns,
+    }
+    return bucket_stats(recommendations, returns), details
+
+
+def print_stats(stats, horizon):
+    print(f"{'Bucket':<15} {'Signals':>8} {f'Mean {horizon}Y ret':>13} {'Median':>9} {'Hit rate':>9}")
+    for label, bucket in stats.items():
+        if not bucket["count"]:
+            print(f"{label:<15} {0:>8}")
+            continue
+        print(
+            f"{label:<15} {bucket['count']:>8} {bucket['mean_return']:>13.2%} "
+            f"{bucket['median_return']:>9.2%} {bucket['hit_rate']:>9.1%}"
+        )
+
+
+if __name__ == "__main__":
+    from universe_scan import read_ticker_file
+
+    parser = argparse.ArgumentParser(description="Backtest the RECOMMENDATION signal on the stored ratio history")
+    parser.add_argument("ticker_file", help="File with tickers separated by commas, spaces or new lines")
+    parser.add_argument("--horizon", type=int, default=1, help="Years between the signal and the measured return")
+    parser.add_argument("--lookback", type=int, default=DEFAULT_LOOKBACK, help="Years back for the historical PS+PBV ratios")
+    parser.add_argument("--fetch", action="store_true", help="Download the ratios first (set FMP_RATIOS_LIMIT for more years)")
+    args = parser.parse_args()
+
+    tickers = read_ticker_file(args.ticker_file)
+    if args.fetch:
+        from process_data import get_complete_financials_batch
+        get_complete_financials_batch(tickers)
+
+    stats, details = run_backtest(tickers, horizon=args.horizon, lookback=args.lookback)
+    if details["years"].size:
+        print(f"{len(tickers)} tickers, fiscal years {details['years'][0]}-{details['years'][-1]}")
+    print_stats(stats, args.horizon)
@@ -1,19 +1,37 @@
 import os
+import asyncio
 import logging
+import datetime
 from telegram import Update
 from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes
-from process_data import get_complete_financials
-# from export_data import export_to_csv
+from fetch_fmp import close_shared_client
+from valuation import value_records
+from schema import LABELS, is_missing
+from metrics import STAGE_SECONDS, add_health_check, start_heartbeat, start_metrics_server, track_command
+from watchlist import start_watchlist_warmer
+from analysis_queue import get_analysis_queue, close_analysis_queue
+from alerts import AlertWatcher
+from export_data import REPORT_FORMATS, render_summary
+from scenarios import simulate_records
+import universe_scan
 
 # Set up logging to show bot activity in the terminal
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=logging.INFO
 )
+# httpx logs every request URL at INFO, which would leak the FMP API key into the logs
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 # Get the Telegram Bot token from the environment variable
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")  # Set this in your environment
 
+# File sent after /analize: csv, xlsx (needs openpyxl, csv is sent without it) or off
+REPORT_FORMAT = os.getenv("BOT_REPORT_FORMAT", "csv").lower()
+if REPORT_FORMAT not in (*REPORT_FORMATS, "off"):
+    logging.warning(f"Unknown BOT_REPORT_FORMAT {REPORT_FORMAT!r}, expected one of {(*REPORT_FORMATS, 'off')}, sending csv reports")
+    REPORT_FORMAT = "csv"
+
 # Dictionary of ratio explanations
 RATIO_EXPLANATIONS = {
     "per": "📈 *PER (Price to Earnings Ratio)*\nMeasures how much investors are willing to pay per dollar of earnings.\nFormula: Price / EPS\n👉 Lower PER (10–20) may indicate undervaluation, higher PER (>30) may suggest overvaluation or growth expectations.",
@@ -34,12 +52,16 @@ RATIO_EXPLANATIONS = {
 }
 
 # /help command handler
+@track_command("help")
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     help_text = (
         "📘 Available Commands:\n"
         "/start - Show welcome message\n"
         "/help - Show this help menu\n"
-        "/analize TICKER1,TICKER2 - Analyze one or more stock tickers\n\n"
+        "/analize TICKER1,TICKER2 - Analyze one or more stock tickers\n"
+        "/watch TICKER1,TICKER2 - Alert me when the price crosses the intrinsic value or the ±10% bands\n"
+        "/unwatch [TICKER1,TICKER2] - Stop the alerts (all of them without tickers), they are kept across bot restarts until then\n"
+        "/scenarios TICKER1,TICKER2 - Range of the intrinsic value over 10,000 scenarios and the chance it's Underpriced\n\n"
         "📊 Ratio Explanations:\n"
         "/per - Price to Earnings\n"
         "/ps - Price to Sales\n"
@@ -59,168 +81,287 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     await update.message.reply_text(help_text)
 
-# Format financial data into a readable text message
-def format_ratios_text(data):
-    lines = []
-
-    # Categorías definidas
-    valuation_keys = [
-        "PER (Current FMP)",
-        "PS (Current FMP)",
-        "PBV (Current FMP)",
-        "Price to Cash Flow (PCF)"
-    ]
-    liquidity_keys = [
-        "Current Ratio",
-        "Quick Ratio",
-        "Cash Ratio",
-        "Inventory Turnover",
-        "Days Inventory",
-        "Asset Turnover"
-    ]
-    intrinsic_keys = [
-        "Intrinsic Value based on Peer PER",
-        "Intrinsic Value based on Peer PS",
-        "Intrinsic Value based on Peer PBV",
-        "Intrinsic Value based on Peer PCF",
-        "Intrinsic Value based on Industry Average",
-        "Estimated Fair Price based on historical PS+PBV (5Y)",
-        "Final Intrinsic Value (Avg Industry + Historical)"
-    ]
-
-    for row in data:
-        company = row.get("Company", "Unknown")
-        lines.append(f"\n📊 *{company}*")
-
-        # PRICE
-        if "PRICE" in row:
-            lines.append(f"💵 Price: {row['PRICE']}")
-
-        # Valuation Ratios
-        lines.append("\n📈 *Valuation Ratios*")
-        for key in valuation_keys:
-            if key in row:
-                lines.append(f"- {key}: {row[key]}")
-
-        # Liquidity & Efficiency
-        lines.append("\n💰 *Liquidity & Efficiency*")
-        for key in liquidity_keys:
-            if key in row:
-                lines.append(f"- {key}: {row[key]}")
-
-        # Intrinsic Value Estimates
-        lines.append("\n🎯 *Intrinsic Value Estimates*")
-        for key in intrinsic_keys:
-            if key in row:
-                lines.append(f"- {key}: {row[key]}")
+# Telegram's character limit per message is 4096, use 4000 to be safe
+MESSAGE_LIMIT = 4000
+
+# Categorías definidas (FinancialRecord fields, shown with their schema labels)
+VALUATION_KEYS = ["per", "ps", "pbv", "pcf"]
+LIQUIDITY_KEYS = [
+    "current_ratio",
+    "quick_ratio",
+    "cash_ratio",
+    "inventory_turnover",
+    "days_inventory",
+    "asset_turnover"
+]
+INTRINSIC_KEYS = [
+    "intrinsic_per",
+    "intrinsic_ps",
+    "intrinsic_pbv",
+    "intrinsic_pcf",
+    "intrinsic_industry",
+    "fair_price_5y",
+    "intrinsic_final"
+]
+SCENARIO_KEYS = ["intrinsic_final", "intrinsic_p5", "intrinsic_p50", "intrinsic_p95"]
+
+def _metric_lines(row, keys):
+    return [f"- {LABELS[key]}: {getattr(row, key)}" for key in keys if not is_missing(getattr(row, key))]
+
+# One company's ratios as a message block, built once and reused by the chunker
+def company_block(row, include_valuation=True):
+    lines = [f"\n📊 *{row.company}*"]
+
+    # PRICE
+    if not is_missing(row.price):
+        lines.append(f"💵 Price: {row.price}")
+
+    # Valuation Ratios
+    lines.append("\n📈 *Valuation Ratios*")
+    lines.extend(_metric_lines(row, VALUATION_KEYS))
+
+    # Liquidity & Efficiency
+    lines.append("\n💰 *Liquidity & Efficiency*")
+    lines.extend(_metric_lines(row, LIQUIDITY_KEYS))
+
+    if include_valuation:
+        lines.extend(_valuation_lines(row))
+    return "\n".join(lines)
 
-        # Recommendation
-        if "RECOMMENDATION" in row:
-            lines.append(f"\n🧠 *Recommendation*: {row['RECOMMENDATION']}")
+# Intrinsic values and recommendation only, once the peers of the request are known
+def valuation_block(row):
+    return "\n".join([f"\n📊 *{row.company}*", *_valuation_lines(row)])
 
+# Format financial data into a readable text message
+def format_ratios_text(data, include_valuation=True):
+    return "\n".join(company_block(row, include_valuation) for row in data)
+
+def format_valuation_text(data):
+    return "\n".join(valuation_block(row) for row in data)
+
+def _valuation_lines(row):
+    # Intrinsic Value Estimates
+    lines = ["\n🎯 *Intrinsic Value Estimates*", *_metric_lines(row, INTRINSIC_KEYS)]
+
+    # Recommendation
+    if row.recommendation:
+        lines.append(f"\n🧠 *Recommendation*: {row.recommendation}")
+    return lines
+
+# Monte Carlo bands of one company, see scenarios.simulate_records
+def scenario_block(row):
+    lines = [f"\n🎲 *{row.company}*"]
+    if not is_missing(row.price):
+        lines.append(f"💵 Price: {row.price}")
+    if is_missing(row.prob_underpriced):
+        lines.append("Not enough data for the scenarios")
+        return "\n".join(lines)
+
+    lines.extend(_metric_lines(row, SCENARIO_KEYS))
+    lines.append(f"\n🧠 *Chance of Underpriced*: {row.prob_underpriced:.0%} (now {row.recommendation})")
     return "\n".join(lines)
 
+def chunk_blocks(blocks, limit=MESSAGE_LIMIT):
+    """
+    Packs text blocks (e.g. one per company) into messages of at most limit characters. Blocks are
+    never split, so Markdown entities like *bold* stay whole; a block over the limit is split between lines.
+    """
+    chunks, current, size = [], [], 0
+    for block in blocks:
+        for piece in [block] if len(block) <= limit else _split_lines(block, limit):
+            if current and size + 1 + len(piece) > limit:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            size += len(piece) + (1 if current else 0)
+            current.append(piece)
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+def _split_lines(block, limit):
+    pieces = []
+    for line in block.split("\n"):
+        # Only a single line over the limit is cut, there is no better boundary inside it
+        while len(line) > limit:
+            pieces.append(line[:limit])
+            line = line[limit:]
+        pieces.append(line)
+    return pieces
+
+# Tickers of a command's arguments, separated by commas or spaces, upper-cased and deduplicated
+def parse_tickers(args):
+    return universe_scan.parse_tickers(" ".join(args or []))
+
+# Summary table of valued records as an in-memory file, with the name it is sent under
+def report_document(data, file_format=REPORT_FORMAT):
+    try:
+        document = render_summary(data, file_format)
+    except ImportError as e:
+        logging.warning(f"Can't write a {file_format} report ({e}), sending a csv")
+        file_format = "csv"
+        document = render_summary(data, file_format)
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    return document, f"financial_summary_{timestamp}.{file_format}"
+
 # /start command handler
+@track_command("start")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logging.info("✅ /start command received")
     await update.message.reply_text("👋 Welcome to the Financial Analysis Bot! Use /analize followed by tickers to get started. Example: /analize GOOGL,AAPL,MSFT")
 
 # /analize command handler
+@track_command("analize")
 async def analize(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # Validate input
-    if not context.args:
+    # Parse and validate the tickers
+    tickers = parse_tickers(context.args)
+    if not tickers:
         logging.info("✅ /analize command received")
         await update.message.reply_text("❗Please provide tickers. Example: /analize GOOGL,AAPL")
         return
 
-    # Parse and clean tickers
-    tickers = [ticker.strip().upper() for ticker in context.args[0].split(",")]
-    financial_data = []
-    per_list = []
+    # Each ticker's ratios are sent as soon as they arrive, the valuation needs all of them
+    async def on_result(ticker, data):
+        with STAGE_SECONDS.time(stage="send"):
+            if data:
+                await update.message.reply_markdown(format_ratios_text([data], include_valuation=False))
+            else:
+                await update.message.reply_text(f"⚠️ Could not retrieve data for {ticker}")
+
+    # Queued behind the other chats' work, taking turns with them
+    queue = get_analysis_queue()
+    job, refused, ahead = await queue.submit(update.effective_chat.id, tickers, on_result)
+    if refused:
+        await update.message.reply_text(
+            f"⚠️ Only {queue.max_tickers_per_chat} tickers per chat can be analyzed at a time, "
+            f"skipping {', '.join(refused)}"
+        )
+    if ahead:
+        await update.message.reply_text(f"⏳ Queued behind {ahead} other chat(s), your results will follow.")
+
+    financial_data = [data for data in await job.wait() if data]
+
+    if not financial_data:
+        if not refused:
+            await update.message.reply_text("❗Could not retrieve valid data for the tickers provided.")
+        return
+
+    # Intrinsic values (peer PER/PS/PBV/PCF, industry average, final) and RECOMMENDATION,
+    # computed by the same valuation engine as the CSV export
+    with STAGE_SECONDS.time(stage="valuation"):
+        value_records(financial_data)
+
+    # Send a formatted text summary of the valuation, whole company blocks per message
+    with STAGE_SECONDS.time(stage="render"):
+        chunks = chunk_blocks([valuation_block(row) for row in financial_data])
+    with STAGE_SECONDS.time(stage="send"):
+        for chunk in chunks:
+            await update.message.reply_markdown(chunk)
+
+    # Send the summary table as a file, rendered in memory (nothing is written to ../data)
+    if REPORT_FORMAT != "off":
+        with STAGE_SECONDS.time(stage="render"):
+            document, filename = report_document(financial_data)
+        with STAGE_SECONDS.time(stage="send"):
+            await update.message.reply_document(document=document, filename=filename)
+
+# /watch command handler
+@track_command("watch")
+async def watch(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    watcher = context.bot_data["alerts"]
+    chat_id = update.effective_chat.id
+    if not context.args:
+        watched = watcher.table.for_chat(chat_id)
+        if not watched:
+            await update.message.reply_text("❗Please provide tickers. Example: /watch GOOGL,AAPL")
+            return
+        lines = ["🔔 Watching:"]
+        lines.extend(
+            f"- {ticker}: Underpriced below {lower:.2f} | Intrinsic {final:.2f} | Overpriced above {upper:.2f}"
+            for ticker, (lower, final, upper) in watched
+        )
+        for chunk in chunk_blocks(lines):
+            await update.message.reply_text(chunk)
+        return
+
+    tickers = parse_tickers(context.args)
+    if not tickers:
+        await update.message.reply_text("❗Please provide tickers. Example: /watch GOOGL,AAPL")
+        return
+
+    # Thresholds come from the same valuation as /analize (the tickers are each other's peers), computed once
+    queue = get_analysis_queue()
+    job, refused, _ = await queue.submit(chat_id, tickers)
+    financial_data = [data for data in await job.wait() if data]
+    value_records(financial_data)
+    watched, no_value, over_cap = watcher.watch(chat_id, financial_data)
 
-    # Fetch data for each ticker
-    for ticker in tickers:
-        data = get_complete_financials(ticker)
-        if data:
-            financial_data.append(data)
-            per = data.get("PER (Current FMP)")
-            if isinstance(per, (int, float)):
-                per_list.append(per)
+    lines = [
+        f"🔔 {record.company} at {record.price}: intrinsic value {record.intrinsic_final} ({record.recommendation})"
+        for record in watched
+    ]
+    if refused:
+        lines.append(f"⚠️ Only {queue.max_tickers_per_chat} tickers per chat can be analyzed at a time, skipping {', '.join(refused)}")
+    fetched = {data.company for data in financial_data}
+    unfetched = [ticker for ticker in tickers if ticker not in fetched and ticker not in refused]
+    if unfetched:
+        lines.append(f"⚠️ Could not retrieve data for {', '.join(unfetched)}")
+    if no_value:
+        lines.append(f"⚠️ Not watched, no positive intrinsic value: {', '.join(no_value)}")
+    if over_cap:
+        lines.append(f"⚠️ Not watched, a chat can watch {watcher.max_per_chat} tickers: {', '.join(over_cap)}")
+    if watched:
+        lines.append("You'll get a message when a price crosses its intrinsic value or the ±10% bands.")
+    await update.message.reply_text("\n".join(lines))
+
+# /unwatch command handler
+@track_command("unwatch")
+async def unwatch(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Without arguments every alert of the chat is stopped
+    tickers = parse_tickers(context.args) if context.args else None
+    removed = context.bot_data["alerts"].unwatch(update.effective_chat.id, tickers)
+    if removed:
+        await update.message.reply_text(f"🔕 Stopped watching {', '.join(removed)}")
+    else:
+        await update.message.reply_text("❓ Nothing to stop, see /watch for the tickers you watch.")
+
+# /scenarios command handler
+@track_command("scenarios")
+async def scenarios(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    tickers = parse_tickers(context.args)
+    if not tickers:
+        await update.message.reply_text("❗Please provide tickers. Example: /scenarios GOOGL,AAPL,MSFT")
+        return
 
+    queue = get_analysis_queue()
+    job, refused, ahead = await queue.submit(update.effective_chat.id, tickers)
+    if refused:
+        await update.message.reply_text(
+            f"⚠️ Only {queue.max_tickers_per_chat} tickers per chat can be analyzed at a time, "
+            f"skipping {', '.join(refused)}"
+        )
+    if ahead:
+        await update.message.reply_text(f"⏳ Queued behind {ahead} other chat(s), your results will follow.")
+    financial_data = [data for data in await job.wait() if data]
     if not financial_data:
         await update.message.reply_text("❗Could not retrieve valid data for the tickers provided.")
         return
-    
-    # Calculate Intrinsic Value based on Peer PER
-    peer_avg_per = sum(per_list) / len(per_list) if per_list else None
-    for row in financial_data:
-        price = row.get("PRICE")
-        ticker_per = row.get("PER (Current FMP)")
-        if price and ticker_per and peer_avg_per:
-            row["Intrinsic Value based on Peer PER"] = round((price * peer_avg_per) / ticker_per, 3)
-
-        # Additional intrinsic values: PS, PBV, PCF
-    def safe_avg(lst):
-        return sum(lst) / len(lst) if lst else None
-
-    ps_list = [r.get("PS (Current FMP)") for r in financial_data if isinstance(r.get("PS (Current FMP)"), (int, float))]
-    pbv_list = [r.get("PBV (Current FMP)") for r in financial_data if isinstance(r.get("PBV (Current FMP)"), (int, float))]
-    pcf_list = [r.get("Price to Cash Flow (PCF)") for r in financial_data if isinstance(r.get("Price to Cash Flow (PCF)"), (int, float))]
-
-    avg_ps = safe_avg(ps_list)
-    avg_pbv = safe_avg(pbv_list)
-    avg_pcf = safe_avg(pcf_list)
-
-    for row in financial_data:
-        price = row.get("PRICE")
-
-        ps = row.get("PS (Current FMP)")
-        pbv = row.get("PBV (Current FMP)")
-        pcf = row.get("Price to Cash Flow (PCF)")
-
-        val_ps = (price * avg_ps) / ps if price and ps and avg_ps else None
-        val_pbv = (price * avg_pbv) / pbv if price and pbv and avg_pbv else None
-        val_pcf = (price * avg_pcf) / pcf if price and pcf and avg_pcf else None
-
-        if val_ps: row["Intrinsic Value based on Peer PS"] = round(val_ps, 3)
-        if val_pbv: row["Intrinsic Value based on Peer PBV"] = round(val_pbv, 3)
-        if val_pcf: row["Intrinsic Value based on Peer PCF"] = round(val_pcf, 3)
-
-        # Industry average value
-        values = [v for v in [val_ps, val_pbv, val_pcf, row.get("Intrinsic Value based on Peer PER")] if v]
-        industry_avg = safe_avg(values)
-        if industry_avg:
-            row["Intrinsic Value based on Industry Average"] = round(industry_avg, 3)
-
-        # Final intrinsic value with historical PS+PBV
-        historical = row.get("Estimated Fair Price based on historical PS+PBV (5Y)")
-        if industry_avg and historical:
-            row["Final Intrinsic Value (Avg Industry + Historical)"] = round((industry_avg + historical) / 2, 3)
-
-        # Recommendation
-        final_intrinsic = row.get("Final Intrinsic Value (Avg Industry + Historical)")
-        if price and final_intrinsic:
-            diff = (final_intrinsic - price) / price
-            if diff > 0.10:
-                row["RECOMMENDATION"] = "Underpriced"
-            elif diff < -0.10:
-                row["RECOMMENDATION"] = "Overpriced"
-            else:
-                row["RECOMMENDATION"] = "Fairly Priced"
 
-    # Send a formatted text summary of the financials
-    text = format_ratios_text(financial_data)
-    #await update.message.reply_markdown(text)
-    print(text)
-    # Telegram's character limit per message is 4096, use 4000 to be safe
-    for chunk in [text[i:i + 4000] for i in range(0, len(text), 4000)]:
-        await update.message.reply_markdown(chunk)
+    # The draws take a fraction of a second per request, off the event loop so other chats aren't held up
+    with STAGE_SECONDS.time(stage="valuation"):
+        value_records(financial_data)
+        await asyncio.to_thread(simulate_records, financial_data)
 
-    # Export results to CSV and send the file to the user
-    # export_to_csv(financial_data, filename="financial_summary.csv")
-    # await update.message.reply_document(document=open("../data/financial_summary.csv", "rb"))
+    fetched = {data.company for data in financial_data}
+    missing = [ticker for ticker in tickers if ticker not in fetched and ticker not in refused]
+    blocks = [scenario_block(row) for row in financial_data]
+    if missing:
+        blocks.append(f"\n⚠️ Could not retrieve data for {', '.join(missing)}")
+    with STAGE_SECONDS.time(stage="send"):
+        for chunk in chunk_blocks(blocks):
+            await update.message.reply_markdown(chunk)
 
 # Handler for ratio explanation commands
+@track_command("explain_ratio")
 async def explain_ratio(update: Update, context: ContextTypes.DEFAULT_TYPE):
     cmd = update.message.text.lstrip("/").lower()
     explanation = RATIO_EXPLANATIONS.get(cmd)
@@ -232,30 +373,48 @@ async def explain_ratio(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # Entry point of the bot
 if __name__ == "__main__":
-    app = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
+    async def on_startup(application):
+        # Keep the FMP_WATCHLIST tickers fresh in the cache so /analize answers them from memory
+        application.bot_data["watchlist_task"] = start_watchlist_warmer()
+
+        # One price poll for every chat's /watch alerts
+        async def notify(chat_id, text):
+            await application.bot.send_message(chat_id=chat_id, text=text)
+
+        alerts = application.bot_data["alerts"] = AlertWatcher(notify)
+        alerts_task = application.bot_data["alerts_task"] = alerts.start()
+
+        # /healthz fails while the event loop is blocked, or the queue workers or the alert poll have died
+        application.bot_data["heartbeat_task"] = start_heartbeat()
+        add_health_check("analysis_queue", get_analysis_queue().alive)
+        add_health_check("alerts", lambda: not alerts_task.done())
+
+    async def on_shutdown(application):
+        for name in ("watchlist_task", "alerts_task", "heartbeat_task"):
+            task = application.bot_data.get(name)
+            if task is not None:
+                task.cancel()
+        if "alerts" in application.bot_data:
+            application.bot_data["alerts"].close()
+        await close_analysis_queue()
+        await close_shared_client()
+
+    app = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).post_init(on_startup).post_shutdown(on_shutdown).build()
 
     # Register command handlers
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("analize", analize))
     app.add_handler(CommandHandler("help", help_command))
+    app.add_handler(CommandHandler("watch", watch))
+    app.add_handler(CommandHandler("unwatch", unwatch))
+    app.add_handler(CommandHandler("scenarios", scenarios))
 
     # Register commands for explanations
     for ratio_cmd in RATIO_EXPLANATIONS.keys():
         app.add_handler(CommandHandler(ratio_cmd, explain_ratio))
 
-        # Dummy HTTP server to keep port open for Render Web Service
-    import threading
-    import http.server
-    import socketserver
-
-    def run_dummy_server():
-        port = int(os.environ.get("PORT", 10000)) # Use PORT for Render
-        handler = http.server.SimpleHTTPRequestHandler
-        with socketserver.TCPServer(("", port), handler) as httpd:
-            logging.info(f"🌐 Dummy web server running on port {port}")
-            httpd.serve_forever()
-
-    threading.Thread(target=run_dummy_server, daemon=True).start()
+    # Health check and Prometheus metrics, also keeps the port open for Render Web Service
+    start_metrics_server(int(os.environ.get("PORT", 10000)))  # Use PORT for Render
 
     print("🤖 Bot is running...")
     app.run_polling()
\ No newline at end of file
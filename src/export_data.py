@@ -1,104 +1,102 @@
+import io
+import copy
 import datetime
-import pandas as pd
+import numpy as np
+from valuation import value_records, PEER_MULTIPLES, INDUSTRY_KEY, FINAL_KEY, RECOMMENDATION_KEY
+from results_store import ResultsStore
+from schema import LABELS, METRIC_FIELDS
+
+# Formats render_summary can write in memory; xlsx also needs openpyxl (pip install openpyxl)
+REPORT_FORMATS = ("csv", "xlsx")
+
+# Rows added by the valuation engine, always shown even when no ticker could be valued
+VALUATION_ROWS = [*PEER_MULTIPLES.values(), INDUSTRY_KEY, FINAL_KEY]
+
+def _timestamped_filename():
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    return f"../data/financial_data_{timestamp}.csv"
+
+def build_summary_frame(data):
+    """Builds the wide CSV layout from valued records: metrics as rows, tickers + AVERAGE as columns."""
+    # pandas is only imported here, so outputs that don't need the frame start faster
+    import pandas as pd
+
+    # One float row per metric straight from the records, no per-ticker dicts or transpose
+    names = np.array(METRIC_FIELDS)
+    values = np.array([[getattr(row, name) for row in data] for name in names], dtype=float).reshape(len(names), len(data))
+
+    # Fetched metrics no ticker has are left out, the valuation rows are always there
+    keep = ~np.isnan(values).all(axis=1) | np.isin(names, VALUATION_ROWS)
+    names, values = names[keep], values[keep]
+
+    # AVERAGE column over the tickers that have each metric
+    counts = (~np.isnan(values)).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        averages = np.where(counts > 0, np.nansum(values, axis=1) / np.maximum(counts, 1), np.nan)
+    table = np.round(np.column_stack([values, averages]), 3).astype(object)
+
+    # RECOMMENDATION is the only text row, at the bottom; display labels are applied last
+    recommendations = np.array([*(row.recommendation or "N/A" for row in data), np.nan], dtype=object)
+    df = pd.DataFrame(
+        np.vstack([table, recommendations]),
+        index=pd.Index([*(LABELS[name] for name in names), LABELS[RECOMMENDATION_KEY]], name="RATIOS"),
+        columns=[*(row.company for row in data), "AVERAGE"],
+    )
+    return df
+
+def render_summary(data, file_format="csv"):
+    """
+    Writes the summary table of valued records to an in-memory file (BytesIO, rewound), e.g. to send it
+    with reply_document without writing to ../data. Raises ImportError for xlsx without openpyxl.
+    """
+    if file_format not in REPORT_FORMATS:
+        raise ValueError(f"Unknown report format {file_format!r}, expected one of {REPORT_FORMATS}")
+
+    df = build_summary_frame(data)
+    buffer = io.BytesIO()
+    if file_format == "xlsx":
+        df.to_excel(buffer, sheet_name="Summary", engine="openpyxl")
+    else:
+        df.to_csv(buffer, encoding="utf-8")
+    buffer.seek(0)
+    return buffer
 
 def export_to_csv(data, filename="../data/financial_data.csv"):
     """Exports financial data to a timestamped CSV file."""
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    filename = f"../data/financial_data_{timestamp}.csv"
-
-    df = pd.DataFrame(data)
-    df = df.set_index("Company").T  # Set tickers as columns, financial metrics as rows
-    df.index.name = "RATIOS"
-
-    # Calcula row: Intrinsic Value based on Peer PER
-    try:
-        prices = df.loc["PRICE"] # Extrae la fila de precios actuales, por ticker
-
-        # === Intrinsic Value by PER ===
-        pers = df.loc["PER (Current FMP)"] # Extrae la fila de PER actuales, por ticker
-        avg_per = pers.mean() # Calcula el PER promedio de todos los tickers
-        intrinsic_peer = (prices * avg_per) / pers
-        df.loc["Intrinsic Value based on Peer PER"] = intrinsic_peer
-
-        # === Intrinsic Value by PS ===
-        pss = df.loc["PS (Current FMP)"]
-        avg_ps = pss.mean()
-        intrinsic_ps = (prices * avg_ps) / pss
-        df.loc["Intrinsic Value based on Peer PS"] = intrinsic_ps
-
-        # === Intrinsic Value by PBV ===
-        pbvs = df.loc["PBV (Current FMP)"]
-        avg_pbv = pbvs.mean()
-        intrinsic_pbv = (prices * avg_pbv) / pbvs
-        df.loc["Intrinsic Value based on Peer PBV"] = intrinsic_pbv
-
-        # === Intrinsic Value by PCF ===
-        pcfs = df.loc["Price to Cash Flow (PCF)"]
-        avg_pcf = pcfs.mean()
-        intrinsic_pcf = (prices * avg_pcf) / pcfs
-        df.loc["Intrinsic Value based on Peer PCF"] = intrinsic_pcf
-
-    except Exception as e:
-        print(f"Error calculating Intrinsic Values: {e}")
-
-    # === Valor intrínseco promedio por industria ===
-    try:
-        industry_avg = (
-            df.loc["Intrinsic Value based on Peer PER"]
-            + df.loc["Intrinsic Value based on Peer PS"]
-            + df.loc["Intrinsic Value based on Peer PBV"]
-            + df.loc["Intrinsic Value based on Peer PCF"]
-            ) / 4
-        df.loc["Intrinsic Value based on Industry Average"] = industry_avg
-    except Exception as e:
-        print(f"Error calculating Industry Average Intrinsic Value: {e}")
-
-    # === Valor intrínseco final: media con valor histórico 5Y ===
-    try:
-        historical_value = df.loc["Estimated Fair Price based on historical PS+PBV (5Y)"]
-        final_intrinsic = (industry_avg + historical_value) / 2
-        df.loc["Final Intrinsic Value (Avg Industry + Historical)"] = final_intrinsic
-    except Exception as e:
-        print(f"Error calculating Final Intrinsic Value: {e}")
-
-    df = df.round(3)
-
-    # === Generate RECOMMENDATION column ===
-    try:
-        final_intrinsic = df.loc["Final Intrinsic Value (Avg Industry + Historical)"]
-        current_prices = df.loc["PRICE"]
-
-        recommendation = []
-        for ticker in df.columns:
-            intrinsic = final_intrinsic.get(ticker)
-            price = current_prices.get(ticker)
-
-            if not intrinsic or not price:
-                recommendation.append("N/A")
-            else:
-                diff = (intrinsic - price) / price
-                if diff > 0.10:
-                    recommendation.append("Underpriced")
-                elif diff < -0.10:
-                    recommendation.append("Overpriced")
-                else:
-                    recommendation.append("Fairly Priced")
-
-        df.loc["RECOMMENDATION"] = pd.Series(recommendation, index=df.columns).astype(str)
-    except Exception as e:
-        print(f"Error generating recommendation column: {e}")
-
-    # Recalculate DataFrame with AVERAGE column (correct visibility in CSV)
-    try:
-        numeric_only_df = df.apply(pd.to_numeric, errors='coerce')  # force conversion
-        averages = numeric_only_df.mean(axis=1)
-
-        # Assign the "AVERAGE" column
-        df["AVERAGE"] = averages
-        df = df.round(3)
-
-    except Exception as e:
-        print(f"Error calculating AVERAGE column: {e}")
-
-    df.to_csv(filename)
-    print(f"Data succesfully saved to {filename}")
\ No newline at end of file
+    filename = _timestamped_filename()
+
+    # Intrinsic values (peer PER/PS/PBV/PCF, industry average, final) and RECOMMENDATION
+    # come from the shared valuation engine, the same one the bot uses
+    data = value_records([copy.copy(row) for row in data])
+
+    build_summary_frame(data).to_csv(filename)
+    print(f"Data succesfully saved to {filename}")
+
+def export_results(data, csv=True, store=None, source="cli", filename=None):
+    """
+    Values the financial data and appends the run to the results store (one typed row per
+    ticker/metric). The CSV (timestamped unless filename is given) is rendered from the stored run
+    when csv=True. Returns the run_id.
+    """
+    store = store or ResultsStore()
+    data = value_records([copy.copy(row) for row in data])
+    run_id = store.append_run(data, source=source)
+    print(f"Run {run_id} saved to {store.path}")
+
+    if csv:
+        render_run_csv(run_id, store=store, filename=filename)
+    return run_id
+
+def render_run_csv(run_id, store=None, filename=None):
+    """Renders one stored run as the wide CSV view (same layout as export_to_csv)."""
+    store = store or ResultsStore()
+    filename = filename or _timestamped_filename()
+
+    records = store.run_records(run_id)
+    if not records:
+        print(f"No results stored for run {run_id}")
+        return None
+
+    build_summary_frame(records).to_csv(filename)
+    print(f"Data succesfully saved to {filename}")
+    return filename
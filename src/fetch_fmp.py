@@ -1,47 +1,114 @@
 import os
-import requests
+import asyncio
+import weakref
+import contextlib
+import contextvars
+import httpx
+from fmp_cache import get_response_cache
+from history_store import get_history_store
+from metrics import STAGE_SECONDS, COALESCED_REQUESTS, FMP_RETRIES, record_fmp_response
+from rate_limit import (
+    get_rate_limiter,
+    retry_delay,
+    parse_retry_after,
+    is_retryable,
+    QuotaExceededError,
+    MAX_RETRIES,
+    MAX_THROTTLED_RETRIES,
+    MAX_RETRY_AFTER,
+)
+from singleflight import SingleFlight
+from schema import FinancialRecord, to_float
 
 API_KEY = os.getenv("FMP_API_KEY")
 if not API_KEY:
     raise ValueError("API KEY not found. Set the 'FMP_API_KEY' environment variable.")
 
+# ✅ STABLE endpoints (replace legacy /api/v3)
+# FMP_BASE_URL can point to a local stand-in server for tests and benchmarks
+FMP_BASE_URL = os.getenv("FMP_BASE_URL", "https://financialmodelingprep.com/stable").rstrip("/")
+RATIOS_URL = f"{FMP_BASE_URL}/ratios"
+# Price-only quotes for many comma-separated symbols in one request (only the price is used)
+BATCH_QUOTE_URL = f"{FMP_BASE_URL}/batch-quote-short"
+# Quote of one symbol, for the symbols a batch request couldn't get (e.g. plans without batch endpoints)
+QUOTE_URL = f"{FMP_BASE_URL}/quote"
+# Company profile, used for the sector/industry of each ticker
+PROFILE_URL = f"{FMP_BASE_URL}/profile"
 
-def get_fmp_ratios(ticker: str):
+# Max symbols per batch quote request
+QUOTE_BATCH_SIZE = int(os.getenv("FMP_QUOTE_BATCH_SIZE", 50))
+
+REQUEST_TIMEOUT = 20
+
+# Serve ratios/quotes from the local response cache unless a call passes use_cache=False.
+# FMP_CACHE=off stops reading and writing it by default (e.g. for benchmarks against a fake server).
+CACHE_ENABLED = os.getenv("FMP_CACHE", "on").lower() not in ("0", "off", "false", "no")
+
+# How many tickers are fetched at the same time by the batch API
+DEFAULT_MAX_CONCURRENCY = 8
+
+# Annual ratio records requested per ticker; raise it (e.g. to 10) to build more history for backtests
+RATIOS_LIMIT = int(os.getenv("FMP_RATIOS_LIMIT", 5))
+
+# The "5Y" historical ratios are the ones 4 fiscal years before the latest (5 annual records)
+HISTORICAL_YEARS_BACK = 4
+
+# Connection slots of the long-lived client shared by all async callers (e.g. every bot chat)
+SHARED_CLIENT_CONCURRENCY = 32
+
+# One shared client per event loop, since an AsyncClient can't be used across loops
+_shared_clients = weakref.WeakKeyDictionary()
+
+# Requests allowed in flight per client. httpx's pool gets slow (quadratic) when many more requests
+# than connections queue up inside it, so the extra ones wait on this semaphore instead.
+_request_slots = weakref.WeakKeyDictionary()
+
+# Identical requests in flight at the same time (e.g. two chats analyzing AAPL) share one upstream call
+_in_flight = SingleFlight()
+
+# Quotes fetched ahead in one batch for the code running inside prefetched_quotes()
+_prefetched_quotes = contextvars.ContextVar("fmp_prefetched_quotes", default=None)
+# Callback of the code running inside on_request_sent(), called once its request is on its way
+_request_sent = contextvars.ContextVar("fmp_request_sent", default=None)
+
+
+def build_client(max_concurrency=DEFAULT_MAX_CONCURRENCY):
     """
-    Fetch financial ratios and price from FMP using STABLE endpoints.
-    Returns a dict with the metrics your bot/app expects, or None if it fails.
+    Creates a pooled keep-alive HTTP client for FMP.
+    Ratios requests share the pool with the quote batches, so the pool allows two connections per slot.
     """
-    ticker = ticker.strip().upper()
+    limits = httpx.Limits(
+        max_connections=max_concurrency * 2,
+        max_keepalive_connections=max_concurrency * 2,
+    )
+    client = httpx.AsyncClient(timeout=REQUEST_TIMEOUT, limits=limits)
+    _request_slots[client] = asyncio.Semaphore(max_concurrency * 2)
+    return client
 
-    # ✅ STABLE endpoints (replace legacy /api/v3)
-    ratios_url = "https://financialmodelingprep.com/stable/ratios"
-    quote_url = "https://financialmodelingprep.com/stable/quote"
 
-    # Some FMP endpoints accept optional params like period/limit.
-    # If your plan ignores them, it still returns data; if not supported, it won't break.
-    ratios_params = {
-        "symbol": ticker,
-        "apikey": API_KEY,
-        "period": "annual",
-        "limit": 5,
-    }
-    quote_params = {"symbol": ticker, "apikey": API_KEY}
+def get_shared_client():
+    """Returns the keep-alive client shared by all async callers on the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _shared_clients.get(loop)
+    if client is None or client.is_closed:
+        client = build_client(SHARED_CLIENT_CONCURRENCY)
+        _shared_clients[loop] = client
+    return client
 
-    try:
-        response_ratios = requests.get(ratios_url, params=ratios_params, timeout=20)
-        response_quote = requests.get(quote_url, params=quote_params, timeout=20)
-    except requests.RequestException as e:
-        print(f"Request error for {ticker}: {e}")
-        return None
 
-    if response_ratios.status_code != 200 or response_quote.status_code != 200:
-        print(f"Failed to retrieve data from {ticker}")
-        print(f"Ratios status: {response_ratios.status_code}, Quote status: {response_quote.status_code}")
-        return None
+async def close_shared_client():
+    """Closes the shared client of the running event loop (call it on shutdown)."""
+    client = _shared_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
 
-    ratios_data = response_ratios.json()
-    quote_data = response_quote.json()
 
+def parse_fmp_ratios(ticker, ratios_data, quote_data, five_years_ago_ratios=None):
+    """
+    Builds the FinancialRecord your bot/app expects from the raw ratios and quote payloads.
+    five_years_ago_ratios (e.g. from the history store) defaults to the 5th ratios record.
+    Returns None if the payloads don't contain usable data.
+    """
     if not isinstance(ratios_data, list) or not ratios_data:
         print(f"No ratios data available for {ticker}")
         return None
@@ -54,7 +121,8 @@ def get_fmp_ratios(ticker: str):
     latest_ratios = ratios_data[0]
 
     # 5 years ago ratios (index 4 if available)
-    five_years_ago_ratios = ratios_data[4] if len(ratios_data) > 4 else {}
+    if five_years_ago_ratios is None:
+        five_years_ago_ratios = ratios_data[4] if len(ratios_data) > 4 else {}
 
     # Price from quote endpoint
     latest_price = quote_data[0].get("price")
@@ -96,31 +164,457 @@ def get_fmp_ratios(ticker: str):
         fair_price_pbv = (latest_price * five_years_ago_ratios["priceToBookRatio"]) / current_pbv
         historical_fair_price_5y = (fair_price_ps + fair_price_pbv) / 2
 
-    fmp_ratios = {
-        "Company": ticker,
-        "PRICE": latest_price,
-        "PER (Current FMP)": current_per,
-        "PS (Current FMP)": current_ps,
-        "PBV (Current FMP)": current_pbv,
-        "5Y ago PER (P/E Ratio)": five_years_ago_ratios.get("priceEarningsRatio"),
-        "5Y ago PS (Price to Sales)": five_years_ago_ratios.get("priceSalesRatio"),
-        "5Y ago PBV (Price to Book)": five_years_ago_ratios.get("priceToBookRatio"),
-        "Estimated Fair Price based on historical PER (5Y)": price_to_historical_per,
-        "Estimated Fair Price based on historical PS (5Y)": price_to_historical_ps,
-        "Estimated Fair Price based on historical PBV (5Y)": price_to_historical_pbv,
-        "Estimated Fair Price based on historical PS+PBV (5Y)": historical_fair_price_5y,
-        "Current Ratio": latest_ratios.get("currentRatio"),
-        "Quick Ratio": latest_ratios.get("quickRatio"),
-        "Cash Ratio": latest_ratios.get("cashRatio"),
-        "Inventory Turnover": latest_ratios.get("inventoryTurnover"),
-        "Days Inventory": latest_ratios.get("daysOfInventoryOutstanding"),
-        "Asset Turnover": latest_ratios.get("assetTurnover"),
-        "Price to Cash Flow (PCF)": latest_ratios.get("priceCashFlowRatio"),
+    # Rounded to 3 decimals, NaN for anything FMP didn't return
+    return FinancialRecord(
+        company=ticker,
+        price=to_float(latest_price),
+        per=to_float(current_per),
+        ps=to_float(current_ps),
+        pbv=to_float(current_pbv),
+        per_5y=to_float(five_years_ago_ratios.get("priceEarningsRatio")),
+        ps_5y=to_float(five_years_ago_ratios.get("priceSalesRatio")),
+        pbv_5y=to_float(five_years_ago_ratios.get("priceToBookRatio")),
+        fair_price_per_5y=to_float(price_to_historical_per),
+        fair_price_ps_5y=to_float(price_to_historical_ps),
+        fair_price_pbv_5y=to_float(price_to_historical_pbv),
+        fair_price_5y=to_float(historical_fair_price_5y),
+        current_ratio=to_float(latest_ratios.get("currentRatio")),
+        quick_ratio=to_float(latest_ratios.get("quickRatio")),
+        cash_ratio=to_float(latest_ratios.get("cashRatio")),
+        inventory_turnover=to_float(latest_ratios.get("inventoryTurnover")),
+        days_inventory=to_float(latest_ratios.get("daysOfInventoryOutstanding")),
+        asset_turnover=to_float(latest_ratios.get("assetTurnover")),
+        pcf=to_float(latest_ratios.get("priceCashFlowRatio")),
+    )
+
+
+def _cache_key(params):
+    """Cache key for a request: every param except the API key, in a stable order."""
+    return "&".join(f"{name}={value}" for name, value in sorted(params.items()) if name != "apikey")
+
+
+async def _get_json(client, url, params):
+    """
+    GETs a JSON payload. Returns (status_code, payload); payload is None for non-200 responses.
+    Callers asking for the same url and params while a request is in flight share its response or error.
+    """
+    endpoint = url.rsplit("/", 1)[-1]
+    key = (url, _cache_key(params))
+    if _in_flight.in_flight(key):
+        COALESCED_REQUESTS.inc(endpoint=endpoint)
+        _notify_request_sent()
+    try:
+        return await _in_flight.do(key, lambda: _request_json(client, url, params))
+    except asyncio.TimeoutError:
+        raise httpx.TimeoutException(f"Timed out waiting for the {endpoint} request in flight") from None
+
+
+async def _request_json(client, url, params):
+    """
+    Sends a GET to FMP (no coalescing), paced by the shared rate limiter. 5xx responses and network
+    errors are retried up to MAX_RETRIES times with jittered exponential backoff; 429s have their own
+    MAX_THROTTLED_RETRIES budget and wait Retry-After when given.
+    Returns (status_code, payload) of the last attempt.
+    """
+    endpoint = url.rsplit("/", 1)[-1]
+    limiter = get_rate_limiter()
+    errors = throttles = 0
+    while True:
+        await limiter.acquire()
+        _notify_request_sent()
+        try:
+            response = await _send(client, url, params)
+        except httpx.TransportError as e:
+            record_fmp_response(endpoint, None)
+            if errors == MAX_RETRIES:
+                raise
+            delay = retry_delay(errors)
+            errors += 1
+            print(f"Retrying {endpoint} in {delay:.1f}s after a network error: {e}")
+        else:
+            status = response.status_code
+            record_fmp_response(endpoint, status)
+            if status == 200:
+                limiter.succeeded()
+                return 200, response.json()
+            if not is_retryable(status):
+                return status, None
+            if status == 429:
+                if throttles == MAX_THROTTLED_RETRIES:
+                    return status, None
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if retry_after is not None and retry_after > MAX_RETRY_AFTER:
+                    print(f"FMP asked to wait {retry_after:.0f}s before retrying {endpoint}, giving up")
+                    return status, None
+                delay = retry_delay(throttles, retry_after)
+                throttles += 1
+                # Slow every request down, not just this one
+                limiter.throttled(delay)
+            else:
+                if errors == MAX_RETRIES:
+                    return status, None
+                delay = retry_delay(errors, parse_retry_after(response.headers.get("Retry-After")))
+                errors += 1
+        FMP_RETRIES.inc(endpoint=endpoint)
+        await asyncio.sleep(delay)
+
+
+async def _send(client, url, params):
+    slots = _request_slots.get(client)
+    if slots is None:
+        return await client.get(url, params=params)
+    async with slots:
+        return await client.get(url, params=params)
+
+
+async def _get_payload(client, kind, url, params, use_cache):
+    """
+    GETs a JSON payload, serving it from the response cache while it's fresh.
+    Returns (status_code, payload); payload is None for non-200 responses.
+    """
+    key = _cache_key(params)
+    if use_cache:
+        cached = get_response_cache().get(kind, key)
+        if cached is not None:
+            _notify_request_sent()
+            return 200, cached
+
+    status, payload = await _get_json(client, url, params)
+    # Only cache usable data, so an empty answer is retried next time
+    if CACHE_ENABLED and status == 200 and isinstance(payload, list) and payload:
+        get_response_cache().set(kind, key, payload)
+    return status, payload
+
+
+@contextlib.contextmanager
+def prefetched_quotes(quotes):
+    """
+    Serves quotes already fetched in a batch ({symbol: quote record}) to the get_quotes_async calls made
+    inside the block (and tasks started from it), e.g. per-ticker fetches of a request whose quotes
+    were requested together. Symbols missing from it are fetched as usual.
+    """
+    token = _prefetched_quotes.set(quotes)
+    try:
+        yield
+    finally:
+        _prefetched_quotes.reset(token)
+
+
+@contextlib.contextmanager
+def on_request_sent(callback):
+    """
+    Calls callback() once, when the first FMP request made inside the block is on its way: it got its
+    rate-limit token (so the client's own pacing is over), joined an identical request in flight, or
+    was answered from the cache.
+    """
+    calls = []
+
+    def once():
+        if not calls:
+            calls.append(True)
+            callback()
+
+    token = _request_sent.set(once)
+    try:
+        yield
+    finally:
+        _request_sent.reset(token)
+
+
+def _notify_request_sent():
+    callback = _request_sent.get()
+    if callback is not None:
+        callback()
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+async def get_quotes_async(symbols, client=None, batch_size=QUOTE_BATCH_SIZE, use_cache=None):
+    """
+    Fetches quotes for many symbols with as few requests as possible: prefetched (see prefetched_quotes)
+    and cached quotes are reused and the rest is requested in batches of batch_size comma-separated symbols.
+    Returns {symbol: quote record}; symbols that failed are missing from the dict.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    if use_cache is None:
+        use_cache = CACHE_ENABLED
+
+    client = client or get_shared_client()
+    cache = get_response_cache() if use_cache or CACHE_ENABLED else None
+    symbols = list(dict.fromkeys(symbol.strip().upper() for symbol in symbols))
+
+    prefetched = _prefetched_quotes.get() or {}
+    quotes = {symbol: prefetched[symbol] for symbol in symbols if symbol in prefetched}
+    if use_cache:
+        for symbol in symbols:
+            if symbol in quotes:
+                continue
+            cached = cache.get("quote", symbol)
+            if cached is not None:
+                quotes[symbol] = cached
+    missing = [symbol for symbol in symbols if symbol not in quotes]
+
+    async def fetch_quotes(url, params, symbols):
+        """(status, payload) of one quote request, status None for a network error. Raises QuotaExceededError."""
+        try:
+            return await _get_json(client, url, params)
+        except QuotaExceededError:
+            raise
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"Quote request error for {', '.join(symbols)}: {e}")
+            return None, None
+
+    async def fetch_one(symbol):
+        try:
+            status, payload = await fetch_quotes(QUOTE_URL, {"symbol": symbol, "apikey": API_KEY}, [symbol])
+        except QuotaExceededError as e:
+            print(f"Quote request error for {symbol}: {e}")
+            return []
+        if status == 200 and isinstance(payload, list):
+            return payload
+        print(f"Failed to retrieve the quote for {symbol}")
+        print(f"Quote status: {status}")
+        return []
+
+    async def fetch_chunk(chunk):
+        try:
+            status, payload = await fetch_quotes(BATCH_QUOTE_URL, {"symbols": ",".join(chunk), "apikey": API_KEY}, chunk)
+        except QuotaExceededError as e:
+            print(f"Quote request error for {', '.join(chunk)}: {e}")
+            return []
+        if status == 200 and isinstance(payload, list):
+            return payload
+        print(f"Failed to retrieve quotes for {', '.join(chunk)}")
+        print(f"Quote status: {status}")
+        if len(chunk) == 1 or (status is not None and not is_retryable(status)):
+            # The batch endpoint refused the request (plans without it answer 4xx) or a single symbol
+            # is out of retries: ask the per-symbol endpoint instead
+            payloads = await asyncio.gather(*(fetch_one(symbol) for symbol in chunk))
+        else:
+            # Out of retries for the whole batch: ask for each symbol on its own rather than losing them all
+            payloads = await asyncio.gather(*(fetch_chunk([symbol]) for symbol in chunk))
+        return [quote for payload in payloads for quote in payload]
+
+    with STAGE_SECONDS.time(stage="quote_fetch"):
+        payloads = await asyncio.gather(*(fetch_chunk(chunk) for chunk in _chunks(missing, batch_size)))
+
+    for payload in payloads:
+        for quote in payload:
+            symbol = str(quote.get("symbol", "")).upper()
+            if symbol in missing:
+                quotes[symbol] = quote
+                if CACHE_ENABLED:
+                    cache.set("quote", symbol, quote)
+
+    return quotes
+
+
+def get_quotes(symbols, batch_size=QUOTE_BATCH_SIZE, use_cache=None):
+    """
+    Sync version of get_quotes_async.
+    Don't call it from a running event loop, use get_quotes_async there.
+    """
+    async def run():
+        async with build_client() as client:
+            return await get_quotes_async(symbols, client=client, batch_size=batch_size, use_cache=use_cache)
+
+    return asyncio.run(run()) if symbols else {}
+
+
+async def get_profiles_async(symbols, client=None, max_concurrency=DEFAULT_MAX_CONCURRENCY, use_cache=None):
+    """
+    Fetches the company profile (sector, industry, ...) of many symbols, at most max_concurrency at a time.
+    Profiles barely change, so they are cached for a long time.
+    Returns {symbol: profile record}; symbols that failed are missing from the dict.
+    """
+    if use_cache is None:
+        use_cache = CACHE_ENABLED
+
+    client = client or get_shared_client()
+    symbols = list(dict.fromkeys(symbol.strip().upper() for symbol in symbols))
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def fetch_one(symbol):
+        params = {"symbol": symbol, "apikey": API_KEY}
+        try:
+            async with semaphore:
+                status, payload = await _get_payload(client, "profile", PROFILE_URL, params, use_cache)
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"Profile request error for {symbol}: {e}")
+            return None
+        if status != 200 or not isinstance(payload, list) or not payload:
+            print(f"Failed to retrieve profile for {symbol}")
+            print(f"Profile status: {status}")
+            return None
+        return payload[0]
+
+    profiles = await asyncio.gather(*(fetch_one(symbol) for symbol in symbols))
+    return {symbol: profile for symbol, profile in zip(symbols, profiles) if profile}
+
+
+def _ratios_params(ticker):
+    # Some FMP endpoints accept optional params like period/limit.
+    # If your plan ignores them, it still returns data; if not supported, it won't break.
+    return {
+        "symbol": ticker,
+        "apikey": API_KEY,
+        "period": "annual",
+        "limit": RATIOS_LIMIT,
     }
 
-    # Round numeric values
-    for key, value in list(fmp_ratios.items()):
-        if isinstance(value, (int, float)):
-            fmp_ratios[key] = round(value, 3)
 
-    return fmp_ratios
+async def refresh_ratios_async(ticker, client=None):
+    """
+    Downloads the ratios of one ticker into the response cache and the history store, skipping
+    any cached copy (used to keep watched tickers warm). Returns True if fresh data was stored.
+    """
+    client = client or get_shared_client()
+    ticker = ticker.strip().upper()
+    try:
+        status, payload = await _get_payload(client, "ratios", RATIOS_URL, _ratios_params(ticker), use_cache=False)
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"Request error for {ticker}: {e}")
+        return False
+    if status != 200 or not isinstance(payload, list) or not payload:
+        print(f"Failed to refresh ratios for {ticker}")
+        print(f"Ratios status: {status}")
+        return False
+    await asyncio.to_thread(_historical_ratios, ticker, payload)
+    return True
+
+
+async def _fetch_fmp_ratios(client, ticker, quotes_task, use_cache):
+    """
+    Fetches the ratios of one ticker and combines them with its quote from the shared batch.
+    Returns None if it fails.
+    """
+    try:
+        with STAGE_SECONDS.time(stage="ratios_fetch"):
+            ratios_status, ratios_data = await _get_payload(
+                client, "ratios", RATIOS_URL, _ratios_params(ticker), use_cache
+            )
+    except httpx.HTTPError as e:
+        print(f"Request error for {ticker}: {e}")
+        return None
+    except ValueError as e:
+        print(f"Invalid JSON received for {ticker}: {e}")
+        return None
+
+    if ratios_status != 200:
+        print(f"Failed to retrieve data from {ticker}")
+        print(f"Ratios status: {ratios_status}")
+        return None
+
+    # The history files are read and written in a worker thread, off the event loop
+    five_years_ago_ratios = await asyncio.to_thread(_historical_ratios, ticker, ratios_data)
+    quote = (await quotes_task).get(ticker)
+    return parse_fmp_ratios(ticker, ratios_data, [quote] if quote else [], five_years_ago_ratios)
+
+
+def _historical_ratios(ticker, ratios_data):
+    """
+    Saves every fetched ratios record in the history store and reads the 5Y-ago ratios back from it.
+    Blocking file I/O: async callers run it with asyncio.to_thread.
+    Returns None (use the payload itself) if the store can't be used or doesn't have that year.
+    """
+    if not isinstance(ratios_data, list) or not ratios_data:
+        return None
+    try:
+        store = get_history_store()
+        store.append(ticker, ratios_data)
+        return store.years_ago(ticker, HISTORICAL_YEARS_BACK)
+    except (OSError, ValueError) as e:
+        print(f"History store error for {ticker}: {e}")
+        return None
+
+
+async def get_fmp_ratios_async(ticker, client=None, use_cache=None):
+    """
+    Async version of get_fmp_ratios, for callers already running an event loop (e.g. the bot).
+    Uses the shared keep-alive client unless one is given.
+    """
+    results = await get_fmp_ratios_batch_async([ticker], max_concurrency=1, client=client, use_cache=use_cache)
+    return results[0]
+
+
+async def get_fmp_ratios_batch_async(tickers, max_concurrency=DEFAULT_MAX_CONCURRENCY, client=None,
+                                     use_cache=None, quote_batch_size=QUOTE_BATCH_SIZE, on_result=None,
+                                     on_start=None):
+    """
+    Async version of get_fmp_ratios_batch: at most max_concurrency tickers in flight at a time.
+    Quotes for all tickers are fetched in batches while the ratios download.
+    on_start(index) is called when a ticker's ratios request is sent (past the rate limiter) and the
+    quotes batch is in, so time spent queued or paced doesn't count, and on_result(index, data) as soon
+    as each ticker is done, before the whole batch.
+    Returns a list of FinancialRecords in the same order as tickers, with None for every ticker that failed.
+    """
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1")
+    if use_cache is None:
+        use_cache = CACHE_ENABLED
+
+    client = client or get_shared_client()
+    tickers = [ticker.strip().upper() for ticker in tickers]
+    semaphore = asyncio.Semaphore(max_concurrency)
+    quotes_task = asyncio.ensure_future(
+        get_quotes_async(tickers, client=client, batch_size=quote_batch_size, use_cache=use_cache)
+    )
+
+    def started(index):
+        # Waiting for the quotes batch doesn't count either: it's shared by every ticker of the batch
+        if quotes_task.done():
+            on_start(index)
+        else:
+            quotes_task.add_done_callback(lambda _: on_start(index))
+
+    async def fetch_one(index, ticker):
+        async with semaphore:
+            if on_start is None:
+                data = await _fetch_fmp_ratios(client, ticker, quotes_task, use_cache)
+            else:
+                with on_request_sent(lambda: started(index)):
+                    data = await _fetch_fmp_ratios(client, ticker, quotes_task, use_cache)
+        if on_result is not None:
+            on_result(index, data)
+        return data
+
+    try:
+        # gather keeps the results in the same order as the input tickers
+        return list(await asyncio.gather(*(fetch_one(index, ticker) for index, ticker in enumerate(tickers))))
+    finally:
+        quotes_task.cancel()
+
+
+async def _run_batch_with_own_client(tickers, max_concurrency, use_cache, quote_batch_size):
+    """Runs a batch on a client that lives only as long as the batch (for sync callers)."""
+    async with build_client(max_concurrency) as client:
+        return await get_fmp_ratios_batch_async(
+            tickers, max_concurrency=max_concurrency, client=client, use_cache=use_cache,
+            quote_batch_size=quote_batch_size,
+        )
+
+
+def get_fmp_ratios_batch(tickers, max_concurrency=DEFAULT_MAX_CONCURRENCY, use_cache=None,
+                         quote_batch_size=QUOTE_BATCH_SIZE):
+    """
+    Fetch financial ratios and price for many tickers concurrently.
+    Returns a list of FinancialRecords in the same order as tickers, with None for every ticker that failed.
+    use_cache=False skips cached responses and downloads fresh data (which is then cached).
+    Don't call it from a running event loop, use get_fmp_ratios_batch_async there.
+    """
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1")
+    if not tickers:
+        return []
+    return asyncio.run(_run_batch_with_own_client(list(tickers), max_concurrency, use_cache, quote_batch_size))
+
+
+def get_fmp_ratios(ticker: str, use_cache=None):
+    """
+    Fetch financial ratios and price from FMP using STABLE endpoints.
+    Returns a FinancialRecord (see parse_fmp_ratios), or None if it fails.
+    """
+    return get_fmp_ratios_batch([ticker], max_concurrency=1, use_cache=use_cache)[0]
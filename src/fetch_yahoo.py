@@ -1,4 +1,5 @@
 import yfinance as yf
+from schema import FinancialRecord, to_float
 
 def get_financial_ratios_yahoo(ticker):
     """Retrieves key financial ratios from Yahoo Finance."""
@@ -16,4 +17,35 @@ def get_financial_ratios_yahoo(ticker):
         "PS (Price to Sales)": info.get("priceToSalesTrailing12Months"),
     }
 
-    return yahoo_ratios
\ No newline at end of file
+    return yahoo_ratios
+
+def parse_yahoo_info(ticker, info):
+    """
+    Maps Yahoo's info dict to the same FinancialRecord as parse_fmp_ratios, so both providers can be merged.
+    Fields Yahoo doesn't have (e.g. the 5Y ago ratios) are left missing. Returns None without a usable price.
+    """
+    price = info.get("currentPrice") or info.get("regularMarketPrice")
+    if not price:
+        print(f"No Yahoo data available for {ticker}")
+        return None
+
+    market_cap = info.get("marketCap")
+    operating_cash_flow = info.get("operatingCashflow")
+
+    # Same rounding as the FMP data
+    return FinancialRecord(
+        company=ticker,
+        price=to_float(price),
+        per=to_float(info.get("trailingPE")),
+        ps=to_float(info.get("priceToSalesTrailing12Months")),
+        pbv=to_float(info.get("priceToBook")),
+        current_ratio=to_float(info.get("currentRatio")),
+        quick_ratio=to_float(info.get("quickRatio")),
+        pcf=to_float(
+            market_cap / operating_cash_flow if market_cap and operating_cash_flow and operating_cash_flow > 0 else None
+        ),
+    )
+
+def get_normalized_ratios_yahoo(ticker):
+    """Yahoo ratios as a FinancialRecord (see parse_yahoo_info). Blocking: run it off the event loop."""
+    return parse_yahoo_info(ticker, yf.Ticker(ticker).info)
@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# On-disk cache file, next to the exported CSVs
+CACHE_PATH = os.getenv(
+    "FMP_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "fmp_cache.sqlite"),
+)
+
+# How long each kind of payload stays fresh, in seconds.
+# Annual ratios change at most once a year, quotes change all the time, profiles (sector/industry) almost never.
+DEFAULT_TTLS = {
+    "ratios": int(os.getenv("FMP_CACHE_RATIOS_TTL", 7 * 24 * 3600)),
+    "quote": int(os.getenv("FMP_CACHE_QUOTE_TTL", 60)),
+    "profile": int(os.getenv("FMP_CACHE_PROFILE_TTL", 30 * 24 * 3600)),
+}
+FALLBACK_TTL = 3600
+
+# Size bounds: least recently used entries are evicted first
+MAX_DISK_ENTRIES = 20000
+MAX_MEMORY_ENTRIES = 1024
+# Disk hits whose access time is written to SQLite together, instead of one commit per hit
+ACCESS_FLUSH_BATCH = 256
+
+
+class ResponseCache:
+    """
+    TTL cache for FMP JSON payloads, keyed by (kind, key).
+    An in-process LRU dict sits in front of a SQLite file, so hot entries never touch the disk.
+    Access times of disk hits (for LRU eviction) are written in batches: with the next set, or
+    every ACCESS_FLUSH_BATCH hits, rather than one commit per hit.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttls=None, max_disk_entries=MAX_DISK_ENTRIES,
+                 max_memory_entries=MAX_MEMORY_ENTRIES):
+        self.path = path
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_disk_entries = max_disk_entries
+        self.max_memory_entries = max_memory_entries
+
+        self._memory = OrderedDict()  # (kind, key) -> (stored_at, payload)
+        self._accessed = {}  # (kind, key) -> access time of disk hits not written to SQLite yet
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (kind, key)
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (accessed_at)")
+        self._db.commit()
+        # Rows on disk, kept up to date by set() so it doesn't count the table on every write
+        self._rows = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def ttl(self, kind):
+        return self.ttls.get(kind, FALLBACK_TTL)
+
+    def get(self, kind, key):
+        """Returns the cached payload, or None if it's missing or older than the kind's TTL."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get((kind, key))
+            if entry is not None:
+                stored_at, payload = entry
+                if now - stored_at <= self.ttl(kind):
+                    self._memory.move_to_end((kind, key))
+                    self._stats["memory_hits"] += 1
+                    return payload
+                del self._memory[(kind, key)]
+
+            row = self._db.execute(
+                "SELECT payload, stored_at FROM responses WHERE kind = ? AND key = ?", (kind, key)
+            ).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+
+            payload, stored_at = json.loads(row[0]), row[1]
+            if now - stored_at > self.ttl(kind):
+                # Left on disk: the fresh payload fetched next replaces it (or LRU eviction drops it)
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+
+            self._accessed[(kind, key)] = now
+            if len(self._accessed) >= ACCESS_FLUSH_BATCH:
+                self._flush_accessed()
+                self._db.commit()
+            self._remember(kind, key, stored_at, payload)
+            self._stats["disk_hits"] += 1
+            return payload
+
+    def set(self, kind, key, payload):
+        """
+        Stores a payload in both layers and evicts the least recently used entries past the bounds.
+        The table is only counted once the row counter passes max_disk_entries.
+        """
+        now = time.time()
+        with self._lock:
+            exists = self._db.execute(
+                "SELECT 1 FROM responses WHERE kind = ? AND key = ?", (kind, key)
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (kind, key, payload, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (kind, key, json.dumps(payload), now, now),
+            )
+            self._rows += exists is None
+            self._accessed.pop((kind, key), None)
+            # Eviction goes by access time, so the pending ones are written first
+            self._flush_accessed()
+            if self._rows > self.max_disk_entries:
+                # Counted again here: another process may have written to the same file
+                self._rows = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                overflow = self._rows - self.max_disk_entries
+                if overflow > 0:
+                    self._db.execute(
+                        "DELETE FROM responses WHERE rowid IN "
+                        "(SELECT rowid FROM responses ORDER BY accessed_at LIMIT ?)",
+                        (overflow,),
+                    )
+                    self._rows -= overflow
+                    self._stats["evictions"] += overflow
+            self._db.commit()
+            self._remember(kind, key, now, payload)
+
+    def _flush_accessed(self):
+        """Writes the pending access times in one statement (caller holds the lock and commits)."""
+        if self._accessed:
+            self._db.executemany(
+                "UPDATE responses SET accessed_at = ? WHERE kind = ? AND key = ?",
+                [(accessed_at, kind, key) for (kind, key), accessed_at in self._accessed.items()],
+            )
+            self._accessed.clear()
+
+    def _remember(self, kind, key, stored_at, payload):
+        """Puts an entry in the in-process layer (caller holds the lock)."""
+        self._memory[(kind, key)] = (stored_at, payload)
+        self._memory.move_to_end((kind, key))
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        """Hit/miss counters, plus the overall hit rate."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_entries"] = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else None
+        return stats
+
+    def clear(self):
+        """Drops every cached entry (the counters are kept)."""
+        with self._lock:
+            self._memory.clear()
+            self._accessed.clear()
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+            self._rows = 0
+
+    def close(self):
+        with self._lock:
+            self._flush_accessed()
+            self._db.commit()
+            self._db.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Returns the process-wide cache, opening the SQLite file on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+
+def cache_stats():
+    """Hit/miss counters of the process-wide cache, None until something opens it (so no file is created)."""
+    with _cache_lock:
+        cache = _cache
+    return None if cache is None else cache.stats()
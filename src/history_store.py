@@ -0,0 +1,172 @@
+import os
+import hashlib
+import threading
+import numpy as np
+
+# One .npy file per ticker and period, under data/history/<period>/
+HISTORY_DIR = os.getenv(
+    "FMP_HISTORY_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "history"),
+)
+
+# Numeric fields kept from every FMP ratios record
+RATIO_FIELDS = [
+    "priceEarningsRatio",
+    "priceSalesRatio",
+    "priceToBookRatio",
+    "priceCashFlowRatio",
+    "currentRatio",
+    "quickRatio",
+    "cashRatio",
+    "inventoryTurnover",
+    "daysOfInventoryOutstanding",
+    "assetTurnover",
+    "returnOnEquity",
+    "debtEquityRatio",
+    "netProfitMargin",
+    "revenuePerShare",
+    "netIncomePerShare",
+    "bookValuePerShare",
+    "operatingCashFlowPerShare",
+]
+
+HISTORY_DTYPE = np.dtype([("fiscal_year", "i4"), *[(field, "f8") for field in RATIO_FIELDS]])
+
+
+def fiscal_year(record):
+    """Fiscal year of an FMP ratios record (stable and legacy field names), or None."""
+    for value in (record.get("fiscalYear"), record.get("calendarYear"), str(record.get("date") or "")[:4]):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def _number(value):
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+
+
+class RatioHistoryStore:
+    """
+    Keeps every fetched ratios record per ticker/period in compact columnar .npy files, sorted by
+    fiscal year and read back memory-mapped. New fiscal years are merged in as they are fetched,
+    so historical questions (N years ago, rolling medians) never need another API call.
+    """
+
+    def __init__(self, root=HISTORY_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        # (ticker, period) -> digest of the last records merged, so an unchanged payload skips the file
+        self._merged = {}
+
+    def _path(self, ticker, period):
+        return os.path.join(self.root, period, f"{ticker.strip().upper()}.npy")
+
+    def load(self, ticker, period="annual"):
+        """All stored years of a ticker, oldest first, as a read-only memory-mapped structured array."""
+        path = self._path(ticker, period)
+        if not os.path.exists(path):
+            return np.empty(0, dtype=HISTORY_DTYPE)
+        return np.load(path, mmap_mode="r")
+
+    def append(self, ticker, records, period="annual"):
+        """
+        Merges FMP ratios records into the ticker's history (a re-fetched year replaces the stored one).
+        Returns how many fiscal years were added or changed; the file is only rewritten when that's > 0,
+        and not even read when the same records were merged before by this store.
+        """
+        rows = {}
+        for record in records or []:
+            year = fiscal_year(record) if isinstance(record, dict) else None
+            if year is not None:
+                rows.setdefault(year, tuple(_number(record.get(field)) for field in RATIO_FIELDS))
+        if not rows:
+            return 0
+
+        merge_key = (ticker.strip().upper(), period)
+        digest = hashlib.blake2b(
+            np.array([(year, *rows[year]) for year in sorted(rows)], dtype=HISTORY_DTYPE).tobytes(), digest_size=16
+        ).digest()
+        with self._lock:
+            if self._merged.get(merge_key) == digest:
+                return 0
+            stored = self.load(ticker, period)
+            known = {int(row["fiscal_year"]): tuple(row[field] for field in RATIO_FIELDS) for row in stored}
+
+            changed = [
+                year for year, values in rows.items()
+                if year not in known or not np.allclose(known[year], values, equal_nan=True)
+            ]
+            if not changed:
+                self._merged[merge_key] = digest
+                return 0
+
+            known.update({year: rows[year] for year in changed})
+            merged = np.array([(year, *known[year]) for year in sorted(known)], dtype=HISTORY_DTYPE)
+
+            path = self._path(ticker, period)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp.npy"
+            np.save(temp_path, merged)
+            os.replace(temp_path, path)
+            self._merged[merge_key] = digest
+            return len(changed)
+
+    def record_for_year(self, ticker, year, period="annual"):
+        """Ratios of one fiscal year as a dict keyed like the FMP payload (None for missing values), or None."""
+        history = self.load(ticker, period)
+        matches = np.flatnonzero(history["fiscal_year"] == year)
+        if not matches.size:
+            return None
+        row = history[matches[0]]
+        return {field: (None if np.isnan(row[field]) else float(row[field])) for field in RATIO_FIELDS}
+
+    def years_ago(self, ticker, years, period="annual"):
+        """Ratios from `years` fiscal years before the latest stored one, or None if that year isn't stored."""
+        history = self.load(ticker, period)
+        if not history.size:
+            return None
+        return self.record_for_year(ticker, int(history["fiscal_year"][-1]) - years, period)
+
+    def rolling_median(self, ticker, field, years, period="annual"):
+        """
+        Median of `field` over each trailing window of `years` fiscal years, ignoring missing values.
+        Returns (fiscal years, medians); windows with no data are NaN.
+        """
+        history = self.load(ticker, period)
+        if history.size < years or years < 1:
+            return np.empty(0, dtype=int), np.empty(0)
+
+        # Index by calendar position so gaps in the fiscal years count as missing data
+        first, last = int(history["fiscal_year"][0]), int(history["fiscal_year"][-1])
+        values = np.full(last - first + 1, np.nan)
+        values[history["fiscal_year"] - first] = history[field]
+        if values.size < years:
+            return np.empty(0, dtype=int), np.empty(0)
+
+        windows = np.lib.stride_tricks.sliding_window_view(values, years)
+        medians = np.full(len(windows), np.nan)
+        has_data = ~np.isnan(windows).all(axis=1)
+        medians[has_data] = np.nanmedian(windows[has_data], axis=1)
+        return np.arange(first + years - 1, last + 1), medians
+
+    def median(self, ticker, field, years, period="annual"):
+        """Median of `field` over the latest `years` fiscal years, or None without data."""
+        history = self.load(ticker, period)
+        if not history.size:
+            return None
+        recent = history[history["fiscal_year"] > history["fiscal_year"][-1] - years][field]
+        recent = recent[~np.isnan(recent)]
+        return float(np.median(recent)) if recent.size else None
+
+
+_store = None
+
+
+def get_history_store():
+    """Returns the process-wide history store."""
+    global _store
+    if _store is None:
+        _store = RatioHistoryStore()
+    return _store
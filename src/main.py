@@ -1,24 +1,129 @@
-from process_data import get_complete_financials
-from export_data import export_to_csv
-
-# User input system for ticker selection
-def get_user_tickers():
-    """Prompts the user to input stock tickers dynamically"""
-    tickers = input("Enter stock tickers separated by commas (e.g., GOOGL, AAPL, MSFT): ")
-    return [ticker.upper().strip() for ticker in tickers.split(",")]
-
-# Get user-selected tickers
-tickers = get_user_tickers()
-
-# Retieves ratios for each company
-financial_data = []
-for ticker in tickers:
-    data = get_complete_financials(ticker) # Call function only one due to API is rate-limited
-    if data is not None:
-        financial_data.append(data)
-
-# Export results to CSV
-if financial_data:
-    export_to_csv(financial_data)
-else:
-    print("Not valid financial data available")
\ No newline at end of file
+import sys
+import json
+import argparse
+import contextlib
+
+from fetch_fmp import DEFAULT_MAX_CONCURRENCY
+from process_data import get_complete_financials_batch
+from universe_scan import parse_tickers, read_ticker_file
+
+# csv: wide CSV view (needs pandas); json/jsonl: one object per ticker, keyed by the display labels
+OUTPUT_FORMATS = ("csv", "json", "jsonl")
+
+# --cache value -> use_cache argument of the fetch functions (None follows FMP_CACHE)
+CACHE_MODES = {"auto": None, "on": True, "off": False}
+
+
+def positive_int(value):
+    """argparse type for counts that must be at least 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}") from None
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Fetch, value and export financial ratios for a list of tickers",
+        epilog="Tickers can also be piped in: cat tickers.txt | python main.py --output-format jsonl",
+    )
+    parser.add_argument("tickers", nargs="*", help="Tickers separated by commas or spaces ('-' reads stdin)")
+    parser.add_argument("-f", "--file", help="File with tickers separated by commas, spaces or new lines")
+    parser.add_argument("-w", "--workers", type=positive_int, default=DEFAULT_MAX_CONCURRENCY, help="Tickers fetched at the same time")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="csv")
+    parser.add_argument("-o", "--output", help="Output file (default: timestamped CSV in ../data, stdout for json/jsonl)")
+    parser.add_argument("--cache", choices=sorted(CACHE_MODES), default="auto",
+                        help="Read the response cache (auto follows FMP_CACHE)")
+    parser.add_argument("--no-store", action="store_true", help="Don't append the run to the results store")
+    parser.add_argument("--scenarios", type=int, default=0, metavar="DRAWS",
+                        help="Monte Carlo draws per ticker: adds P5/P50/P95 of the final intrinsic value and "
+                             "the probability of Underpriced to the output (e.g. 10000)")
+    parser.add_argument("--seed", type=int, help="Random seed of the scenarios, for reproducible output")
+    return parser.parse_args(argv)
+
+
+def read_tickers(args, stdin=sys.stdin):
+    """Tickers from the arguments, the --file and stdin (when '-' is given or something is piped in), deduplicated."""
+    tickers = parse_tickers(" ".join(ticker for ticker in args.tickers if ticker != "-"))
+    if args.file:
+        tickers.extend(read_ticker_file(args.file))
+    if "-" in args.tickers or (not tickers and not stdin.isatty()):
+        tickers.extend(parse_tickers(stdin.read()))
+    return list(dict.fromkeys(tickers))
+
+
+def write_records(records, output_format, output):
+    """Writes valued records as JSON (a list) or JSON lines, with NaN values left out."""
+    rows = [record.to_labels() for record in records]
+    if output_format == "json":
+        json.dump(rows, output, indent=2)
+        output.write("\n")
+    else:
+        for row in rows:
+            output.write(json.dumps(row) + "\n")
+
+
+def export(financial_data, args, stdout):
+    """Exports the fetched records in the chosen format (json/jsonl to stdout without --output). Only csv imports pandas."""
+    if args.output_format == "csv":
+        from export_data import export_results
+
+        if args.no_store:
+            from results_store import ResultsStore
+            # The CSV is rendered from the stored run, so it goes through a throwaway store
+            export_results(financial_data, store=ResultsStore(":memory:"), filename=args.output)
+        else:
+            export_results(financial_data, filename=args.output)
+        return
+
+    from valuation import value_records
+
+    value_records(financial_data)
+    if not args.no_store:
+        from results_store import ResultsStore
+
+        store = ResultsStore()
+        run_id = store.append_run(financial_data, source="cli")
+        print(f"Run {run_id} saved to {store.path}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            write_records(financial_data, args.output_format, output)
+        print(f"Data succesfully saved to {args.output}", file=sys.stderr)
+    else:
+        write_records(financial_data, args.output_format, stdout)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    tickers = read_tickers(args)
+    if not tickers:
+        print("No tickers given. Example: python main.py GOOGL,AAPL,MSFT (or --file, or pipe them in)", file=sys.stderr)
+        return 2
+
+    # With JSON on stdout, progress and skip messages go to stderr so the output stays parseable
+    stdout = sys.stdout
+    to_stdout = args.output_format != "csv" and not args.output
+    with contextlib.redirect_stdout(sys.stderr) if to_stdout else contextlib.nullcontext():
+        # Retrieves ratios for all companies concurrently (results keep the input order)
+        results = get_complete_financials_batch(tickers, max_concurrency=args.workers, use_cache=CACHE_MODES[args.cache])
+        financial_data = [data for data in results if data is not None]
+        if not financial_data:
+            print("Not valid financial data available")
+            return 1
+
+        if args.scenarios > 0:
+            from scenarios import simulate_records
+
+            simulate_records(financial_data, draws=args.scenarios, seed=args.seed)
+
+        export(financial_data, args, stdout)
+    print(f"{len(financial_data)} of {len(tickers)} tickers exported", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,348 @@
+import os
+import time
+import json
+import asyncio
+import logging
+import threading
+import functools
+import contextlib
+import http.server
+
+# Latency buckets in seconds, from cache hits to slow upstream calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Seconds between two heartbeats of the bot's event loop, and how late one can be before /healthz fails
+HEARTBEAT_INTERVAL = 5
+HEARTBEAT_TIMEOUT = float(os.getenv("HEALTH_HEARTBEAT_TIMEOUT", 30))
+
+_START_TIME = time.time()
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = [*zip(labelnames, values), *extra]
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonic count, e.g. requests or errors."""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. requests in flight."""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextlib.contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (latencies) in cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, observations = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, observations + 1)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observes how long the with-block took (also works around awaits)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, observations) in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {observations}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {observations}")
+        return lines
+
+
+class Registry:
+    """Holds the metrics and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """collector() returns metrics computed at scrape time (e.g. from cache stats)."""
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                for metric in collector():
+                    lines.extend(metric.render())
+            except Exception as e:
+                logging.warning(f"Metrics collector failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "fmp_stage_seconds",
+    "Time spent in each pipeline stage (ratios_fetch, quote_fetch, valuation, render, send)",
+    ["stage"],
+))
+FMP_REQUESTS = REGISTRY.register(Counter(
+    "fmp_requests_total", "Requests sent to FMP by endpoint and HTTP status (or 'error')", ["endpoint", "status"]
+))
+FMP_ERRORS = REGISTRY.register(Counter(
+    "fmp_api_errors_total", "FMP requests that failed (network error or non-200 status)", ["endpoint"]
+))
+FMP_RATE_LIMITED = REGISTRY.register(Counter(
+    "fmp_rate_limited_total", "FMP responses with status 429", ["endpoint"]
+))
+FMP_RETRIES = REGISTRY.register(Counter(
+    "fmp_retries_total", "FMP requests retried after a 429, a 5xx or a network error", ["endpoint"]
+))
+RATE_LIMIT_WAIT_SECONDS = REGISTRY.register(Counter(
+    "fmp_rate_limit_wait_seconds_total", "Time requests spent waiting for the rate limiter"
+))
+QUOTA_USED = REGISTRY.register(Gauge(
+    "fmp_daily_quota_used", "FMP requests counted against today's quota (UTC)"
+))
+COALESCED_REQUESTS = REGISTRY.register(Counter(
+    "fmp_coalesced_requests_total", "FMP requests that joined an identical request already in flight", ["endpoint"]
+))
+WATCHLIST_REFRESHES = REGISTRY.register(Counter(
+    "watchlist_refreshes_total", "Watched tickers refreshed in the background, by kind and outcome", ["kind", "outcome"]
+))
+PROVIDER_FALLBACKS = REGISTRY.register(Counter(
+    "provider_fallbacks_total", "Tickers also requested from the fallback provider, because FMP was slow or failed",
+    ["reason"],
+))
+PROVIDER_FIELDS = REGISTRY.register(Counter(
+    "provider_fields_served_total", "Fields of the returned ticker data, by the provider that served them", ["provider"]
+))
+TICKERS_SKIPPED = REGISTRY.register(Counter(
+    "tickers_skipped_total", "Tickers skipped because their data couldn't be retrieved"
+))
+COMMAND_SECONDS = REGISTRY.register(Histogram(
+    "bot_command_seconds", "Latency of each bot command, from update to last reply", ["command"]
+))
+COMMANDS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "bot_commands_in_flight", "Bot commands currently being handled", ["command"]
+))
+COMMAND_ERRORS = REGISTRY.register(Counter(
+    "bot_command_errors_total", "Bot commands that raised an exception", ["command"]
+))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "analysis_queue_depth", "Tickers waiting in the analysis queue for a worker"
+))
+QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "analysis_queue_wait_seconds", "Time a ticker waited in the analysis queue before a worker took it"
+))
+ALERTS_WATCHED = REGISTRY.register(Gauge(
+    "price_alerts_watched", "(chat, ticker) pairs watched with /watch"
+))
+ALERTS_SENT = REGISTRY.register(Counter(
+    "price_alerts_sent_total", "Price alerts sent because a price crossed a threshold"
+))
+
+
+def record_fmp_response(endpoint, status):
+    """Counts one FMP response (status is an HTTP code, or None for a network error)."""
+    FMP_REQUESTS.inc(endpoint=endpoint, status=status if status is not None else "error")
+    if status != 200:
+        FMP_ERRORS.inc(endpoint=endpoint)
+    if status == 429:
+        FMP_RATE_LIMITED.inc(endpoint=endpoint)
+
+
+def _cache_metrics():
+    """Response cache counters, read at scrape time."""
+    from fmp_cache import cache_stats
+
+    stats = cache_stats()
+    if stats is None:
+        # Not opened in this process (e.g. FMP_CACHE=off): nothing to report
+        return []
+    hits = Counter("fmp_cache_hits_total", "Response cache hits by layer", ["layer"])
+    hits.inc(stats["memory_hits"], layer="memory")
+    hits.inc(stats["disk_hits"], layer="disk")
+    misses = Counter("fmp_cache_misses_total", "Response cache misses (including expired entries)")
+    misses.inc(stats["misses"])
+    hit_rate = Gauge("fmp_cache_hit_rate", "Share of response cache lookups served from the cache")
+    hit_rate.set(stats["hit_rate"] or 0)
+    return [hits, misses, hit_rate]
+
+
+REGISTRY.add_collector(_cache_metrics)
+
+# name -> check() returning True while that part of the bot works, see add_health_check
+_HEALTH_CHECKS = {}
+
+
+def add_health_check(name, check):
+    """Makes /healthz fail (503) while check() is falsy or raises. check runs in the server's thread."""
+    _HEALTH_CHECKS[name] = check
+
+
+def health():
+    """(healthy, {check name: passed}). Not healthy before the first check is added, i.e. while starting."""
+    results = {}
+    for name, check in list(_HEALTH_CHECKS.items()):
+        try:
+            results[name] = bool(check())
+        except Exception as e:
+            logging.warning(f"Health check {name} failed: {e}")
+            results[name] = False
+    return bool(results) and all(results.values()), results
+
+
+def start_heartbeat(interval=HEARTBEAT_INTERVAL, timeout=HEARTBEAT_TIMEOUT):
+    """
+    Beats every interval seconds on the running event loop and adds the "event_loop" health check,
+    which fails once a beat is timeout seconds late: the loop is blocked or has stopped.
+    """
+    last_beat = [time.monotonic()]
+
+    async def beat():
+        while True:
+            last_beat[0] = time.monotonic()
+            await asyncio.sleep(interval)
+
+    task = asyncio.get_running_loop().create_task(beat())
+    add_health_check("event_loop", lambda: not task.done() and time.monotonic() - last_beat[0] < timeout)
+    return task
+
+
+def track_command(command):
+    """Decorator for bot handlers: in-flight gauge, latency histogram and error counter per command."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            with COMMANDS_IN_FLIGHT.track_inprogress(command=command), COMMAND_SECONDS.time(command=command):
+                try:
+                    return await handler(*args, **kwargs)
+                except Exception:
+                    COMMAND_ERRORS.inc(command=command)
+                    raise
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        status = 200
+        if path == "/healthz":
+            healthy, checks = health()
+            status = 200 if healthy else 503
+            body = json.dumps({
+                "status": "ok" if healthy else ("starting" if not checks else "down"),
+                "uptime_s": round(time.time() - _START_TIME, 1),
+                "checks": checks,
+            }).encode()
+            content_type = "application/json"
+        elif path == "/metrics":
+            body = REGISTRY.render().encode()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        # Render's health checks may use HEAD
+        path = self.path.split("?", 1)[0]
+        if path == "/healthz":
+            self.send_response(200 if health()[0] else 503)
+        else:
+            self.send_response(200 if path == "/metrics" else 404)
+        self.end_headers()
+
+
+def start_metrics_server(port, host=""):
+    """Serves /healthz and /metrics from a background thread. Returns the server."""
+    server = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"🌐 Metrics server running on port {server.server_address[1]} (/healthz, /metrics)")
+    return server
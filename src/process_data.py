@@ -1,17 +1,254 @@
-# from fetch_yahoo import get_financial_ratios_yahoo
-from fetch_fmp import get_fmp_ratios
+import os
+import copy
+import asyncio
+import weakref
+from fetch_fmp import (
+    get_fmp_ratios_batch_async,
+    build_client,
+    DEFAULT_MAX_CONCURRENCY,
+)
+from metrics import TICKERS_SKIPPED, PROVIDER_FALLBACKS, PROVIDER_FIELDS
+from schema import METRIC_FIELDS, is_missing
 
-def get_complete_financials(ticker):
+# Ask Yahoo Finance too when FMP fails, or hasn't answered a ticker within the hedge budget (seconds)
+YAHOO_FALLBACK = os.getenv("YAHOO_FALLBACK", "on").lower() not in ("0", "off", "false", "no")
+HEDGE_AFTER = float(os.getenv("YAHOO_HEDGE_AFTER", 3.0))
+
+# Yahoo calls (blocking, one thread each) allowed at the same time
+YAHOO_MAX_CONCURRENCY = 4
+
+# Fallback calls in flight per event loop and provider class, shared by every ProviderLayer: the bot builds
+# one layer per ticker, so a semaphore per layer wouldn't cap the process
+_fallback_slots = weakref.WeakKeyDictionary()
+
+class Provider:
+    """
+    A source of ticker data. Subclasses implement fetch (or fetch_many, to batch requests) and return
+    a FinancialRecord, or None for a ticker they can't serve.
+    """
+    name = None
+    max_concurrency = DEFAULT_MAX_CONCURRENCY
+
+    async def fetch(self, ticker):
+        raise NotImplementedError
+
+    async def fetch_many(self, tickers, on_result, on_start=None):
+        """
+        Fetches every ticker, calling on_start(index) when its request starts (it has left the queue)
+        and on_result(index, data) as each one completes.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def fetch_one(index, ticker):
+            async with semaphore:
+                if on_start is not None:
+                    on_start(index)
+                try:
+                    data = await self.fetch(ticker)
+                except Exception as e:
+                    print(f"{self.name} error for {ticker}: {e}")
+                    data = None
+            on_result(index, data)
+
+        await asyncio.gather(*(fetch_one(index, ticker) for index, ticker in enumerate(tickers)))
+
+class FMPProvider(Provider):
+    name = "FMP"
+
+    def __init__(self, client=None, max_concurrency=DEFAULT_MAX_CONCURRENCY, use_cache=None):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.use_cache = use_cache
+
+    async def fetch(self, ticker):
+        results = await get_fmp_ratios_batch_async(
+            [ticker], max_concurrency=1, client=self.client, use_cache=self.use_cache
+        )
+        return results[0]
+
+    async def fetch_many(self, tickers, on_result, on_start=None):
+        # One batch, so the quotes of all tickers still come from a few batch requests
+        await get_fmp_ratios_batch_async(
+            tickers, max_concurrency=self.max_concurrency, client=self.client, use_cache=self.use_cache,
+            on_result=on_result, on_start=on_start,
+        )
+
+class YahooProvider(Provider):
+    name = "Yahoo"
+    max_concurrency = YAHOO_MAX_CONCURRENCY
+
+    async def fetch(self, ticker):
+        # yfinance is only imported when Yahoo is actually asked for something
+        from fetch_yahoo import get_normalized_ratios_yahoo
+
+        # yfinance blocks, so it runs in a worker thread instead of on the event loop
+        return await asyncio.to_thread(get_normalized_ratios_yahoo, ticker)
+
+class ProviderLayer:
     """
-    Combines financial data from Yahoo Finance and FMP API
+    Fetches tickers from a primary provider, hedged by a fallback provider: a ticker the primary
+    hasn't answered within hedge_after seconds of sending its request (time spent queued for a slot
+    or paced by the rate limiter doesn't count) is also requested from the fallback (the first usable answer wins), and a ticker
+    the primary fails on is requested from the fallback right away.
+    Fields missing from the winning answer are filled from the other one when it's already there.
     """
-    # yahoo_data = get_financial_ratios_yahoo(ticker)
-    fmp_data = get_fmp_ratios(ticker)
 
-    if not fmp_data:
-        print(f"Skipping {ticker} due to missing data")
+    def __init__(self, primary, fallback=None, hedge_after=HEDGE_AFTER):
+        self.primary = primary
+        self.fallback = fallback
+        self.hedge_after = hedge_after
+
+    async def fetch_many(self, tickers):
+        """Returns a FinancialRecord (or None) per ticker, in the same order as tickers."""
+        loop = asyncio.get_running_loop()
+        answers = [loop.create_future() for _ in tickers]
+        started = [loop.create_future() for _ in tickers]
+
+        def on_start(index):
+            if not started[index].done():
+                started[index].set_result(None)
+
+        def on_result(index, data):
+            on_start(index)
+            if not answers[index].done():
+                answers[index].set_result(data)
+
+        def on_primary_done(task):
+            if not task.cancelled() and task.exception() is not None:
+                print(f"{self.primary.name} error: {task.exception()}")
+            # Tickers a failed batch didn't get to count as failed, so they fall back
+            for index in range(len(tickers)):
+                on_result(index, None)
+
+        primary_task = asyncio.ensure_future(self.primary.fetch_many(tickers, on_result, on_start))
+        primary_task.add_done_callback(on_primary_done)
+        try:
+            return list(await asyncio.gather(*(
+                self._resolve(ticker, answer, start) for ticker, answer, start in zip(tickers, answers, started)
+            )))
+        finally:
+            primary_task.cancel()
+
+    async def _resolve(self, ticker, primary_answer, primary_started):
+        if self.fallback is None:
+            return _merge(ticker, [(self.primary.name, await primary_answer)])
+
+        # The hedge budget starts when the primary sends the request, not while it waits for a slot or a token
+        await primary_started
+        done, _ = await asyncio.wait({primary_answer}, timeout=self.hedge_after)
+        if done and primary_answer.result():
+            return _merge(ticker, [(self.primary.name, primary_answer.result())])
+
+        PROVIDER_FALLBACKS.inc(reason="failed" if done else "slow")
+        fallback_task = asyncio.ensure_future(self._fetch_fallback(ticker))
+        pending = {fallback_task} if done else {fallback_task, primary_answer}
+        try:
+            while pending:
+                finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if any(future.result() for future in finished):
+                    break
+        finally:
+            fallback_task.cancel()
+
+        # The primary's data comes first when both answered; the other one only fills the gaps
+        answers = [
+            (provider.name, future.result())
+            for provider, future in ((self.primary, primary_answer), (self.fallback, fallback_task))
+            if future.done() and not future.cancelled() and future.result()
+        ]
+        return _merge(ticker, answers)
+
+    async def _fetch_fallback(self, ticker):
+        async with _fallback_semaphore(self.fallback):
+            try:
+                return await self.fallback.fetch(ticker)
+            except Exception as e:
+                print(f"{self.fallback.name} error for {ticker}: {e}")
+                return None
+
+def _fallback_semaphore(provider):
+    slots = _fallback_slots.setdefault(asyncio.get_running_loop(), {})
+    kind = type(provider)
+    if kind not in slots:
+        slots[kind] = asyncio.Semaphore(provider.max_concurrency)
+    return slots[kind]
+
+def _merge(ticker, answers):
+    """
+    Merges (provider name, record) answers field by field, the first answer with a value wins.
+    The record keeps its provider, and the fields another provider filled in are listed in its sources.
+    """
+    answers = [(name, data) for name, data in answers if data]
+    if not answers:
         return None
-    
-    # Merge Yahoo and FMP data
-    # complete_data = {**yahoo_data, **fmp_data}
-    return fmp_data
\ No newline at end of file
+    provider, record = answers[0]
+    record = copy.copy(record)
+    record.company, record.provider = ticker, provider
+    for name in METRIC_FIELDS:
+        if not is_missing(getattr(record, name)):
+            continue
+        for other_provider, other in answers[1:]:
+            value = getattr(other, name)
+            if not is_missing(value):
+                setattr(record, name, value)
+                record.sources = {**(record.sources or {}), name: other_provider}
+                break
+    for name in {provider, *(record.sources or {}).values()}:
+        PROVIDER_FIELDS.inc(sum(record.source(field) == name for field in METRIC_FIELDS), provider=name)
+    return record
+
+def default_layer(client=None, max_concurrency=DEFAULT_MAX_CONCURRENCY, use_cache=None):
+    """FMP hedged by Yahoo Finance (unless YAHOO_FALLBACK=off)."""
+    fallback = YahooProvider() if YAHOO_FALLBACK else None
+    return ProviderLayer(FMPProvider(client, max_concurrency, use_cache), fallback)
+
+def get_complete_financials(ticker, use_cache=None):
+    """
+    Combines financial data from Yahoo Finance and FMP API.
+    Returns a FinancialRecord, or None if no provider could serve the ticker.
+    """
+    return get_complete_financials_batch([ticker], max_concurrency=1, use_cache=use_cache)[0]
+
+def get_complete_financials_batch(tickers, max_concurrency=DEFAULT_MAX_CONCURRENCY, use_cache=None, layer=None):
+    """
+    Same as get_complete_financials for many tickers, fetched concurrently.
+    Returns a list of FinancialRecords in the same order as tickers, with None for every skipped ticker.
+    Don't call it from a running event loop, use get_complete_financials_batch_async there.
+    """
+    if not tickers:
+        return []
+
+    async def run():
+        async with build_client(max_concurrency) as client:
+            return await get_complete_financials_batch_async(
+                tickers, max_concurrency=max_concurrency, use_cache=use_cache,
+                layer=layer or default_layer(client, max_concurrency, use_cache),
+            )
+
+    return asyncio.run(run())
+
+async def get_complete_financials_async(ticker, use_cache=None, layer=None):
+    """
+    Async version of get_complete_financials, awaited by the bot so it never blocks the event loop
+    """
+    results = await get_complete_financials_batch_async([ticker], max_concurrency=1, use_cache=use_cache, layer=layer)
+    return results[0]
+
+async def get_complete_financials_batch_async(tickers, max_concurrency=DEFAULT_MAX_CONCURRENCY, use_cache=None,
+                                              layer=None):
+    """
+    Async version of get_complete_financials_batch. layer replaces the default providers (e.g. stubs).
+    """
+    tickers = [ticker.strip().upper() for ticker in tickers]
+    layer = layer or default_layer(max_concurrency=max_concurrency, use_cache=use_cache)
+    results = await layer.fetch_many(tickers)
+    return _skip_missing(tickers, results)
+
+def _skip_missing(tickers, results):
+    """Reports skipped tickers and normalizes empty results to None"""
+    for ticker, data in zip(tickers, results):
+        if not data:
+            print(f"Skipping {ticker} due to missing data")
+            TICKERS_SKIPPED.inc()
+
+    return [data or None for data in results]
@@ -0,0 +1,260 @@
+import os
+import time
+import random
+import sqlite3
+import asyncio
+import datetime
+import threading
+import contextlib
+import contextvars
+import email.utils
+
+import httpx
+
+from metrics import QUOTA_USED, RATE_LIMIT_WAIT_SECONDS
+
+# Requests per minute and per day of each FMP plan (daily 0 = no daily cap).
+# "unlimited" turns pacing off, e.g. for benchmarks against the local fake server.
+PLANS = {
+    "basic": {"per_minute": 60, "daily": 250},
+    "starter": {"per_minute": 300, "daily": 0},
+    "premium": {"per_minute": 750, "daily": 0},
+    "ultimate": {"per_minute": 3000, "daily": 0},
+    "unlimited": {"per_minute": 0, "daily": 0},
+}
+PLAN = os.getenv("FMP_PLAN", "starter").lower()
+if PLAN not in PLANS:
+    raise ValueError(f"Unknown FMP_PLAN '{PLAN}', expected one of: {', '.join(PLANS)}")
+
+RATE_PER_MINUTE = float(os.getenv("FMP_RATE_PER_MINUTE", PLANS[PLAN]["per_minute"]))
+# Requests allowed back to back before pacing kicks in (defaults to one second worth of requests)
+RATE_BURST = int(os.getenv("FMP_RATE_BURST", max(1, RATE_PER_MINUTE // 60)))
+DAILY_QUOTA = int(os.getenv("FMP_DAILY_QUOTA", PLANS[PLAN]["daily"]))
+# Part of the daily quota kept for interactive requests: background work (watchlist) stops before it
+QUOTA_RESERVE = int(os.getenv("FMP_QUOTA_RESERVE", DAILY_QUOTA // 10))
+# Requests counted per UTC day, shared by every process (bot, batch CLI) using the same file
+QUOTA_PATH = os.getenv(
+    "FMP_QUOTA_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "fmp_quota.sqlite"),
+)
+# What to do once the quota is used up: "refuse" fails the request, "defer" waits for the daily reset (UTC)
+QUOTA_EXHAUSTED = os.getenv("FMP_QUOTA_EXHAUSTED", "refuse").lower()
+
+# Retries of 5xx responses and network errors, with jittered exponential backoff
+MAX_RETRIES = int(os.getenv("FMP_MAX_RETRIES", 4))
+# Retries of 429s, counted apart: the server said when to come back, so they don't use up MAX_RETRIES
+MAX_THROTTLED_RETRIES = int(os.getenv("FMP_MAX_THROTTLED_RETRIES", 10))
+BACKOFF_BASE = float(os.getenv("FMP_BACKOFF_BASE", 0.5))
+BACKOFF_CAP = float(os.getenv("FMP_BACKOFF_CAP", 30))
+# A Retry-After longer than this isn't waited for: the request fails instead
+MAX_RETRY_AFTER = float(os.getenv("FMP_MAX_RETRY_AFTER", 60))
+
+# After a 429 the request rate is halved, then recovers a bit with every successful response
+MIN_RATE_FACTOR = 0.1
+RECOVERY_STEP = 0.05
+
+_background = contextvars.ContextVar("fmp_background_request", default=False)
+
+
+class QuotaExceededError(httpx.HTTPError):
+    """The daily FMP quota (or the share of it left to background work) is used up."""
+
+
+@contextlib.contextmanager
+def background_priority():
+    """Marks the requests sent inside the block (and tasks started from it) as background work."""
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+class TokenBucket:
+    """
+    Paces requests to `rate` per second with bursts of up to `capacity`.
+    Each caller reserves a token and sleeps until it's due, so it's safe to share across threads
+    and event loops. After a 429 the bucket pauses and slows down, then speeds back up (AIMD).
+    """
+
+    def __init__(self, rate, capacity):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def reserve(self):
+        """Takes a token and returns how many seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            return (self._updated - now) + max(0.0, -self._tokens) / self.rate
+
+    async def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            RATE_LIMIT_WAIT_SECONDS.inc(wait)
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        """Holds back every new request for `seconds` and halves the rate (the server said we're too fast)."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = min(self._tokens, 0.0)
+            self._updated = max(self._updated, now + seconds)
+            self.rate = max(self.max_rate * MIN_RATE_FACTOR, self.rate / 2)
+
+    def recover(self):
+        """Speeds the rate back up after a successful response."""
+        if self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_STEP)
+
+
+class DailyQuota:
+    """
+    Counts requests per UTC day against the plan's daily limit (0 = no limit).
+    The count lives in a SQLite file, so it survives restarts and is shared between processes:
+    each request is one atomic UPDATE that only succeeds while the day's count is under the limit.
+    """
+
+    def __init__(self, limit, reserve=0, path=QUOTA_PATH):
+        self.limit = limit
+        self.reserve = min(reserve, limit)
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _today():
+        return datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+
+    @staticmethod
+    def seconds_until_reset():
+        now = datetime.datetime.now(datetime.timezone.utc)
+        tomorrow = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time(), now.tzinfo)
+        return (tomorrow - now).total_seconds()
+
+    def _connect(self):
+        """Opens the SQLite file on first use (caller holds the lock)."""
+        if self._db is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # Other processes hold the write lock only for one UPDATE, so waiting for it is short
+            self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS quota (day TEXT PRIMARY KEY, used INTEGER NOT NULL)")
+            self._db.commit()
+        return self._db
+
+    def try_consume(self, background=False):
+        """Counts one request if the quota allows it. Returns False when it's used up."""
+        if not self.limit:
+            return True
+        allowed = self.limit - (self.reserve if background else 0)
+        day = self._today()
+        with self._lock:
+            db = self._connect()
+            with db:
+                if db.execute("INSERT OR IGNORE INTO quota (day, used) VALUES (?, 0)", (day,)).rowcount:
+                    # First request of a new day: older counts aren't needed anymore
+                    db.execute("DELETE FROM quota WHERE day < ?", (day,))
+                consumed = db.execute(
+                    "UPDATE quota SET used = used + 1 WHERE day = ? AND used < ?", (day, allowed)
+                ).rowcount
+                used = db.execute("SELECT used FROM quota WHERE day = ?", (day,)).fetchone()[0]
+        QUOTA_USED.set(used)
+        return bool(consumed)
+
+    @property
+    def used(self):
+        """Requests counted today, by every process sharing the file."""
+        if not self.limit:
+            return 0
+        with self._lock:
+            row = self._connect().execute("SELECT used FROM quota WHERE day = ?", (self._today(),)).fetchone()
+        return row[0] if row else 0
+
+    def remaining(self):
+        return max(0, self.limit - self.used) if self.limit else None
+
+
+class RateLimiter:
+    """Shared pacing (token bucket) and daily quota accounting for every FMP request."""
+
+    def __init__(self, per_minute=RATE_PER_MINUTE, burst=RATE_BURST, daily_quota=DAILY_QUOTA,
+                 reserve=QUOTA_RESERVE, on_exhausted=QUOTA_EXHAUSTED, quota_path=QUOTA_PATH):
+        if on_exhausted not in ("refuse", "defer"):
+            raise ValueError("on_exhausted must be 'refuse' or 'defer'")
+        self.bucket = TokenBucket(per_minute / 60, burst) if per_minute > 0 else None
+        self.quota = DailyQuota(daily_quota, reserve, quota_path)
+        self.on_exhausted = on_exhausted
+
+    async def acquire(self):
+        """Waits for a request slot. Raises QuotaExceededError if the daily quota is used up (refuse mode)."""
+        background = _background.get()
+        # Counting hits the SQLite file, so it runs in a worker thread when there is a quota
+        while self.quota.limit and not await asyncio.to_thread(self.quota.try_consume, background):
+            if self.on_exhausted == "refuse":
+                kind = "background share of the " if background else ""
+                raise QuotaExceededError(f"Daily FMP quota used up ({kind}{self.quota.limit} requests)")
+            await asyncio.sleep(min(self.quota.seconds_until_reset(), 3600))
+        if self.bucket is not None:
+            await self.bucket.acquire()
+
+    def throttled(self, retry_after):
+        if self.bucket is not None:
+            self.bucket.pause(retry_after)
+
+    def succeeded(self):
+        if self.bucket is not None:
+            self.bucket.recover()
+
+
+def retry_delay(attempt, retry_after=None):
+    """Seconds before retry number `attempt` (0-based): Retry-After when given, else full-jitter backoff."""
+    if retry_after is not None:
+        return retry_after
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def parse_retry_after(value):
+    """Retry-After header as seconds (it can be a number of seconds or an HTTP date). None if missing or invalid."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+def is_retryable(status):
+    return status == 429 or status >= 500
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Returns the process-wide limiter, built from the FMP_PLAN settings."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import datetime
+
+from schema import FinancialRecord, LABELS
+
+# Single results file every run is appended to, next to the exported CSVs
+RESULTS_PATH = os.getenv(
+    "FMP_RESULTS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "results.sqlite"),
+)
+
+# Fields that describe a ticker rather than measure it (metrics are stored under their display label)
+ID_FIELDS = (LABELS["company"],)
+
+
+class ResultsStore:
+    """
+    Append-only, long-format store of analysis results: one typed row per (run, ticker, metric).
+    Numbers go to `value` (REAL) and text such as RECOMMENDATION to `label` (TEXT).
+
+    Rows are clustered by run date, then metric and ticker (WITHOUT ROWID primary key), so reads
+    filtered by date range, metric or ticker are answered from the index instead of a full scan.
+    """
+
+    def __init__(self, path=RESULTS_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_ts TEXT NOT NULL,
+                source TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                run_date TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                ticker TEXT NOT NULL,
+                run_id INTEGER NOT NULL REFERENCES runs (run_id),
+                ticker_pos INTEGER NOT NULL,
+                metric_pos INTEGER NOT NULL,
+                value REAL,
+                label TEXT,
+                PRIMARY KEY (run_date, metric, ticker, run_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS results_by_ticker ON results (ticker, metric, run_date);
+            CREATE INDEX IF NOT EXISTS results_by_run ON results (run_id);
+            """
+        )
+        self._db.commit()
+
+    def append_run(self, records, source="cli", run_ts=None):
+        """Appends one run (a list of FinancialRecords) and returns its run_id."""
+        run_ts = run_ts or datetime.datetime.now()
+        run_date = run_ts.date().isoformat()
+
+        with self._db:
+            run_id = self._db.execute(
+                "INSERT INTO runs (run_ts, source) VALUES (?, ?)", (run_ts.isoformat(timespec="seconds"), source)
+            ).lastrowid
+
+            rows = []
+            for ticker_pos, record in enumerate(records):
+                ticker = record.company
+                for metric_pos, (metric, value) in enumerate(record.to_labels().items()):
+                    if metric in ID_FIELDS:
+                        continue
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        rows.append((run_date, metric, ticker, run_id, ticker_pos, metric_pos, float(value), None))
+                    else:
+                        rows.append((run_date, metric, ticker, run_id, ticker_pos, metric_pos, None, str(value)))
+
+            self._db.executemany(
+                "INSERT OR REPLACE INTO results "
+                "(run_date, metric, ticker, run_id, ticker_pos, metric_pos, value, label) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return run_id
+
+    def read(self, tickers=None, metrics=None, since=None, until=None, run_ids=None):
+        """
+        Reads result rows matching every given filter; the filters are pushed down into SQL.
+        since/until are dates (or ISO strings) and include both ends.
+        Returns a list of (run_id, run_ts, ticker, metric, value, label) tuples, in the order they were written.
+        """
+        conditions, params = [], []
+
+        def where_in(column, values):
+            values = list(values)
+            conditions.append(f"{column} IN ({', '.join('?' for _ in values)})")
+            params.extend(values)
+
+        if tickers is not None:
+            where_in("r.ticker", [ticker.upper() for ticker in tickers])
+        if metrics is not None:
+            where_in("r.metric", metrics)
+        if run_ids is not None:
+            where_in("r.run_id", run_ids)
+        if since is not None:
+            conditions.append("r.run_date >= ?")
+            params.append(str(since)[:10])
+        if until is not None:
+            conditions.append("r.run_date <= ?")
+            params.append(str(until)[:10])
+
+        query = (
+            "SELECT r.run_id, runs.run_ts, r.ticker, r.metric, r.value, r.label "
+            "FROM results AS r JOIN runs ON runs.run_id = r.run_id"
+        )
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY r.run_id, r.ticker_pos, r.metric_pos"
+        return self._db.execute(query, params).fetchall()
+
+    def read_frame(self, **filters):
+        """Same as read, as a pandas DataFrame (pandas is only imported here)."""
+        import pandas as pd
+
+        columns = ["run_id", "run_ts", "ticker", "metric", "value", "label"]
+        frame = pd.DataFrame(self.read(**filters), columns=columns)
+        frame["run_ts"] = pd.to_datetime(frame["run_ts"])
+        return frame
+
+    def run_records(self, run_id):
+        """Rebuilds the FinancialRecords of one run, in their original order."""
+        records = {}
+        for ticker, metric, value, label in self._db.execute(
+            "SELECT ticker, metric, value, label FROM results WHERE run_id = ? ORDER BY ticker_pos, metric_pos",
+            (run_id,),
+        ):
+            records.setdefault(ticker, {ID_FIELDS[0]: ticker})[metric] = value if label is None else label
+        return [FinancialRecord.from_labels(row) for row in records.values()]
+
+    def runs(self):
+        """Every run as (run_id, run_ts, source), oldest first."""
+        return self._db.execute("SELECT run_id, run_ts, source FROM runs ORDER BY run_id").fetchall()
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,205 @@
+import os
+import numpy as np
+
+from valuation import (
+    PEER_MULTIPLES,
+    PRICE_KEY,
+    HISTORICAL_KEY,
+    final_intrinsic,
+    peer_masks,
+    peer_ratios,
+    recommendation_codes,
+    to_array,
+    valid_mask,
+)
+
+# Scenarios per ticker: each one resamples the peers and shocks the multiples and 5Y-ago ratios
+DEFAULT_DRAWS = int(os.getenv("SCENARIO_DRAWS", 10000))
+# Log standard deviation of the shock on each peer average multiple (on top of resampling the peers)
+MULTIPLE_SPREAD = float(os.getenv("SCENARIO_MULTIPLE_SPREAD", 0.10))
+# Log standard deviation of the shock on the 5Y-ago PS and PBV behind the historical fair price
+HISTORICAL_SPREAD = float(os.getenv("SCENARIO_HISTORICAL_SPREAD", 0.15))
+# Draw-ticker values computed at once (8 bytes each): larger requests are simulated in slices of tickers
+CHUNK_CELLS = int(os.getenv("SCENARIO_CHUNK_CELLS", 250_000))
+
+# Historical fair prices from the 5Y-ago PS and PBV, averaged into HISTORICAL_KEY
+HISTORICAL_PARTS = ("fair_price_ps_5y", "fair_price_pbv_5y")
+# Percentile of the final intrinsic value -> FinancialRecord field it is written to
+PERCENTILE_FIELDS = {5: "intrinsic_p5", 50: "intrinsic_p50", 95: "intrinsic_p95"}
+PROBABILITY_KEY = "prob_underpriced"
+
+
+def peer_average_draws(multiples, weights):
+    """
+    Peer average of each multiple in each draw: the mean of the valid ratios weighted by how many times
+    the draw picked each ticker. multiples is (tickers, multiples), weights (draws, tickers).
+    Both sums are one matrix product, so every draw is computed at once. Returns (draws, multiples).
+    """
+    ok = valid_mask(multiples)
+    totals = weights @ np.where(ok, multiples, 0.0)
+    counts = weights @ ok.astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, totals / np.maximum(counts, 1), np.nan)
+
+
+def _peer_average_samples(rng, ratios, peers, draws, resample_peers, multiple_spread, chunk_cells):
+    """
+    Shocked peer average of each multiple in each draw, (draws, multiples). The bootstrap weights are
+    (draws, tickers), so they are built chunk_cells at a time and only the small averages are kept.
+    """
+    count = len(ratios)
+    peer_multiples = np.column_stack([peer_ratios(ratios[:, i], peers, key) for i, key in enumerate(PEER_MULTIPLES)])
+    step = draws if chunk_cells is None else max(1, chunk_cells // max(count, 1))
+
+    peer_averages = np.empty((draws, len(PEER_MULTIPLES)))
+    for first in range(0, draws, step):
+        size = min(step, draws - first)
+        if resample_peers and count:
+            # Times each ticker is picked in each draw (a bootstrap), counted with one bincount over the chunk
+            picks = rng.integers(0, count, size=(size, count)) + np.arange(size)[:, None] * count
+            weights = np.bincount(picks.ravel(), minlength=size * count).reshape(size, count).astype(float)
+        else:
+            weights = np.ones((size, count))
+        peer_averages[first:first + size] = peer_average_draws(peer_multiples, weights)
+    if multiple_spread:
+        peer_averages *= np.exp(multiple_spread * rng.standard_normal(peer_averages.shape))
+    return peer_averages
+
+
+def _final_draws(rng, peer_averages, prices, ratios, historical, historical_parts, historical_spread):
+    """Final intrinsic value of some tickers in every draw of peer_averages, (draws, tickers)."""
+    draws, count = len(peer_averages), len(prices)
+
+    # price * peer average / ratio per multiple, then their mean: (price / ratio) is fixed per ticker,
+    # so the industry value of every draw and ticker is one (draws, multiples) @ (multiples, tickers) product
+    ok = valid_mask(ratios) & valid_mask(prices)[:, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        per_multiple = np.where(ok, prices[:, None] / np.where(ok, ratios, 1.0), 0.0)
+    peer_ok = valid_mask(peer_averages)
+    totals = np.where(peer_ok, peer_averages, 0.0) @ per_multiple.T
+    counts = peer_ok.astype(float) @ ok.T.astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        industry = np.where(counts > 0, totals / np.maximum(counts, 1), np.nan)
+
+    if historical_spread:
+        shocks = np.exp(historical_spread * rng.standard_normal((2, draws, count)))
+        if historical_parts is None:
+            historical = historical * shocks[0]
+        else:
+            ps_part, pbv_part = historical_parts
+            both = valid_mask(ps_part) & valid_mask(pbv_part) & valid_mask(ps_part + pbv_part)
+            # Each part moves with its own ratio, weighted by its share of the historical value
+            with np.errstate(invalid="ignore", divide="ignore"):
+                moves = (ps_part * shocks[0] + pbv_part * shocks[1]) / np.where(both, ps_part + pbv_part, 1.0)
+            historical = historical * np.where(both, moves, shocks[0])
+
+    return final_intrinsic(industry, historical)
+
+
+def simulate_chunks(prices, multiples, historical, historical_parts=None, draws=DEFAULT_DRAWS,
+                    multiple_spread=MULTIPLE_SPREAD, historical_spread=HISTORICAL_SPREAD,
+                    resample_peers=True, seed=None, peers=None, chunk_cells=CHUNK_CELLS):
+    """
+    Monte Carlo version of compute_valuation (same formulas, every ticker a peer of every other).
+
+    Each draw resamples the tickers with replacement for the peer averages, multiplies every peer
+    average by a lognormal shock (multiple_spread) and the 5Y-ago PS and PBV of every ticker by their
+    own shocks (historical_spread). historical_parts are the PS and PBV fair prices behind historical,
+    which weight its two shocks; tickers without them have the whole historical value shocked.
+    peers leaves multiples out of the peer averages, as in compute_valuation.
+    With both spreads at 0 and resample_peers=False every draw is the point estimate.
+
+    The peer averages of all draws are computed first (draws x multiples), then the tickers are valued
+    in slices of about chunk_cells draw-ticker values (None: all at once). Yields (ticker slice, final
+    intrinsic values as a (draws, tickers in the slice) array, NaN where they can't be computed).
+    """
+    rng = np.random.default_rng(seed)
+    prices = np.asarray(prices, dtype=float)
+    historical = np.asarray(historical, dtype=float)
+    ratios = np.column_stack([np.asarray(multiples[key], dtype=float) for key in PEER_MULTIPLES])
+    if historical_parts is not None:
+        historical_parts = [np.asarray(part, dtype=float) for part in historical_parts]
+    count = len(prices)
+
+    peer_averages = _peer_average_samples(rng, ratios, peers, draws, resample_peers, multiple_spread, chunk_cells)
+    step = max(1, count if chunk_cells is None else chunk_cells // max(draws, 1))
+    for first in range(0, max(count, 1), step):
+        tickers = slice(first, min(first + step, count))
+        parts = None if historical_parts is None else [part[tickers] for part in historical_parts]
+        yield tickers, _final_draws(rng, peer_averages, prices[tickers], ratios[tickers], historical[tickers],
+                                    parts, historical_spread)
+
+
+def simulate_valuation(prices, multiples, historical, historical_parts=None, **options):
+    """
+    Every draw of simulate_chunks as one (draws, tickers) array of final intrinsic values.
+    Its size grows with draws x tickers: simulate_summary keeps only the bands instead.
+    """
+    options.setdefault("chunk_cells", None)
+    chunks = [values for _, values in simulate_chunks(prices, multiples, historical, historical_parts, **options)]
+    return np.hstack(chunks)
+
+
+def simulate_summary(prices, multiples, historical, historical_parts=None, **options):
+    """
+    summarize_scenarios of simulate_chunks, one slice of tickers at a time: only the percentile bands
+    and the probability of Underpriced are kept, so memory stays at about chunk_cells values.
+    """
+    prices = np.asarray(prices, dtype=float)
+    results = {key: np.full(len(prices), np.nan) for key in (*PERCENTILE_FIELDS.values(), PROBABILITY_KEY)}
+    for tickers, final_draws in simulate_chunks(prices, multiples, historical, historical_parts, **options):
+        for key, values in summarize_scenarios(final_draws, prices[tickers]).items():
+            results[key][tickers] = values
+    return results
+
+
+def nan_percentiles(values, percentiles):
+    """
+    Percentiles along axis 0 ignoring NaN (linear interpolation, like np.nanpercentile), without
+    np.nanpercentile's per-column loop. Returns (len(percentiles), columns), NaN for all-NaN columns.
+    """
+    ordered = np.sort(values, axis=0)  # NaN sorts last
+    valid = np.isfinite(values).sum(axis=0)
+    positions = np.asarray(percentiles, dtype=float)[:, None] / 100 * np.maximum(valid - 1, 0)
+    lower = np.floor(positions).astype(np.intp)
+    upper = np.minimum(lower + 1, np.maximum(valid - 1, 0))
+    fraction = positions - lower
+    low = np.take_along_axis(ordered, lower, axis=0)
+    high = np.take_along_axis(ordered, upper, axis=0)
+    return np.where(valid > 0, low + (high - low) * fraction, np.nan)
+
+
+def summarize_scenarios(final_draws, prices):
+    """Percentile bands of the final intrinsic value and share of valued draws that are Underpriced, per ticker."""
+    codes = recommendation_codes(final_draws, np.asarray(prices, dtype=float))
+    valued = (codes != 0).sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        probability = np.where(valued > 0, (codes == 1).sum(axis=0) / np.maximum(valued, 1), np.nan)
+
+    bands = nan_percentiles(final_draws, list(PERCENTILE_FIELDS))
+    results = dict(zip(PERCENTILE_FIELDS.values(), bands))
+    results[PROBABILITY_KEY] = probability
+    return results
+
+
+def simulate_records(records, draws=DEFAULT_DRAWS, seed=None, **options):
+    """
+    Runs the scenarios for a list of FinancialRecords (all peers of each other, as in value_records) and
+    sets their percentile bands and probability of Underpriced. options go to simulate_chunks.
+    Returns the same list.
+    """
+    if not records:
+        return records
+
+    prices = to_array([getattr(row, PRICE_KEY) for row in records])
+    multiples = {key: to_array([getattr(row, key) for row in records]) for key in PEER_MULTIPLES}
+    historical = to_array([getattr(row, HISTORICAL_KEY) for row in records])
+    parts = [to_array([getattr(row, key) for row in records]) for key in HISTORICAL_PARTS]
+
+    summary = simulate_summary(prices, multiples, historical, parts, draws=draws, seed=seed,
+                               peers=peer_masks(records), **options)
+
+    for key, values in summary.items():
+        for row, value in zip(records, np.round(values, 3).tolist()):
+            setattr(row, key, value)
+    return records
@@ -0,0 +1,102 @@
+import math
+from dataclasses import dataclass, field, fields
+
+# Missing metrics are NaN, so every numeric field is a plain float and missing values cost nothing
+NAN = float("nan")
+
+
+def metric(label, section):
+    """A numeric metric: float field, NaN when missing, shown as `label` in the section it belongs to."""
+    return field(default=NAN, metadata={"label": label, "section": section})
+
+
+def text(label):
+    """A text field (None when missing), shown as `label`."""
+    return field(default=None, metadata={"label": label, "section": "text"})
+
+
+@dataclass(slots=True)
+class FinancialRecord:
+    """
+    Data of one ticker. Fields are in the order of the CSV export; display labels (e.g. "PER (Current FMP)")
+    live in the schema and are only applied when rendering (bot messages, CSV, results store).
+    provider is the source of the record; sources lists the fields another provider filled in (field -> name).
+    """
+    company: str = field(metadata={"label": "Company", "section": "text"})
+    price: float = metric("PRICE", "price")
+    per: float = metric("PER (Current FMP)", "valuation")
+    ps: float = metric("PS (Current FMP)", "valuation")
+    pbv: float = metric("PBV (Current FMP)", "valuation")
+    per_5y: float = metric("5Y ago PER (P/E Ratio)", "historical")
+    ps_5y: float = metric("5Y ago PS (Price to Sales)", "historical")
+    pbv_5y: float = metric("5Y ago PBV (Price to Book)", "historical")
+    fair_price_per_5y: float = metric("Estimated Fair Price based on historical PER (5Y)", "historical")
+    fair_price_ps_5y: float = metric("Estimated Fair Price based on historical PS (5Y)", "historical")
+    fair_price_pbv_5y: float = metric("Estimated Fair Price based on historical PBV (5Y)", "historical")
+    fair_price_5y: float = metric("Estimated Fair Price based on historical PS+PBV (5Y)", "intrinsic")
+    current_ratio: float = metric("Current Ratio", "liquidity")
+    quick_ratio: float = metric("Quick Ratio", "liquidity")
+    cash_ratio: float = metric("Cash Ratio", "liquidity")
+    inventory_turnover: float = metric("Inventory Turnover", "liquidity")
+    days_inventory: float = metric("Days Inventory", "liquidity")
+    asset_turnover: float = metric("Asset Turnover", "liquidity")
+    pcf: float = metric("Price to Cash Flow (PCF)", "valuation")
+    intrinsic_per: float = metric("Intrinsic Value based on Peer PER", "intrinsic")
+    intrinsic_ps: float = metric("Intrinsic Value based on Peer PS", "intrinsic")
+    intrinsic_pbv: float = metric("Intrinsic Value based on Peer PBV", "intrinsic")
+    intrinsic_pcf: float = metric("Intrinsic Value based on Peer PCF", "intrinsic")
+    intrinsic_industry: float = metric("Intrinsic Value based on Industry Average", "intrinsic")
+    intrinsic_final: float = metric("Final Intrinsic Value (Avg Industry + Historical)", "intrinsic")
+    intrinsic_p5: float = metric("Final Intrinsic Value P5 (Monte Carlo)", "scenarios")
+    intrinsic_p50: float = metric("Final Intrinsic Value P50 (Monte Carlo)", "scenarios")
+    intrinsic_p95: float = metric("Final Intrinsic Value P95 (Monte Carlo)", "scenarios")
+    prob_underpriced: float = metric("Probability Underpriced (Monte Carlo)", "scenarios")
+    recommendation: str = text("RECOMMENDATION")
+    sector: str = text("Sector")
+    industry: str = text("Industry")
+    provider: str = None
+    sources: dict = None
+
+    def source(self, name):
+        """Provider that served a field, or None if the field is missing."""
+        if is_missing(getattr(self, name)):
+            return None
+        return (self.sources or {}).get(name, self.provider)
+
+    def to_labels(self):
+        """The present fields as a dict keyed by display label, in schema order."""
+        return {LABELS[name]: value for name in LABELS if not is_missing(value := getattr(self, name))}
+
+    @classmethod
+    def from_labels(cls, row):
+        """Builds a record from a dict keyed by display label (unknown labels are ignored)."""
+        values = {}
+        for label, value in row.items():
+            name = FIELDS_BY_LABEL.get(label)
+            if name in METRIC_FIELDS:
+                values[name] = to_float(value, digits=None)
+            elif name is not None:
+                values[name] = value
+        return cls(**values)
+
+
+def is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def to_float(value, digits=3):
+    """value as a float rounded to `digits` (None: as is), NaN if it isn't a number."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return NAN
+    return float(value) if digits is None else round(float(value), digits)
+
+
+# Schema lookups, all derived from the dataclass so labels are written in one place
+LABELS = {f.name: f.metadata["label"] for f in fields(FinancialRecord) if "label" in f.metadata}
+FIELDS_BY_LABEL = {label: name for name, label in LABELS.items()}
+METRIC_FIELDS = tuple(f.name for f in fields(FinancialRecord) if f.metadata.get("section", "text") != "text")
+SECTIONS = {}
+for _field in fields(FinancialRecord):
+    if "section" in _field.metadata:
+        SECTIONS.setdefault(_field.metadata["section"], []).append(_field.name)
+del _field
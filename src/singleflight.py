@@ -0,0 +1,47 @@
+import os
+import asyncio
+import weakref
+
+# Longest a caller waits for a request another caller already started (the request itself keeps running)
+WAIT_TIMEOUT = float(os.getenv("FMP_SINGLEFLIGHT_TIMEOUT", 90))
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller starts the work and every
+    caller that arrives while it is in flight awaits the same task, sharing its result or error.
+    Nothing is kept once the task finishes, so later calls start fresh (caching is not its job).
+    """
+
+    def __init__(self, timeout=WAIT_TIMEOUT):
+        self.timeout = timeout
+        # In-flight tasks per event loop, since a task can only be awaited from its own loop
+        self._calls = weakref.WeakKeyDictionary()
+        self.started = 0
+        self.shared = 0
+
+    async def do(self, key, func, timeout=None):
+        """
+        Returns the result of func() (a coroutine function), or of the call already in flight for key.
+        Raises asyncio.TimeoutError if the result takes longer than timeout seconds to arrive.
+        """
+        loop = asyncio.get_running_loop()
+        calls = self._calls.setdefault(loop, {})
+        task = calls.get(key)
+        if task is None:
+            task = loop.create_task(func())
+            calls[key] = task
+            task.add_done_callback(lambda done: calls.pop(key, None) if calls.get(key) is done else None)
+            self.started += 1
+        else:
+            self.shared += 1
+
+        # shield: a caller that gives up (timeout, cancelled chat) doesn't cancel the others' request
+        return await asyncio.wait_for(asyncio.shield(task), self.timeout if timeout is None else timeout)
+
+    def in_flight(self, key):
+        """True if a call for key is in flight on the running event loop (a new call would share it)."""
+        return key in self._calls.get(asyncio.get_running_loop(), ())
+
+    def stats(self):
+        return {"started": self.started, "shared": self.shared}
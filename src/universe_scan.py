@@ -0,0 +1,139 @@
+import re
+import csv
+import asyncio
+import argparse
+import datetime
+from collections import Counter
+
+from fetch_fmp import get_profiles_async, close_shared_client, DEFAULT_MAX_CONCURRENCY
+from process_data import get_complete_financials_batch_async
+from valuation import PEER_MULTIPLES, PRICE_KEY, HISTORICAL_KEY, INDUSTRY_KEY, FINAL_KEY, RECOMMENDATION_KEY, value_records
+from schema import LABELS, is_missing
+
+# Profile field used for each grouping, and the record field it is stored under
+GROUP_FIELDS = {
+    "sector": ("sector", "sector"),
+    "industry": ("industry", "industry"),
+}
+
+# How many peer groups are downloaded at the same time (each with its own max_concurrency)
+MAX_CONCURRENT_GROUPS = 4
+
+# Columns of the scan CSV: one row per ticker, so groups can be appended as they complete
+SCAN_COLUMNS = [
+    "company",
+    "sector",
+    "industry",
+    PRICE_KEY,
+    *PEER_MULTIPLES.keys(),
+    HISTORICAL_KEY,
+    *PEER_MULTIPLES.values(),
+    INDUSTRY_KEY,
+    FINAL_KEY,
+    RECOMMENDATION_KEY,
+]
+
+
+def parse_tickers(text):
+    """Tickers separated by commas, spaces or new lines; '#' starts a comment. Duplicates are dropped."""
+    tickers = []
+    for line in text.splitlines():
+        line = line.split("#", 1)[0]
+        tickers.extend(ticker.upper() for ticker in re.split(r"[,\s]+", line) if ticker)
+    return list(dict.fromkeys(tickers))
+
+
+def read_ticker_file(path):
+    """Reads a ticker file (see parse_tickers)."""
+    with open(path, encoding="utf-8") as file:
+        return parse_tickers(file.read())
+
+
+async def scan_universe(tickers, group_by="sector", max_concurrency=DEFAULT_MAX_CONCURRENCY, use_cache=None):
+    """
+    Values a large ticker universe against sector (or industry) peers instead of the whole list.
+    Async generator yielding (group name, valued records) as soon as each group has been downloaded,
+    so the whole universe is never held at once. Profiles come from the response cache when fresh.
+    """
+    profile_field, record_key = GROUP_FIELDS[group_by]
+    tickers = [ticker.strip().upper() for ticker in tickers]
+    profiles = await get_profiles_async(tickers, max_concurrency=max_concurrency, use_cache=use_cache)
+
+    members = {}
+    for ticker in tickers:
+        group = profiles.get(ticker, {}).get(profile_field) or "Unknown"
+        members.setdefault(group, []).append(ticker)
+
+    group_slots = asyncio.Semaphore(MAX_CONCURRENT_GROUPS)
+
+    async def fetch_group(group_tickers):
+        async with group_slots:
+            results = await get_complete_financials_batch_async(
+                group_tickers, max_concurrency=max_concurrency, use_cache=use_cache
+            )
+        records = [data for data in results if data]
+        for data in records:
+            profile = profiles.get(data.company, {})
+            data.sector = profile.get("sector") or "Unknown"
+            data.industry = profile.get("industry") or "Unknown"
+        return records
+
+    tasks = {asyncio.ensure_future(fetch_group(group_tickers)): group for group, group_tickers in members.items()}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            finished = sorted(done, key=lambda task: tasks[task])
+
+            # One grouped pass values every group that finished in this round
+            value_records([data for task in finished for data in task.result()], group_key=record_key)
+
+            for task in finished:
+                yield tasks[task], task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def scan_row(data):
+    """CSV row of one record, empty cells for missing values."""
+    return ["" if is_missing(value := getattr(data, name)) else value for name in SCAN_COLUMNS]
+
+
+async def run_scan(tickers, group_by, max_concurrency, use_cache, filename):
+    """Streams the scan into a CSV file and prints one summary line per group."""
+    scanned = 0
+    with open(filename, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow([LABELS[name] for name in SCAN_COLUMNS])
+        try:
+            async for group, records in scan_universe(tickers, group_by, max_concurrency, use_cache):
+                writer.writerows(scan_row(data) for data in records)
+                file.flush()
+                scanned += len(records)
+
+                counts = Counter(data.recommendation for data in records)
+                summary = ", ".join(f"{label}: {count}" for label, count in sorted(counts.items()))
+                print(f"✅ {group}: {len(records)} tickers ({summary or 'no data'})")
+        finally:
+            await close_shared_client()
+
+    print(f"Scanned {scanned} of {len(tickers)} tickers. Data succesfully saved to {filename}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Value a ticker universe against sector/industry peers")
+    parser.add_argument("ticker_file", help="File with tickers separated by commas, spaces or new lines")
+    parser.add_argument("--group-by", choices=sorted(GROUP_FIELDS), default="sector")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_CONCURRENCY, help="Tickers fetched at the same time per group")
+    parser.add_argument("--no-cache", action="store_true", help="Download fresh data instead of using the response cache")
+    args = parser.parse_args()
+
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    asyncio.run(run_scan(
+        read_ticker_file(args.ticker_file),
+        args.group_by,
+        args.workers,
+        False if args.no_cache else None,
+        f"../data/universe_scan_{timestamp}.csv",
+    ))
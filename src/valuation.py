@@ -0,0 +1,179 @@
+import numpy as np
+
+# Current multiple of each ticker -> intrinsic value it implies at the peer average multiple
+# (FinancialRecord fields, see schema.py for their display labels)
+PEER_MULTIPLES = {
+    "per": "intrinsic_per",
+    "ps": "intrinsic_ps",
+    "pbv": "intrinsic_pbv",
+    "pcf": "intrinsic_pcf",
+}
+PRICE_KEY = "price"
+HISTORICAL_KEY = "fair_price_5y"
+INDUSTRY_KEY = "intrinsic_industry"
+FINAL_KEY = "intrinsic_final"
+RECOMMENDATION_KEY = "recommendation"
+
+# Only multiples from this provider go into the peer averages: fallback answers (e.g. Yahoo's trailing
+# P/E) aren't computed the same way, so they are valued against the averages without moving them
+PEER_PROVIDER = "FMP"
+
+# Final intrinsic value more than 10% above/below the price flags the stock as Underpriced/Overpriced
+RECOMMENDATION_BAND = 0.10
+RECOMMENDATION_LABELS = np.array(["N/A", "Underpriced", "Overpriced", "Fairly Priced"])
+
+
+def to_array(values):
+    """Converts a sequence of numbers/None/strings to a float array, with NaN for anything not numeric."""
+    try:
+        # Fast path: numpy already turns None into NaN in a float array
+        return np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        pass
+    return np.array(
+        [value if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan for value in values],
+        dtype=float,
+    )
+
+
+def valid_mask(values):
+    """True where a value can be used in a ratio: present, finite and not zero."""
+    return np.isfinite(values) & (values != 0)
+
+
+def masked_mean(values, axis=None):
+    """Mean over the valid entries (NaN where there are none), without RuntimeWarnings."""
+    mask = valid_mask(values)
+    total = np.where(mask, values, 0.0).sum(axis=axis)
+    count = mask.sum(axis=axis)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+
+def masked_group_mean(values, groups, group_count):
+    """Mean of the valid entries of each group (NaN for groups without any), in one bincount pass."""
+    mask = valid_mask(values)
+    total = np.bincount(groups, weights=np.where(mask, values, 0.0), minlength=group_count)
+    count = np.bincount(groups, weights=mask.astype(float), minlength=group_count)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+
+def peer_masks(records):
+    """Multiple -> bool array of the records whose multiple may count towards the peer average."""
+    return {
+        key: np.array([row.source(key) in (None, PEER_PROVIDER) for row in records], dtype=bool)
+        for key in PEER_MULTIPLES
+    }
+
+
+def peer_ratios(ratios, peers, key):
+    """The ratios that count towards the peer average of a multiple (the others as NaN)."""
+    return ratios if peers is None else np.where(peers[key], ratios, np.nan)
+
+
+def compute_valuation(prices, multiples, historical, groups=None, peers=None):
+    """
+    Vectorized peer-multiple valuation for many tickers at once.
+
+    prices and historical are 1-D float arrays (NaN = missing); multiples maps each key of
+    PEER_MULTIPLES to the array of current multiples. Missing or zero values are masked out:
+    they don't count towards the peer averages and leave the dependent outputs as NaN.
+
+    By default every ticker is a peer of every other. groups (an int array of group ids, e.g. one
+    per sector) restricts the peer averages to the tickers of the same group, and peers (multiple ->
+    bool array, see peer_masks) leaves the other tickers' multiples out of them while still valuing them.
+
+    Returns a dict of arrays keyed by the output names, plus "peer averages" (multiple -> float,
+    or multiple -> array indexed by group id when groups is given).
+    """
+    prices = np.asarray(prices, dtype=float)
+    historical = np.asarray(historical, dtype=float)
+    price_ok = valid_mask(prices)
+    if groups is not None:
+        groups = np.asarray(groups, dtype=np.intp)
+        group_count = int(groups.max()) + 1 if groups.size else 0
+
+    results = {"peer averages": {}}
+    intrinsic_values = []
+    for multiple_key, intrinsic_key in PEER_MULTIPLES.items():
+        ratios = np.asarray(multiples[multiple_key], dtype=float)
+        ok = valid_mask(ratios) & price_ok
+        if groups is None:
+            peer_average = masked_mean(peer_ratios(ratios, peers, multiple_key))
+            results["peer averages"][multiple_key] = float(peer_average)
+        else:
+            group_averages = masked_group_mean(peer_ratios(ratios, peers, multiple_key), groups, group_count)
+            results["peer averages"][multiple_key] = group_averages
+            peer_average = group_averages[groups]
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            intrinsic = np.where(ok, prices * peer_average / np.where(ok, ratios, 1.0), np.nan)
+        results[intrinsic_key] = intrinsic
+        intrinsic_values.append(intrinsic)
+
+    industry = masked_mean(np.vstack(intrinsic_values), axis=0) if intrinsic_values else np.full_like(prices, np.nan)
+    results[INDUSTRY_KEY] = industry
+
+    final = final_intrinsic(industry, historical)
+    results[FINAL_KEY] = final
+
+    results[RECOMMENDATION_KEY] = recommend(final, prices)
+    return results
+
+
+def final_intrinsic(industry, historical):
+    """Average of the industry-based and historical intrinsic values (NaN unless both are valid). Broadcasts."""
+    ok = valid_mask(industry) & valid_mask(historical)
+    return np.where(ok, (np.where(ok, industry, 0.0) + np.where(ok, historical, 0.0)) / 2, np.nan)
+
+
+def recommendation_codes(final_intrinsic, prices, band=RECOMMENDATION_BAND):
+    """Index into RECOMMENDATION_LABELS of each final value against its price. Broadcasts (e.g. draws x tickers)."""
+    final_intrinsic = np.asarray(final_intrinsic, dtype=float)
+    prices = np.asarray(prices, dtype=float)
+    ok = valid_mask(final_intrinsic) & valid_mask(prices)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        diff = np.where(ok, (final_intrinsic - prices) / np.where(ok, prices, 1.0), 0.0)
+    return np.select([~ok, diff > band, diff < -band], [0, 1, 2], default=3)
+
+
+def recommend(final_intrinsic, prices, band=RECOMMENDATION_BAND):
+    """Underpriced/Overpriced/Fairly Priced per ticker, or N/A where the value or price is missing."""
+    return RECOMMENDATION_LABELS[recommendation_codes(final_intrinsic, prices, band)]
+
+
+def group_ids(labels):
+    """Maps group labels (e.g. sector names, None for unknown) to (unique labels, int id per label)."""
+    names, ids = np.unique(np.array([str(label) if label else "Unknown" for label in labels]), return_inverse=True)
+    return names.tolist(), ids
+
+
+def value_records(records, group_key=None):
+    """
+    Sets the intrinsic values and recommendation of a list of FinancialRecords (as returned by
+    get_complete_financials). Returns the same list.
+    All records are peers of each other, unless group_key names a field (e.g. "sector") whose
+    value splits them into peer groups; every group is still valued in the same vectorized pass.
+    Multiples another provider filled in (e.g. a Yahoo hedge) are valued but kept out of the peer averages.
+    Values that can't be computed are NaN; the recommendation is always set.
+    """
+    if not records:
+        return records
+
+    prices = to_array([getattr(row, PRICE_KEY) for row in records])
+    multiples = {key: to_array([getattr(row, key) for row in records]) for key in PEER_MULTIPLES}
+    historical = to_array([getattr(row, HISTORICAL_KEY) for row in records])
+    groups = group_ids([getattr(row, group_key) for row in records])[1] if group_key else None
+
+    results = compute_valuation(prices, multiples, historical, groups=groups, peers=peer_masks(records))
+
+    for key in [*PEER_MULTIPLES.values(), INDUSTRY_KEY, FINAL_KEY]:
+        for row, value in zip(records, np.round(results[key], 3).tolist()):
+            setattr(row, key, value)
+
+    for row, label in zip(records, results[RECOMMENDATION_KEY].tolist()):
+        setattr(row, RECOMMENDATION_KEY, label)
+
+    return records
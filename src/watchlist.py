@@ -0,0 +1,136 @@
+import os
+import asyncio
+import logging
+
+from fmp_cache import DEFAULT_TTLS
+from fetch_fmp import get_quotes_async, refresh_ratios_async, CACHE_ENABLED, QUOTE_BATCH_SIZE
+from metrics import WATCHLIST_REFRESHES
+from rate_limit import DAILY_QUOTA, QUOTA_RESERVE, RATE_PER_MINUTE, background_priority
+
+# Tickers kept warm in the response cache, e.g. FMP_WATCHLIST="AAPL,MSFT,GOOGL"
+WATCHLIST = [ticker.strip().upper() for ticker in os.getenv("FMP_WATCHLIST", "").split(",") if ticker.strip()]
+
+# Quotes are refreshed a bit before they expire from the cache, ratios once a day
+QUOTE_INTERVAL = float(os.getenv("FMP_WATCHLIST_QUOTE_INTERVAL", DEFAULT_TTLS["quote"] * 0.8))
+RATIOS_INTERVAL = float(os.getenv("FMP_WATCHLIST_RATIOS_INTERVAL", 24 * 3600))
+
+# Requests per minute the refresher may use (a share of the plan's rate, see FMP_PLAN); they're spaced evenly
+RATE_SHARE = float(os.getenv("FMP_WATCHLIST_RATE_SHARE", 0.2))
+REQUESTS_PER_MINUTE = float(os.getenv("FMP_WATCHLIST_REQUESTS_PER_MINUTE", RATE_PER_MINUTE * RATE_SHARE or 60))
+# Requests per day it may use on plans with a daily quota: a share of what background work may use
+# (the quota minus the reserve kept for users), the /watch alerts poll uses the rest
+DAILY_SHARE = float(os.getenv("FMP_WATCHLIST_DAILY_SHARE", 0.5))
+DAILY_BUDGET = (DAILY_QUOTA - QUOTA_RESERVE) * DAILY_SHARE if DAILY_QUOTA else None
+
+DAY = 24 * 3600
+
+
+class WatchlistWarmer:
+    """
+    Keeps the quotes and ratios of a watchlist fresh in the response cache, so /analize on watched
+    tickers is answered from memory. Sends one request at a time, spaced by 60 / requests_per_minute
+    seconds, so the refresh never bursts against the API rate limit.
+
+    With a daily_budget (requests per day), quotes are refreshed less often when needed so a day of
+    refreshes fits in it; a watchlist whose daily ratios alone don't fit raises ValueError.
+    """
+
+    def __init__(self, tickers, quote_interval=QUOTE_INTERVAL, ratios_interval=RATIOS_INTERVAL,
+                 requests_per_minute=REQUESTS_PER_MINUTE, batch_size=QUOTE_BATCH_SIZE, daily_budget=DAILY_BUDGET):
+        if requests_per_minute <= 0:
+            raise ValueError("requests_per_minute must be positive")
+        self.tickers = list(dict.fromkeys(ticker.strip().upper() for ticker in tickers))
+        self.quote_interval = quote_interval
+        self.ratios_interval = ratios_interval
+        self.spacing = 60 / requests_per_minute
+        self.batch_size = batch_size
+        if daily_budget is not None:
+            self._fit(daily_budget)
+
+    def _fit(self, daily_budget):
+        left = daily_budget - len(self.tickers) * DAY / self.ratios_interval
+        if left < self.quote_requests():
+            raise ValueError(
+                f"{len(self.tickers)} watched tickers need more than the {daily_budget:.0f} requests a day "
+                f"the watchlist may use"
+            )
+        self.quote_interval = max(self.quote_interval, self.quote_requests() * DAY / left)
+
+    def quote_requests(self):
+        """Requests needed to refresh every quote (one per batch)."""
+        return -(-len(self.tickers) // self.batch_size)
+
+    def daily_requests(self):
+        """Requests a day of refreshes sends."""
+        return self.quote_requests() * DAY / self.quote_interval + len(self.tickers) * DAY / self.ratios_interval
+
+    async def refresh_quotes(self):
+        quotes = await get_quotes_async(self.tickers, batch_size=self.batch_size, use_cache=False)
+        WATCHLIST_REFRESHES.inc(len(quotes), kind="quote", outcome="ok")
+        WATCHLIST_REFRESHES.inc(len(self.tickers) - len(quotes), kind="quote", outcome="failed")
+
+    async def refresh_ratios(self, ticker):
+        ok = await refresh_ratios_async(ticker)
+        WATCHLIST_REFRESHES.inc(kind="ratios", outcome="ok" if ok else "failed")
+
+    async def run(self):
+        """Refreshes forever, one request slot at a time; cancel the task to stop it."""
+        # Background requests leave the end of the daily quota to users' own requests
+        with background_priority():
+            await self._refresh_forever()
+
+    async def _refresh_forever(self):
+        loop = asyncio.get_running_loop()
+        next_quotes = loop.time()
+        # Every ticker is due at start; after the first pass the refreshes stay staggered by slot
+        next_ratios = dict.fromkeys(self.tickers, loop.time())
+
+        while True:
+            now = loop.time()
+            slots = 1
+            try:
+                if now >= next_quotes:
+                    next_quotes = now + self.quote_interval
+                    slots = self.quote_requests()
+                    await self.refresh_quotes()
+                else:
+                    ticker = min(next_ratios, key=next_ratios.get)
+                    if next_ratios[ticker] <= now:
+                        next_ratios[ticker] = now + self.ratios_interval
+                        await self.refresh_ratios(ticker)
+                    else:
+                        slots = 0
+            except Exception as e:
+                logging.warning(f"Watchlist refresh failed: {e}")
+
+            if slots:
+                await asyncio.sleep(self.spacing * slots)
+            else:
+                # Nothing due: sleep until the next refresh (quotes or the earliest ratios)
+                await asyncio.sleep(max(self.spacing, min(next_quotes, *next_ratios.values()) - loop.time()))
+
+
+def start_watchlist_warmer(tickers=None):
+    """
+    Starts the refresh task on the running event loop for tickers (defaults to FMP_WATCHLIST).
+    Returns the task, or None when there is nothing to watch, the response cache is off or the
+    plan's daily quota can't sustain the watchlist.
+    """
+    tickers = WATCHLIST if tickers is None else tickers
+    if not tickers:
+        return None
+    if not CACHE_ENABLED:
+        logging.info("Watchlist refresh disabled: the response cache is off (FMP_CACHE)")
+        return None
+
+    try:
+        warmer = WatchlistWarmer(tickers)
+    except ValueError as e:
+        logging.warning(f"Watchlist refresh disabled: {e} (FMP_PLAN, FMP_WATCHLIST_DAILY_SHARE)")
+        return None
+    logging.info(
+        f"🔥 Keeping {len(warmer.tickers)} watched tickers warm "
+        f"(quotes every {warmer.quote_interval:.0f}s, ratios every {warmer.ratios_interval:.0f}s, "
+        f"~{warmer.daily_requests():.0f} requests a day)"
+    )
+    return asyncio.get_running_loop().create_task(warmer.run())